@@ -0,0 +1,50 @@
+import sys
+import time
+import numpy as np
+from utils.config import *
+from utils.image_utils import list_photo_paths
+from utils.photo_to_vector import ImageEmbeddingModel, embedding_recall
+
+SAMPLE_SIZE = 200
+
+
+def encode_sample(model, photo_paths, prompts):
+    time_check1 = time.perf_counter()
+    images = np.stack([model.encode(image_path=path) for path in photo_paths])
+    time_check2 = time.perf_counter()
+    queries = np.stack([model.encode_text(prompt) for prompt in prompts])
+    time_check3 = time.perf_counter()
+    return images, queries, time_check2 - time_check1, time_check3 - time_check2
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: python -m expt.backend_recall <image_dir> <prompt_file> '
+              '<backend> <optional_k> <optional_num_threads>')
+        sys.exit(1)
+    image_dir, prompt_file_path, backend = sys.argv[1], sys.argv[2], sys.argv[3]
+    k = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    num_threads = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    # Fixed sample: first SAMPLE_SIZE photos in name order
+    photo_paths = sorted(list_photo_paths(image_dir))[:SAMPLE_SIZE]
+    with open(prompt_file_path, 'r') as file:
+        prompts = [line.strip() for line in file if line.strip()]
+
+    ref_model = ImageEmbeddingModel(device='cpu', num_threads=num_threads)
+    ref = encode_sample(ref_model, photo_paths, prompts)
+    model = ImageEmbeddingModel(device='cpu', backend=backend, num_threads=num_threads)
+    cand = encode_sample(model, photo_paths, prompts)
+    recall = embedding_recall(ref[0], ref[1], cand[0], cand[1], k)
+
+    print(f'{"=" * 60}')
+    print(f'Backend: {backend} (photos = {len(photo_paths)}, prompts = {len(prompts)})')
+    print(f'Image encoding: eager {ref[2]: .4f} s, {backend} {cand[2]: .4f} s, '
+          f'speedup {ref[2] / cand[2]: .2f}x')
+    print(f'Text encoding:  eager {ref[3]: .4f} s, {backend} {cand[3]: .4f} s, '
+          f'speedup {ref[3] / cand[3]: .2f}x')
+    print(f'Recall@{k} against eager fp32: {recall: .4f}')
+    print(f'{"=" * 60}')
+    if recall < MIN_BACKEND_RECALL:
+        print(f'Recall below MIN_BACKEND_RECALL = {MIN_BACKEND_RECALL}')
+        sys.exit(1)
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from io import BytesIO
+from datetime import datetime, timedelta
+from PIL import Image, ImageDraw
+from leader.storage.store import fetch_photos_by_metadata, query_photo_num, reset_database
+from utils.config import *
+from utils.image_utils import hash_image_bytes
+from utils.prompt_metadata import extract_prompt_meta
+
+LEADER_PORT = 8100
+# Re-created on every run; the leader and followers never touch DB_NAME
+BENCHMARK_DB_NAME = 'meta_fusion_bench'
+FOLLOWER_BASE_PORT = 9101
+REGISTER_TIMEOUT = 120
+INGEST_TIMEOUT = 600
+SEARCH_MODES = ['meta_fusion', 'vector_only', 'metadata_only']
+NUM_SEARCH_RUNS = 3
+
+# Synthetic corpus distribution: photos are uniform over [START_YEAR, END_YEAR]
+# and normally spread by GEO_SIGMA_KM around the GEO_CENTERS, so that prompts
+# naming a city and a year select a known fraction of the corpus.
+START_YEAR = 2010
+END_YEAR = 2024
+GEO_CENTERS = {
+    'Paris': (48.8566, 2.3522),
+    'New York': (40.7128, -74.0060),
+    'Tokyo': (35.6762, 139.6503),
+    'Sydney': (-33.8688, 151.2093),
+}
+GEO_SIGMA_KM = 15.0
+COLORS = {
+    'red': (220, 30, 30), 'green': (30, 170, 60), 'blue': (30, 60, 220),
+    'yellow': (240, 220, 40), 'purple': (130, 40, 170), 'orange': (250, 140, 20),
+    'white': (245, 245, 245), 'black': (15, 15, 15),
+}
+SHAPES = ['circle', 'square', 'triangle']
+IMAGE_SIZE = 320
+
+
+def synthetic_image(rng, color, shape):
+    """
+    Return JPEG bytes of a colored shape on a noisy gray background.
+    """
+    background = rng.integers(90, 170, (IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    image = Image.fromarray(background)
+    draw = ImageDraw.Draw(image)
+    size = int(rng.integers(IMAGE_SIZE // 3, IMAGE_SIZE * 3 // 4))
+    x, y = rng.integers(0, IMAGE_SIZE - size, 2)
+    box = [int(x), int(y), int(x) + size, int(y) + size]
+    match shape:
+        case 'circle':
+            draw.ellipse(box, fill=COLORS[color])
+        case 'square':
+            draw.rectangle(box, fill=COLORS[color])
+        case 'triangle':
+            draw.polygon([(box[0], box[3]), (box[2], box[3]),
+                          ((box[0] + box[2]) // 2, box[1])], fill=COLORS[color])
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_corpus(num_photos, seed=0, start_year=START_YEAR, end_year=END_YEAR,
+                     geo_centers=GEO_CENTERS, geo_sigma_km=GEO_SIGMA_KM):
+    """
+    Return num_photos records in the msgpack import format
+    {'id', 'image', 'latitude', 'longitude', 'timestamp'}.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(start_year, 1, 1)
+    span = (datetime(end_year, 12, 31) - start).total_seconds()
+    cities = list(geo_centers)
+    records = []
+    for i in range(num_photos):
+        color = list(COLORS)[rng.integers(len(COLORS))]
+        shape = SHAPES[rng.integers(len(SHAPES))]
+        city = cities[rng.integers(len(cities))]
+        lat, lon = geo_centers[city]
+        records.append({
+            'id': f'synthetic/{i:06d}_{color}_{shape}.jpg',
+            'image': synthetic_image(rng, color, shape),
+            'latitude': float(lat + rng.normal(0, geo_sigma_km / 111.0)),
+            'longitude': float(lon + rng.normal(0, geo_sigma_km / 111.0)),
+            'timestamp': start + timedelta(seconds=float(rng.uniform(0, span)))
+        })
+    return records
+
+
+def synthetic_prompts(num_prompts, seed=0, start_year=START_YEAR, end_year=END_YEAR,
+                      geo_centers=GEO_CENTERS):
+    """
+    Return prompts mixing content only, content + place and content + place +
+    year, in equal parts.
+    """
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(num_prompts):
+        prompt = f'a {rng.choice(list(COLORS))} {rng.choice(SHAPES)}'
+        if i % 3 >= 1:
+            prompt += f' in {rng.choice(list(geo_centers))}'
+        if i % 3 == 2:
+            prompt += f' in {rng.randint(start_year, end_year)}'
+        prompts.append(prompt)
+    return prompts
+
+
+def start_followers(num_followers, base_dir, leader_port=LEADER_PORT,
+                    base_port=FOLLOWER_BASE_PORT, db_name=BENCHMARK_DB_NAME):
+    processes = []
+    for i in range(num_followers):
+        processes.append(subprocess.Popen(
+            [sys.executable, 'main.py', 'follower', '--host', 'localhost',
+             '--port', str(base_port + i), '--leader_port', str(leader_port),
+             '--base_dir', base_dir, '--db_name', db_name],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+    return processes
+
+
+def wait_until(condition, timeout, interval=0.1):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(interval)
+
+
+def percentiles(latencies):
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def exact_top_k(leader, embeddings, photo_ids, prompt, search_mode, k):
+    """
+    Exact top-k photo_ids of a prompt by brute-force L2 over the whole corpus,
+    restricted to the photos passing the prompt metadata filter unless
+    search_mode is 'vector_only'.
+    """
+    if search_mode != 'vector_only':
+        metadata = extract_prompt_meta(prompt)
+        allowed = {p['photo_id'] for p in fetch_photos_by_metadata(
+            leader.conn, metadata, list(range(len(leader.followers))), limit=None)}
+        mask = np.array([photo_id in allowed for photo_id in photo_ids])
+    else:
+        mask = np.ones(len(photo_ids), dtype=bool)
+    query_vec = leader.model.encode_text(prompt)
+    dist = ((embeddings - query_vec) ** 2).sum(1)
+    dist[~mask] = np.inf
+    order = np.argsort(dist)[:min(k, int(mask.sum()))]
+    return [photo_ids[i] for i in order]
+
+
+def run_benchmark(num_photos, num_followers, num_prompts=30, seed=0, k=VECTOR_SEARCH_TOP_K):
+    from leader.leader import Leader
+
+    records = synthetic_corpus(num_photos, seed)
+    prompts = synthetic_prompts(num_prompts, seed)
+    base_dir = tempfile.mkdtemp(prefix='metafusion-bench-')
+    reset_database(BENCHMARK_DB_NAME)
+    leader = Leader('localhost', LEADER_PORT, base_dir, 'ViT-B/32', 'cpu', True,
+                    db_name=BENCHMARK_DB_NAME)
+    processes = start_followers(num_followers, base_dir)
+    try:
+        wait_until(lambda: sum(f['status'] == 'alive' for f in leader.followers)
+                   == num_followers, REGISTER_TIMEOUT)
+
+        # Ingest: from the first upload until every photo is in photos_meta
+        time_check = time.perf_counter()
+        for record in records:
+            leader.upload_from_json(record)
+        wait_until(lambda: query_photo_num(leader.conn)[0] >= num_photos,
+                   INGEST_TIMEOUT)
+        ingest_time = time.perf_counter() - time_check
+
+        photo_ids = [hash_image_bytes(r['image']) for r in records]
+        embeddings = np.stack([leader.model.encode(image_bytes=r['image'])
+                               for r in records])
+        search = {}
+        for search_mode in SEARCH_MODES:
+            latencies, recalls = [], []
+            for prompt in prompts:
+                for _ in range(NUM_SEARCH_RUNS):
+                    time_check = time.perf_counter()
+                    result = leader.search(prompt, search_mode=search_mode,
+                                           use_cache=False).result(timeout=SEARCH_TIMEOUT)
+                    latencies.append(time.perf_counter() - time_check)
+                if search_mode == 'metadata_only':
+                    continue
+                exact = exact_top_k(leader, embeddings, photo_ids, prompt, search_mode, k)
+                if exact:
+                    found = {hit.photo_id for hit in result.hits[:k]}
+                    recalls.append(len(found & set(exact)) / len(exact))
+            search[search_mode] = percentiles(latencies) | {
+                f'recall@{k}': float(np.mean(recalls)) if recalls else None
+            }
+        return {
+            'date': datetime.now().isoformat(),
+            'config': {
+                'num_photos': num_photos,
+                'num_followers': num_followers,
+                'num_prompts': num_prompts,
+                'num_search_runs': NUM_SEARCH_RUNS,
+                'seed': seed,
+                'k': k,
+                'vector_search_top_k': VECTOR_SEARCH_TOP_K,
+                'vector_score_filter_portion': VECTOR_SCORE_FILTER_PORTION,
+            },
+            'ingest': {
+                'seconds': ingest_time,
+                'photos_per_s': num_photos / ingest_time
+            },
+            'search': search
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: python -m expt.benchmark <num_photos> <num_followers> <output_json> '
+              '<optional_num_prompts> <optional_seed>')
+        sys.exit(1)
+    num_photos, num_followers = int(sys.argv[1]), int(sys.argv[2])
+    output_path = sys.argv[3]
+    num_prompts = int(sys.argv[4]) if len(sys.argv) > 4 else 30
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+
+    report = run_benchmark(num_photos, num_followers, num_prompts, seed)
+    with open(output_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+    # Leader threads keep running until told to shut down
+    os._exit(0)
@@ -1,22 +1,56 @@
+import os
 import sys
 
-ES_URL = "https://localhost:9200/photos"
-
-try:
-    with open("expt/es_auth.txt", "r") as file:
-        lines = file.readlines()
-        for i, line in enumerate(lines):
-            if i == 0:
-                ES_USERNAME = line.strip()
-            if i == 1:
-                ES_PASSWORD = line.strip()
-except FileNotFoundError:
-    print("Error: file 'es_auth.txt' was not found under directory 'expt'.")
-    print("Create the file with username in 1st line and password in 2nd line.")
-    sys.exit(1)
-except Exception as e:
-    print(e)
-
-CERT_PATH = "./elasticsearch-9.2.1/config/certs/http_ca.crt"
+# Override with the ES_URL environment variable, e.g. to point the experiments
+# at the local stand-in (python -m expt.es_stub): ES_URL=http://localhost:9200/photos
+ES_URL = os.environ.get("ES_URL", "https://localhost:9200/photos")
+
+ES_USERNAME = os.environ.get("ES_USERNAME")
+ES_PASSWORD = os.environ.get("ES_PASSWORD")
+
+if ES_USERNAME is None:
+    try:
+        with open("expt/es_auth.txt", "r") as file:
+            lines = file.readlines()
+            for i, line in enumerate(lines):
+                if i == 0:
+                    ES_USERNAME = line.strip()
+                if i == 1:
+                    ES_PASSWORD = line.strip()
+    except FileNotFoundError:
+        if ES_URL.startswith("https://"):
+            print("Error: file 'es_auth.txt' was not found under directory 'expt'.")
+            print("Create the file with username in 1st line and password in 2nd line.")
+            sys.exit(1)
+    except Exception as e:
+        print(e)
+
+ES_AUTH = (ES_USERNAME, ES_PASSWORD) if ES_USERNAME is not None else None
+
+CERT_PATH = os.environ.get("ES_CERT_PATH", "./elasticsearch-9.2.1/config/certs/http_ca.crt")
 
 VECTOR_SEARCH_TOP_K = 60
+
+# Bulk import: documents per _bulk request, images per CLIP forward pass and
+# images read ahead of the encoder
+ES_BULK_SIZE = 500
+ES_ENCODE_BATCH = 32
+ES_PREFETCH = 256
+ES_POOL_SIZE = 8
+
+
+def es_session():
+    """
+    Return a requests.Session reusing pooled keep-alive connections (and so
+    TLS handshakes) to ES_URL, with auth and certificate set.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=ES_POOL_SIZE, pool_maxsize=ES_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = ES_AUTH
+    if ES_URL.startswith("https://"):
+        session.verify = CERT_PATH
+    return session
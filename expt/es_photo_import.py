@@ -1,60 +1,47 @@
+import json
+import queue
 import random
-import numpy as np
-import requests
+import threading
+import time
 import msgpack
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from expt.es_config import *
 from utils.image_utils import *
 from utils.photo_to_vector import ImageEmbeddingModel
+from utils.preprocess_pool import ImagePreprocessPool
 
+# Marks the end of the record stream in the read-ahead queue
+_END = None
 
-def import_from_dir(image_dir):
-    model = ImageEmbeddingModel()
-    photo_paths = list_photo_paths(image_dir)
-    for photo_path in photo_paths:
+
+def iter_dir_records(image_dir):
+    """
+    Yield (document without embedding, image bytes) of the photos of a
+    directory. EXIF fields are filled in from the decoded image later.
+    """
+    for photo_path in list_photo_paths(image_dir):
         try:
             image_bytes = read_image_bytes(photo_path)
         except Exception as e:
             print(f'Failed to read image from {photo_path}: {e}')
-            return
-        image_hash = hash_image_bytes(image_bytes)
-        photo_name = os.path.basename(photo_path)
-        photo_id = image_hash
-        print(f'Inserting {photo_name}')
-        metadata = extract_photo_metadata(photo_path)
-        vector = model.encode(image_path=photo_path)
-        vector = vector.reshape(1, -1).astype("float32")
+            continue
         doc = {
-            'photo_id': photo_id,
+            'photo_id': hash_image_bytes(image_bytes),
             'path': photo_path,
-            'photo_name': photo_name,
-            # 'tags': None,
-            'embedding': vector.squeeze().astype(np.float32).tolist()
+            'photo_name': os.path.basename(photo_path)
         }
-        if metadata['timestamp']:
-            doc['timestamp'] = _exif_to_iso(metadata['timestamp'])
-        if metadata['latitude'] and metadata['longitude']:
-            doc['location'] = {'lat': metadata['latitude'], 'lon': metadata['longitude']}
-        if metadata['camera_make']:
-            doc['cam_make'] = metadata['camera_make']
-        if metadata['camera_model']:
-            doc['cam_model'] = metadata['camera_model']
-        requests.put(
-            f'{ES_URL}/_doc/{photo_id}',
-            auth=(ES_USERNAME, ES_PASSWORD),
-            json=doc,
-            verify=CERT_PATH,
-            timeout=10
-        )
-
-
-def import_from_msgpack(msgpack_path):
-    model = ImageEmbeddingModel()
+        yield doc, image_bytes
+
+
+def iter_msgpack_records(msgpack_path):
+    """
+    Yield (document without embedding, image bytes) of the records of a
+    msgpack dump.
+    """
     with open(msgpack_path, "rb") as f:
         unpacker = msgpack.Unpacker(f, raw=False)
-        for i, record in enumerate(unpacker):
-            if i % 100 == 0:
-                print(f'Inserting {i}/N photos...')
+        for record in unpacker:
             try:
                 image_bytes = record['image']
                 photo_name = record['id'].replace('/', '+')
@@ -62,7 +49,6 @@ def import_from_msgpack(msgpack_path):
                 longitude = record['longitude']
             except KeyError:
                 continue
-            photo_id = hash_image_bytes(image_bytes)
             if 'timestamp' in record:
                 timestamp = record['timestamp']
             else:
@@ -71,22 +57,109 @@ def import_from_msgpack(msgpack_path):
                 delta = end - start
                 rand_sec = random.randint(0, int(delta.total_seconds()))
                 timestamp = start + timedelta(seconds=rand_sec)
-            vector = model.encode(image_bytes=image_bytes)
-            vector = vector.reshape(1, -1).astype("float32")
             doc = {
-                'photo_id': photo_id,
+                'photo_id': hash_image_bytes(image_bytes),
                 'photo_name': photo_name,
                 'location': {'lat': latitude, 'lon': longitude},
-                'timestamp': _exif_to_iso(timestamp.strftime('%Y:%m:%d %H:%M:%S')),
-                'embedding': vector.squeeze().astype(np.float32).tolist()
+                'timestamp': _exif_to_iso(timestamp.strftime('%Y:%m:%d %H:%M:%S'))
             }
-            requests.put(
-                f'{ES_URL}/_doc/{photo_id}',
-                auth=(ES_USERNAME, ES_PASSWORD),
-                json=doc,
-                verify=CERT_PATH,
-                timeout=10
-            )
+            yield doc, image_bytes
+
+
+def bulk_import(records, model, session, bulk_size=ES_BULK_SIZE,
+                encode_batch=ES_ENCODE_BATCH, prefetch=ES_PREFETCH):
+    """
+    Index (document, image bytes) records into ES_URL as a pipeline:
+    - a reader thread pulls records and hands the images to a process pool
+      that decodes and preprocesses them, at most prefetch images ahead;
+    - the main thread encodes encode_batch images per CLIP forward pass;
+    - a sender thread posts NDJSON _bulk requests of bulk_size documents
+      over the pooled session while the next batch is encoded.
+
+    Returns (number of indexed documents, number of failed documents).
+    """
+    pool = ImagePreprocessPool(model.preprocess)
+    pending = queue.Queue(maxsize=prefetch)
+
+    def read():
+        for doc, image_bytes in records:
+            pending.put((doc, pool.submit(image_bytes)))
+        pending.put(_END)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    sender = ThreadPoolExecutor(max_workers=1)
+    bulk_futures, bulk_docs = [], []
+    num_indexed, num_failed = 0, 0
+    done = False
+    while not done:
+        batch = []
+        while len(batch) < encode_batch:
+            item = pending.get()
+            if item is _END:
+                done = True
+                break
+            doc, future = item
+            try:
+                image = future.result()
+            except Exception as e:
+                print(f'Failed to decode {doc["photo_name"]}: {e}')
+                num_failed += 1
+                continue
+            _add_exif_fields(doc, image['metadata'])
+            batch.append((doc, image['tensor']))
+        if batch:
+            embeddings = model.encode_tensors([tensor for _, tensor in batch])
+            for (doc, _), embedding in zip(batch, embeddings):
+                doc['embedding'] = embedding.tolist()
+                bulk_docs.append(doc)
+        if len(bulk_docs) >= bulk_size or done and bulk_docs:
+            bulk_futures.append(sender.submit(send_bulk, session, bulk_docs))
+            bulk_docs = []
+        # Bound the documents waiting to be sent to one batch in flight
+        while len(bulk_futures) > 1 or done and bulk_futures:
+            indexed, failed = bulk_futures.pop(0).result()
+            num_indexed += indexed
+            num_failed += failed
+            print(f'Indexed {num_indexed} photos...')
+    sender.shutdown()
+    pool.shutdown()
+    return num_indexed, num_failed
+
+
+def send_bulk(session, docs):
+    """
+    Index docs with one _bulk request and return (indexed, failed) counts.
+    """
+    lines = []
+    for doc in docs:
+        lines.append(json.dumps({'index': {'_id': doc['photo_id']}}))
+        lines.append(json.dumps(doc))
+    resp = session.post(
+        f'{ES_URL}/_bulk',
+        data=('\n'.join(lines) + '\n').encode('utf-8'),
+        headers={'Content-Type': 'application/x-ndjson'},
+        timeout=60
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if not data.get('errors'):
+        return len(docs), 0
+    errors = [item['index'] for item in data['items'] if 'error' in item['index']]
+    print(f'{len(errors)} documents failed, e.g. {errors[0]["error"]}')
+    return len(docs) - len(errors), len(errors)
+
+
+def _add_exif_fields(doc, metadata):
+    # Msgpack records carry their own time and location
+    if 'timestamp' not in doc and metadata['timestamp']:
+        doc['timestamp'] = _exif_to_iso(metadata['timestamp'])
+    if 'location' not in doc and metadata['latitude'] and metadata['longitude']:
+        doc['location'] = {'lat': metadata['latitude'], 'lon': metadata['longitude']}
+    if metadata['camera_make']:
+        doc['cam_make'] = metadata['camera_make']
+    if metadata['camera_model']:
+        doc['cam_model'] = metadata['camera_model']
 
 
 def _exif_to_iso(ts: str) -> str:
@@ -101,10 +174,14 @@ if __name__ == '__main__':
         sys.exit(1)
     file_path = sys.argv[1]
     if os.path.isdir(file_path):
-        import_from_dir(file_path)
+        records = iter_dir_records(file_path)
     elif os.path.isfile(file_path):
-        import_from_msgpack(file_path)
+        records = iter_msgpack_records(file_path)
     else:
         print(f"The directory/file '{file_path}' does not exists.")
         sys.exit(1)
-
+    time_check = time.perf_counter()
+    num_indexed, num_failed = bulk_import(records, ImageEmbeddingModel(), es_session())
+    elapsed = time.perf_counter() - time_check
+    print(f'Indexed {num_indexed} photos ({num_failed} failed) in {elapsed: .2f} s, '
+          f'{num_indexed / elapsed: .1f} photos/s')
@@ -1,5 +1,4 @@
 import time
-import requests
 from datetime import datetime
 from expt.es_config import *
 from utils.prompt_metadata import extract_prompt_meta
@@ -47,6 +46,18 @@ def build_es_query(metadata, vector=None, k=10, num_candidates=100):
             }
         })
 
+    # --- Geo Distance ---
+    if metadata.get("radius_km") is not None:
+        must_filters.append({
+            "geo_distance": {
+                "distance": f"{metadata['radius_km']}km",
+                "location": {
+                    "lat": metadata["center_lat"],
+                    "lon": metadata["center_lon"]
+                }
+            }
+        })
+
     # --- Assemble final query ---
     body = {
         "size": k
@@ -59,11 +70,9 @@ def build_es_query(metadata, vector=None, k=10, num_candidates=100):
             "num_candidates": num_candidates
         }
         if must_filters:
-            body["query"] = {
-                "bool": {
-                    "filter": must_filters
-                }
-            }
+            # Pre-filtered kNN: the k nearest among the documents passing the
+            # filters, in a single query
+            body["knn"]["filter"] = must_filters
     else:
         # Metadata-only search
         if must_filters:
@@ -78,12 +87,11 @@ def build_es_query(metadata, vector=None, k=10, num_candidates=100):
     return body
 
 
-def run_es_query(query):
-    resp = requests.get(
+def run_es_query(query, session=None):
+    session = session or es_session()
+    resp = session.post(
         f'{ES_URL}/_search',
-        auth=(ES_USERNAME, ES_PASSWORD),
         json=query,
-        verify=CERT_PATH,
         timeout=10
     )
     data = resp.json()
@@ -124,6 +132,7 @@ if __name__ == "__main__":
             num_cand = int(sys.argv[2])
 
     model = ImageEmbeddingModel()
+    session = es_session()
     results = []
     total_time_1, total_time_2, total_time_3 = 0, 0, 0
 
@@ -134,22 +143,13 @@ if __name__ == "__main__":
         vec = model.encode_text(prompt)
         vec = vec.reshape(1, -1).squeeze().astype("float32").tolist()
         time_check3 = time.perf_counter()
-        q1 = build_es_query(filters, None, VECTOR_SEARCH_TOP_K, num_cand)
-        result1 = run_es_query(q1)
+        query = build_es_query(filters, vec, VECTOR_SEARCH_TOP_K, num_cand)
+        results = list(run_es_query(query, session).values())
         time_check4 = time.perf_counter()
-        q2 = build_es_query(filters, vec, max(len(result1), VECTOR_SEARCH_TOP_K),
-                            num_cand)
-        result2 = run_es_query(q2)
-        time_check5 = time.perf_counter()
-
-        results = []
-        for k, v in result2.items():
-            if k in result1:
-                results.append(v)
+
         total_time_1 += time_check2 - time_check1
         total_time_2 += time_check3 - time_check2
-        total_time_3 += time_check5 - time_check4
-        time.sleep(0.5)
+        total_time_3 += time_check4 - time_check3
 
     print(f'{"=" * 60}')
     print('Search Mode: Elastic Search')
@@ -0,0 +1,173 @@
+import sys
+import json
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from utils.geohash import haversine_km
+
+
+class ESStub:
+    """
+    In-memory stand-in for the subset of the Elasticsearch REST API used by
+    the experiments, so that they run offline and in tests:
+    - PUT    /<index>                create an index (mappings are ignored)
+    - DELETE /<index>                drop an index
+    - PUT    /<index>/_doc/<id>      index a document
+    - POST   /<index>/_bulk          NDJSON bulk indexing ('index' actions)
+    - GET    /<index>/_count         number of documents
+    - POST   /<index>/_search        exact kNN (cosine) with an optional filter,
+                                     or a filter/match_all query; filters
+                                     support 'range', 'geo_bounding_box' and
+                                     'geo_distance' (in km)
+    """
+
+    def __init__(self):
+        self.indices = {}
+        self.lock = threading.Lock()
+
+    def handle(self, method, path, body):
+        """
+        Return (HTTP status, response dict) of a request.
+        """
+        parts = [p for p in urlsplit(path).path.split('/') if p]
+        if not parts:
+            return 200, {'name': 'es-stub', 'version': {'number': 'stub'}}
+        index, rest = parts[0], parts[1:]
+        with self.lock:
+            match method, rest:
+                case 'PUT', []:
+                    self.indices.setdefault(index, {})
+                    return 200, {'acknowledged': True, 'index': index}
+                case 'DELETE', []:
+                    self.indices.pop(index, None)
+                    return 200, {'acknowledged': True}
+                case 'PUT' | 'POST', ['_doc', doc_id]:
+                    self.indices.setdefault(index, {})[doc_id] = json.loads(body)
+                    return 201, {'_id': doc_id, 'result': 'created'}
+                case 'POST' | 'PUT', ['_bulk']:
+                    return 200, self._bulk(index, body)
+                case 'GET' | 'POST', ['_count']:
+                    return 200, {'count': len(self.indices.get(index, {}))}
+                case 'GET' | 'POST', ['_search']:
+                    return 200, self._search(index, json.loads(body or b'{}'))
+        return 400, {'error': f'unsupported request {method} {path}'}
+
+    def _bulk(self, index, body):
+        docs = self.indices.setdefault(index, {})
+        lines = [line for line in body.decode('utf-8').split('\n') if line.strip()]
+        items, errors = [], False
+        for action_line, doc_line in zip(lines[::2], lines[1::2]):
+            action = json.loads(action_line)
+            if 'index' not in action:
+                errors = True
+                items.append({'index': {'status': 400, 'error': 'only index is supported'}})
+                continue
+            doc_id = action['index'].get('_id') or str(len(docs))
+            docs[doc_id] = json.loads(doc_line)
+            items.append({'index': {'_id': doc_id, 'status': 201}})
+        return {'errors': errors, 'items': items}
+
+    def _search(self, index, body):
+        docs = self.indices.get(index, {})
+        knn = body.get('knn')
+        if knn is not None:
+            filters = knn.get('filter', [])
+            size = min(body.get('size', 10), knn['k'])
+        else:
+            filters = body.get('query', {}).get('bool', {}).get('filter', [])
+            size = body.get('size', 10)
+        if isinstance(filters, dict):
+            filters = [filters]
+        hits = [(doc_id, doc) for doc_id, doc in docs.items()
+                if all(_passes(doc, f) for f in filters)]
+        if knn is not None:
+            hits = [(doc_id, doc) for doc_id, doc in hits if knn['field'] in doc]
+            query = np.asarray(knn['query_vector'], dtype='float32')
+            query /= np.linalg.norm(query)
+            scored = []
+            for doc_id, doc in hits:
+                vector = np.asarray(doc[knn['field']], dtype='float32')
+                cosine = float(query @ vector / np.linalg.norm(vector))
+                # Elasticsearch maps cosine similarity to a positive score
+                scored.append(((1 + cosine) / 2, doc_id, doc))
+            scored.sort(key=lambda x: -x[0])
+        else:
+            scored = [(1.0, doc_id, doc) for doc_id, doc in hits]
+        return {
+            'hits': {
+                'total': {'value': len(scored), 'relation': 'eq'},
+                'hits': [{'_id': doc_id, '_score': score, '_source': doc}
+                         for score, doc_id, doc in scored[:size]]
+            }
+        }
+
+
+def _passes(doc, query_filter):
+    """
+    Whether a document passes a 'range', 'geo_bounding_box' or 'geo_distance'
+    filter. Like Elasticsearch, documents missing the field do not pass.
+    """
+    if 'range' in query_filter:
+        (field, bounds), = query_filter['range'].items()
+        value = doc.get(field)
+        if value is None:
+            return False
+        # ISO timestamps compare correctly as strings
+        return (bounds.get('gte') is None or value >= bounds['gte']) and \
+            (bounds.get('lte') is None or value <= bounds['lte'])
+    if 'geo_bounding_box' in query_filter:
+        (field, box), = query_filter['geo_bounding_box'].items()
+        location = doc.get(field)
+        if location is None:
+            return False
+        return box['bottom_right']['lat'] <= location['lat'] <= box['top_left']['lat'] and \
+            box['top_left']['lon'] <= location['lon'] <= box['bottom_right']['lon']
+    if 'geo_distance' in query_filter:
+        query_filter = dict(query_filter['geo_distance'])
+        distance = float(query_filter.pop('distance').removesuffix('km'))
+        (field, center), = query_filter.items()
+        location = doc.get(field)
+        if location is None:
+            return False
+        return haversine_km(center['lat'], center['lon'],
+                            location['lat'], location['lon']) <= distance
+    raise ValueError(f'Unsupported filter: {query_filter}')
+
+
+def serve(port=9200, stub=None):
+    """
+    Serve an ESStub over HTTP on localhost:port from a daemon thread and
+    return the server.
+    """
+    stub = stub or ESStub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            status, payload = stub.handle(self.command, self.path, self.rfile.read(length))
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_PUT = do_POST = do_DELETE = _respond
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('localhost', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9200
+    print(f'ES stand-in listening on http://localhost:{port} (Ctrl-C to stop)')
+    serve(port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from expt.benchmark import start_followers, wait_until, percentiles, REGISTER_TIMEOUT
+from utils.config import *
+from utils.prompt_metadata import extract_prompt_meta
+
+# Same for both systems: every prompt is run once untimed, then NUM_ROUNDS
+# times through a pool of CONCURRENCY clients, each request timed from the
+# prompt string to the ranked photo_ids.
+NUM_WARMUP_ROUNDS = 1
+NUM_ROUNDS = 3
+CONCURRENCY = 4
+
+# Cluster of bin/meta_fusion_run, so that followers warm-restart their silos
+LEADER_PORT = 8000
+FOLLOWER_BASE_PORT = 9001
+
+
+class MetaFusionSystem:
+    name = 'metafusion'
+
+    def __init__(self, leader, search_mode='meta_fusion', k=VECTOR_SEARCH_TOP_K):
+        self.leader = leader
+        self.search_mode = search_mode
+        self.k = k
+
+    def search(self, prompt):
+        result = self.leader.search(prompt, search_mode=self.search_mode,
+                                    use_cache=False).result(timeout=SEARCH_TIMEOUT)
+        return [hit.photo_id for hit in result.hits[:self.k]]
+
+
+class ElasticsearchSystem:
+    """
+    Elasticsearch baseline at ES_URL (a real cluster or expt.es_stub): parse
+    the prompt, encode it and run one pre-filtered kNN query.
+    """
+    name = 'elasticsearch'
+
+    def __init__(self, model, k=VECTOR_SEARCH_TOP_K, num_candidates=100):
+        from expt.es_config import es_session
+        self.model = model
+        self.session = es_session()
+        self.k = k
+        self.num_candidates = num_candidates
+
+    def search(self, prompt):
+        from expt.es_photo_search import build_es_query, run_es_query
+        metadata = extract_prompt_meta(prompt)
+        vector = self.model.encode_text(prompt).tolist()
+        query = build_es_query(metadata, vector, self.k, self.num_candidates)
+        return list(run_es_query(query, self.session))
+
+
+def run_system(system, prompts, concurrency=CONCURRENCY, num_rounds=NUM_ROUNDS,
+               num_warmup_rounds=NUM_WARMUP_ROUNDS):
+    """
+    Return the throughput and latency percentiles of system over prompts,
+    and the photo_ids it returned for each prompt.
+    """
+    for _ in range(num_warmup_rounds):
+        for prompt in prompts:
+            system.search(prompt)
+
+    def timed_search(prompt):
+        time_check = time.perf_counter()
+        photo_ids = system.search(prompt)
+        return prompt, time.perf_counter() - time_check, photo_ids
+
+    time_check = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        runs = list(executor.map(timed_search, prompts * num_rounds))
+    wall_time = time.perf_counter() - time_check
+    report = percentiles([latency for _, latency, _ in runs]) | {
+        'mean_ms': float(np.mean([latency for _, latency, _ in runs]) * 1000),
+        'throughput_qps': len(runs) / wall_time,
+    }
+    return report, {prompt: photo_ids for prompt, _, photo_ids in runs}
+
+
+def head_to_head(systems, prompts, concurrency=CONCURRENCY):
+    reports, answers = {}, {}
+    for system in systems:
+        print(f'Running {len(prompts)} prompts x {NUM_ROUNDS} on {system.name} '
+              f'(concurrency {concurrency})...')
+        reports[system.name], answers[system.name] = run_system(system, prompts, concurrency)
+    if len(systems) == 2:
+        # How much the two systems agree on the answers
+        first, second = (answers[system.name] for system in systems)
+        overlaps = [len(set(first[p]) & set(second[p])) / max(len(first[p]), 1)
+                    for p in prompts]
+        reports['overlap'] = float(np.mean(overlaps))
+    return {
+        'date': datetime.now().isoformat(),
+        'config': {
+            'num_prompts': len(prompts),
+            'num_rounds': NUM_ROUNDS,
+            'num_warmup_rounds': NUM_WARMUP_ROUNDS,
+            'concurrency': concurrency,
+            'k': VECTOR_SEARCH_TOP_K,
+        },
+        'results': reports
+    }
+
+
+def print_report(report):
+    systems = [name for name, r in report['results'].items() if isinstance(r, dict)]
+    print(f'{"=" * 60}')
+    print(f'{"":<16}' + ''.join(f'{name:>18}' for name in systems))
+    for metric in ('throughput_qps', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'):
+        print(f'{metric:<16}' + ''.join(f'{report["results"][name][metric]:>18.2f}'
+                                        for name in systems))
+    if 'overlap' in report['results']:
+        print(f'Overlap of top-{report["config"]["k"]} answers: '
+              f'{report["results"]["overlap"]: .3f}')
+    print(f'{"=" * 60}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: python -m expt.head_to_head <prompt_file> <num_followers> <output_json> '
+              '<optional_concurrency> <optional_base_dir>')
+        sys.exit(1)
+    prompt_file_path, num_followers, output_path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else CONCURRENCY
+    base_dir = sys.argv[5] if len(sys.argv) > 5 else 'state/'
+    with open(prompt_file_path, 'r') as file:
+        prompts = [line.strip() for line in file if line.strip()]
+
+    from leader.leader import Leader
+    leader = Leader('localhost', LEADER_PORT, base_dir, 'ViT-B/32', 'cpu', True)
+    processes = start_followers(num_followers, base_dir, LEADER_PORT, FOLLOWER_BASE_PORT,
+                                DB_NAME)
+    try:
+        wait_until(lambda: sum(f['status'] == 'alive' for f in leader.followers)
+                   == num_followers, REGISTER_TIMEOUT)
+        systems = [MetaFusionSystem(leader), ElasticsearchSystem(leader.model)]
+        report = head_to_head(systems, prompts, concurrency)
+    finally:
+        for process in processes:
+            process.terminate()
+    with open(output_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print_report(report)
+    # Leader threads keep running until told to shut down
+    os._exit(0)
@@ -0,0 +1,77 @@
+import os
+import sys
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+NUM_RUNS = 5
+TOP_MODULES = 10
+
+# Cold start cases: the follower/leader cases import what the CLI command
+# needs before it can start the node, without needing a running cluster. The
+# deferred imports are loaded on a node's first upload or search instead, so
+# the 'first ...' cases add them to measure all imports before a node serves
+# (model weights and database connections are not included).
+CASES = {
+    'main.py --help': ['main.py', '--help'],
+    'main.py follower': ['-c', 'import main; from follower.follower import Follower'],
+    'main.py leader': ['-c', 'import main; from leader.leader import Leader'],
+    'follower, first upload': ['-c', 'import main; from follower.follower import Follower; '
+                                     'import torch, torch.multiprocessing, clip'],
+    'leader, first search': ['-c', 'import main; from leader.leader import Leader; '
+                                   'import torch, clip, spacy, dateparser, geopy.geocoders'],
+}
+
+
+def measure(cwd, args):
+    """
+    Return (median wall time in s, [(cumulative us, module), ...], exit code)
+    of running python with args in cwd.
+    """
+    times = []
+    for _ in range(NUM_RUNS):
+        time_check = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=cwd, capture_output=True)
+        times.append(time.perf_counter() - time_check)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=cwd,
+                          capture_output=True, text=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((int(cumulative), name.strip()))
+    modules = sorted(m for m in modules if not m[1].startswith('.'))[::-1]
+    return statistics.median(times), modules[:TOP_MODULES], proc.returncode
+
+
+def report(label, cwd):
+    print(f'{"=" * 60}')
+    print(f'Tree: {label}')
+    for case, args in CASES.items():
+        wall_time, modules, returncode = measure(cwd, args)
+        failed = f' [failed with exit code {returncode}]' if returncode else ''
+        print(f'{case}: {wall_time: .4f} s (median of {NUM_RUNS}){failed}')
+        for cumulative, name in modules:
+            print(f'   {cumulative / 1e6: .4f} s  {name}')
+    print(f'{"=" * 60}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print('Usage: python -m expt.import_time <optional_git_ref_to_compare>')
+        sys.exit(1)
+    if len(sys.argv) == 2:
+        ref = sys.argv[1]
+        worktree = tempfile.mkdtemp(prefix='metafusion-')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, ref],
+                       check=True, capture_output=True)
+        try:
+            report(ref, worktree)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree],
+                           capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+    report('working tree', os.getcwd())
@@ -1,4 +1,7 @@
 import sys
+import json
+import queue
+import shutil
 import base64
 import threading
 import time
@@ -6,37 +9,62 @@ import numpy as np
 import psycopg2.extensions
 from typing import Optional
 from follower.storage.store import *
-from follower.storage.vertex_index import FollowerFaissIndex
+from follower.storage.vertex_index import FollowerFaissIndex, saved_index_paths
 from utils.config import *
 from utils.image_utils import *
-from utils.photo_to_vector import ImageEmbeddingModel
+from utils.photo_to_vector import ImageEmbeddingModel, ZeroShotTagger
+from utils.preprocess_pool import ImagePreprocessPool
 from utils.network import tcp_server
 from utils.network import tcp_client
+from utils.network import tcp_send_stream
 from utils.network import udp_client
+from utils.tracing import StageMetrics, Trace
+from utils.profiler import RuntimeProfiler
 
 
 class Follower:
-    def __init__(self, host, port):
+    def __init__(self, host, port, base_dir='state/', silo_id=None,
+                 index_shards=FOLLOWER_INDEX_SHARDS, search_threads=FOLLOWER_SEARCH_THREADS,
+                 index_type=FOLLOWER_INDEX_TYPE, db_name=DB_NAME):
         self.silo_id = None
         self.host = host
         self.port = port
         self.leader_host = None
         self.leader_port = None
         self.signals = {'shutdown': False}
+        # --base_dir; the silo's files are under its follower<silo_id> directory
+        self.root_dir = base_dir
         self.base_dir = None
         self.photos_dir = None
+        self.previews_dir = None
         self.index_path = None
+        self.state_path = None
+        self.model_config = {}
+        self.index_shards = index_shards
+        self.search_threads = search_threads
+        self.index_type = index_type
+        self.db_name = db_name
 
         self.model: Optional[ImageEmbeddingModel] = None
+        self.preprocess_pool: Optional[ImagePreprocessPool] = None
+        self.tagger: Optional[ZeroShotTagger] = None
         self.faiss_index: Optional[FollowerFaissIndex] = None
+        self.index_lock = threading.Lock()
+        self.rebuild_thread: Optional[threading.Thread] = None
+        self.ingest_queue = queue.Queue()
         self.conn: Optional[psycopg2.extensions.connection] = None
         self.psql_table_name = DB_FOLLOWER_TABLE_NAME
+        self.metrics = StageMetrics('follower')
+        self.profiler = RuntimeProfiler('follower')
 
-        self.heartbeat_thread = threading.Thread(target=self._heartbeat)
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, name='heartbeat')
+        self.ingest_thread = threading.Thread(target=self._ingest, name='ingest')
         self.tcp_listen_thread = threading.Thread(
-            target=tcp_server, args=(host, port, self.signals, self._tcp_listen)
+            target=tcp_server, args=(host, port, self.signals, self._tcp_listen),
+            name='tcp_listen'
         )
 
+        self._restore_state(base_dir, silo_id)
         self.tcp_listen_thread.start()
 
     def register(self, leader_host, leader_port):
@@ -44,20 +72,135 @@ class Follower:
         message = {
             'message_type': 'register',
             'host': self.host,
-            'port': self.port
+            'port': self.port,
+            'silo_id': self.silo_id
         }
         tcp_client(leader_host, leader_port, message)
 
+    def _restore_state(self, base_dir, silo_id=None):
+        """
+        Warm restart: restore silo_id, vector index and vector_map from the
+        follower state persisted under base_dir before contacting the leader.
+        The state of silo_id is used if given, otherwise the state saved by a
+        follower with the same host and port.
+        """
+        if silo_id is not None:
+            state_paths = [os.path.join(base_dir, f'follower{silo_id}', FOLLOWER_STATE_FILE)]
+        elif os.path.isdir(base_dir):
+            state_paths = [os.path.join(base_dir, name, FOLLOWER_STATE_FILE)
+                           for name in sorted(os.listdir(base_dir))]
+        else:
+            state_paths = []
+        for state_path in state_paths:
+            if not os.path.isfile(state_path):
+                continue
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if silo_id is None and (state['host'], state['port']) != (self.host, self.port):
+                continue
+            self.model_config = state['model_config']
+            self._init_silo(base_dir, state['silo_id'], state.get('embedding_dim'))
+            LOGGER.info('Follower %d restored from %s', self.silo_id, state_path)
+            return
+
+    def _save_state(self):
+        state = {
+            'silo_id': self.silo_id,
+            'host': self.host,
+            'port': self.port,
+            'model_config': self.model_config,
+            'embedding_dim': self.faiss_index.embedding_dim if self.faiss_index else None
+        }
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _init_silo(self, base_dir, silo_id, embedding_dim=None):
+        """
+        Set up directories, vector_map table and, if its dimension is known,
+        the persisted vector index (memory-mapped) of the given silo.
+        """
+        self.silo_id = silo_id
+        self.base_dir = os.path.join(base_dir, f'follower{self.silo_id}')
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.photos_dir = os.path.join(self.base_dir, 'photos')
+        os.makedirs(self.photos_dir, exist_ok=True)
+        self.previews_dir = os.path.join(self.base_dir, 'previews')
+        os.makedirs(self.previews_dir, exist_ok=True)
+        self.index_path = os.path.join(self.base_dir, 'faiss.index')
+        self.state_path = os.path.join(self.base_dir, FOLLOWER_STATE_FILE)
+        self.faiss_index = None
+        if embedding_dim and saved_index_paths(self.index_path):
+            self.faiss_index = FollowerFaissIndex(self.index_path, embedding_dim,
+                                                  mmap=True, num_shards=self.index_shards,
+                                                  search_threads=self.search_threads,
+                                                  index_type=self.index_type,
+                                                  model_name=self.model_config.get('model_name'),
+                                                  normalize=self.model_config.get('normalize'))
+        self.psql_table_name = f'{DB_FOLLOWER_TABLE_NAME}{self.silo_id}'
+        self.conn = init_vector_table(database=self.db_name, table=self.psql_table_name)
+
+    def _check_index(self):
+        """
+        Raise ValueError if the restored vector index was embedded with
+        another model than the one the leader asks for.
+        """
+        if self.faiss_index is None:
+            return
+        header = self.faiss_index.store.header
+        for key in ('model_name', 'normalize'):
+            if header[key] is not None and header[key] != self.model_config.get(key):
+                raise ValueError(f'its vectors have {key}={header[key]!r}, '
+                                 f'the leader uses {self.model_config.get(key)!r}')
+        if header['dim'] != self.faiss_index.embedding_dim:
+            raise ValueError(f'its vectors have dim {header["dim"]}, '
+                             f'the index {self.faiss_index.embedding_dim}')
+
+    def _ensure_model(self):
+        """
+        Lazily load the embedding model, the preprocess pool and (on a fresh
+        silo) the vector index. Searches only need the precomputed query
+        vector, so this is deferred until the first upload.
+        """
+        if self.model is not None:
+            return
+        self.model = ImageEmbeddingModel(self.model_config['model_name'],
+                                         self.model_config['device'],
+                                         self.model_config['normalize'],
+                                         self.model_config.get('backend', 'eager'),
+                                         self.model_config.get('num_threads'))
+        self.preprocess_pool = ImagePreprocessPool(self.model.preprocess,
+                                                   draft_size=max(PREVIEW_SIZES))
+        if AUTO_TAG_VOCABULARY:
+            self.tagger = ZeroShotTagger(self.model, AUTO_TAG_VOCABULARY,
+                                         AUTO_TAG_TOP_K, AUTO_TAG_MIN_PROB)
+        if self.faiss_index is None:
+            with self.index_lock:
+                self.faiss_index = FollowerFaissIndex(self.index_path,
+                                                      self.model.embedding_dim,
+                                                      num_shards=self.index_shards,
+                                                      search_threads=self.search_threads,
+                                                      index_type=self.index_type,
+                                                      model_name=self.model.model_name,
+                                                      normalize=self.model.normalize)
+            self._save_state()
+
     def _heartbeat(self):
+        last_dump = time.time()
         while not self.signals['shutdown']:
             message = {
                 'message_type': 'heartbeat',
                 'silo_id': self.silo_id
             }
             udp_client(self.leader_host, self.leader_port, message)
+            if time.time() - last_dump > METRICS_DUMP_INTERVAL:
+                self.metrics.dump(os.path.join(self.base_dir, FOLLOWER_METRICS_FILE))
+                last_dump = time.time()
             time.sleep(FOLLOWER_HEARTBEAT_INTERVAL)
 
     def _tcp_listen(self, message_dict):
+        self.profiler.call(self._handle_message, message_dict)
+
+    def _handle_message(self, message_dict):
         match message_dict['message_type']:
             case 'register_ack':
                 self._handle_register_ack(message_dict)
@@ -68,74 +211,138 @@ class Follower:
             case 'upload':
                 self._handle_upload(message_dict)
             case 'upload_from_json':
-                self._handle_upload_from_json(message_dict)
+                self._handle_upload(message_dict)
+            case 'delete':
+                # Queued so that it applies after the uploads received before it
+                self.ingest_queue.put((message_dict, None, None))
+            case 'replace':
+                self._handle_replace(message_dict)
+            case 'rebuild':
+                self._start_rebuild()
+            case 'fetch_photo':
+                self._handle_fetch_photo(message_dict)
+            case 'profile':
+                self._handle_profile(message_dict)
             case 'clear':
                 self._handle_clear()
             case 'quit':
                 self._handle_quit()
 
+    def _handle_profile(self, message_dict):
+        """
+        Start (or with duration 0, stop) a profile of this follower whose
+        output is written under its base_dir.
+        """
+        if message_dict.get('duration', 0) <= 0:
+            self.profiler.stop()
+            return
+        output_path = self.profiler.start(message_dict['duration'],
+                                          message_dict.get('mode', 'sample'),
+                                          self.base_dir or '.')
+        if output_path is None:
+            LOGGER.warning('Follower %s is already being profiled', self.silo_id)
+
     def _handle_register_ack(self, message_dict):
-        self.silo_id = message_dict['silo_id']
         self.leader_host = message_dict['leader_host']
         self.leader_port = message_dict['leader_port']
-        self.base_dir = os.path.join(message_dict['base_dir'],
-                                     f'follower{self.silo_id}')
-        os.makedirs(self.base_dir, exist_ok=True)
-        self.photos_dir = os.path.join(self.base_dir, 'photos')
-        os.makedirs(self.photos_dir, exist_ok=True)
-        self.index_path = os.path.join(self.base_dir, 'faiss.index')
-
-        self.model = ImageEmbeddingModel(message_dict['model_name'],
-                                         message_dict['device'],
-                                         message_dict['normalize'])
-        self.faiss_index = FollowerFaissIndex(self.index_path,
-                                              self.model.embedding_dim)
-        self.faiss_index.save()
-        self.psql_table_name = f'{DB_FOLLOWER_TABLE_NAME}{self.silo_id}'
-        self.conn = init_vector_table(table=self.psql_table_name)
+        self.model_config = {
+            'model_name': message_dict['model_name'],
+            'device': message_dict['device'],
+            'normalize': message_dict['normalize'],
+            'backend': message_dict.get('backend', 'eager'),
+            'num_threads': message_dict.get('num_threads')
+        }
+        if message_dict['base_dir'] != self.root_dir:
+            LOGGER.warning('Leader base_dir %s differs from this follower\'s %s; using %s',
+                           message_dict['base_dir'], self.root_dir, self.root_dir)
+        try:
+            if self.silo_id != message_dict['silo_id'] or self.conn is None:
+                self._init_silo(self.root_dir, message_dict['silo_id'])
+            self._check_index()
+        except ValueError as e:
+            LOGGER.error('Follower refuses to serve silo %d: %s', message_dict['silo_id'], e)
+            self.signals['shutdown'] = True
+            return
+        self._save_state()
 
         LOGGER.info('Follower %d registered (base_dir=%s, index_path=%s)\n',
                     self.silo_id, self.base_dir, self.index_path)
-        self.heartbeat_thread.start()
+        if not self.heartbeat_thread.is_alive():
+            self.heartbeat_thread.start()
+            self.ingest_thread.start()
 
     def _handle_search(self, message_dict, get_photo=False):
         """
         Handle a text-to-image search request from the leader.
         """
-        if self.model is None or self.faiss_index is None:
+        if self.conn is None:
             # Follower has not been fully initialized yet; ignore the request.
             LOGGER.warning("Received search_text before follower was initialized")
             return
 
         prompt = message_dict.get('text', '')
+        trace = Trace(message_dict.get('request_id'))
+        # With replication this follower also holds replicas of other silos;
+        # only return photos of the primary silos it was asked to serve, up to
+        # top_ks[i] photos of silos[i].
+        silos = message_dict.get('silos', [self.silo_id])
+        top_ks = dict(zip(silos, message_dict.get('top_ks', [message_dict['top_k']] * len(silos))))
         query_vec = np.asarray(message_dict["query_vec"], dtype="float32")
-        distances, indices = self.faiss_index.search(query_vec, message_dict['top_k'])
+        num_fetch, num_scanned, rows = message_dict['top_k'], 0, {}
+        while True:
+            with trace.span('faiss_search'), self.index_lock:
+                if self.faiss_index is None:
+                    # Nothing has been uploaded to this silo yet
+                    distances, indices, num_live = [], [], 0
+                else:
+                    distances, indices = self.faiss_index.search(query_vec, num_fetch)
+                    num_live = self.faiss_index.num_live
+                    # The flat index compares the query with every stored vector
+                    num_scanned += self.faiss_index.ntotal
+            # FAISS uses -1 as a sentinel for "no result" in some cases.
+            new_ids = [int(idx) for idx in indices if idx != -1 and idx not in rows]
+            if new_ids:
+                with trace.span('db_resolve'):
+                    rows.update(dict.fromkeys(new_ids))
+                    rows.update(query_by_vector_ids(self.conn, new_ids,
+                                                    table=self.psql_table_name))
+            hits = {silo: [] for silo in top_ks}
+            for idx, dist in zip(indices, distances):
+                row = rows.get(idx)
+                if not row:
+                    continue
+                primary_silo = self.silo_id if row[5] is None else row[5]
+                if primary_silo in hits and len(hits[primary_silo]) < top_ks[primary_silo]:
+                    hits[primary_silo].append((idx, dist, row))
+            if num_fetch >= num_live or all(len(hits[s]) >= k for s, k in top_ks.items()):
+                break
+            # Photos of the other silos replicated here crowded some silo out
+            num_fetch = min(num_fetch * 2, num_live)
 
         results = []
-        for idx, dist in zip(indices, distances):
-            if idx == -1:
-                # FAISS uses -1 as a sentinel for "no result" in some cases.
-                continue
-            query_result = query_by_vector_id(self.conn, idx, table=self.psql_table_name)
-            if query_result:
-                _, photo_id, photo_name, photo_format, saved_path = query_result
-            else:
-                continue
+        for idx, dist, row in sorted((hit for silo_hits in hits.values() for hit in silo_hits),
+                                     key=lambda hit: hit[1]):
+            _, photo_id, photo_name, photo_format, saved_path, primary_silo = row
             item = {
                 "vector_id": int(idx),
                 "score": float(dist),
                 "photo_id": photo_id,
                 "photo_name": photo_name,
-                "photo_format": photo_format
+                "photo_format": photo_format,
+                "primary_silo": self.silo_id if primary_silo is None else primary_silo
             }
-            # Optionally include the raw image bytes as base64 so that the
-            # leader can reconstruct or save the original photo.
-            if get_photo:
+            # Optionally include a downscaled preview as base64. Originals are
+            # not inlined; the leader fetches them in chunks after ranking.
+            if get_photo and message_dict.get('quality', 'preview') == 'preview':
                 try:
-                    image_bytes = read_image_bytes(saved_path)
-                    item["image_b64"] = base64.b64encode(image_bytes).decode("ascii")
+                    preview_size = message_dict.get('preview_size', PREVIEW_SIZES[0])
+                    with trace.span('preview'):
+                        image_bytes = read_image_bytes(
+                            self._get_preview(photo_id, saved_path, preview_size))
+                        item["image_b64"] = base64.b64encode(image_bytes).decode("ascii")
+                    item["preview_format"] = PREVIEW_FORMAT.lower()
                 except Exception as e:
-                    LOGGER.warning("Failed to read image for vector_id=%d at %s: %s",
+                    LOGGER.warning("Failed to read preview for vector_id=%d at %s: %s",
                                    idx, saved_path, e,)
             results.append(item)
 
@@ -144,23 +351,75 @@ class Follower:
             "silo_id": self.silo_id,
             "request_id": message_dict.get("request_id"),
             "output_path": message_dict.get("output_path"),
+            "quality": message_dict.get("quality"),
             "results": results,
+            "num_scanned": num_scanned,
+            "trace": dict(trace.spans),
         }
-        tcp_client(self.leader_host, self.leader_port, message)
+        # Serialization and sending happen after the spans are attached, so
+        # they are only recorded in this follower's own metrics
+        with trace.span('serialize'):
+            tcp_client(self.leader_host, self.leader_port, message)
+        self.metrics.record(trace)
         LOGGER.info(f'Sent search result for prompt {prompt} to the leader')
 
     def _handle_upload(self, message_dict):
+        """
+        Queue an uploaded image for decoding and preprocessing in the
+        preprocess pool; the ingest thread finishes it in arrival order.
+        """
+        if 'metadata' in message_dict:
+            photo_id = message_dict['metadata']['photo_id']
+        else:
+            photo_id = message_dict['photo_id']
+        self._ensure_model()
+        image_bytes = base64.b64decode(message_dict['image_b64'])
+        future = self.preprocess_pool.submit(image_bytes, self.previews_dir, photo_id)
+        self.ingest_queue.put((message_dict, image_bytes, future))
+
+    def _ingest(self):
+        """
+        Run model inference and indexing on preprocessed uploads in order.
+        """
+        while not self.signals['shutdown']:
+            try:
+                message_dict, image_bytes, future = self.ingest_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if message_dict['message_type'] == 'delete':
+                self._finish_delete(message_dict)
+                continue
+            try:
+                image = future.result()
+                match message_dict['message_type']:
+                    case 'upload':
+                        self._finish_upload(message_dict, image_bytes, image)
+                    case 'upload_from_json':
+                        self._finish_upload_from_json(message_dict, image_bytes, image)
+                    case 'replace':
+                        self._finish_replace(message_dict, image_bytes, image)
+            except Exception as e:
+                LOGGER.warning('Failed to store uploaded image: %s', e)
+                if message_dict['message_type'] in ('upload', 'upload_from_json'):
+                    # Lets the leader move on instead of waiting for the reply
+                    tcp_client(self.leader_host, self.leader_port, {
+                        'message_type': 'upload_reply',
+                        'silo_id': self.silo_id,
+                        'request_id': message_dict.get('request_id'),
+                        'error': str(e)
+                    })
+
+    def _finish_upload(self, message_dict, image_bytes, image):
         photo_id = message_dict['photo_id']
         photo_name = message_dict['photo_name']
-        photo_format = message_dict['photo_format']
-        image_b64 = message_dict['image_b64']
-        image_bytes = base64.b64decode(image_b64)
+        photo_format = image['format']
         saved_image_path = os.path.join(self.photos_dir, f'{photo_id}.{photo_format.lower()}')
         save_image_bytes(image_bytes, saved_image_path)
         LOGGER.info(f'Saved uploaded image {photo_name} to {saved_image_path}')
-        vector = self.model.encode(saved_image_path)
-        vector_id = self.faiss_index.add(vector)
-        self.faiss_index.save()
+        vector = self.model.encode_tensor(image['tensor'])
+        with self.index_lock:
+            vector_id = self.faiss_index.add(vector)
+            self.faiss_index.save()
 
         insert_data = {
             'vector_id': vector_id,
@@ -168,39 +427,40 @@ class Follower:
             'photo_name': photo_name,
             'photo_format': photo_format,
             'saved_path': saved_image_path,
+            'primary_silo': message_dict.get('primary_silo', self.silo_id),
         }
         insert_new_photo_vector(self.conn, insert_data, table=self.psql_table_name)
         LOGGER.info('Added uploaded image %s to local vector index as vector_id=%d',
                     photo_name, vector_id, )
 
-        metadata = extract_photo_metadata(saved_image_path)
-        metadata = metadata | insert_data
+        metadata = image['metadata'] | insert_data | {'tags': self._auto_tags(vector)}
         message = {
             'message_type': 'upload_reply',
             'silo_id': self.silo_id,
+            'request_id': message_dict.get('request_id'),
             'metadata': metadata
         }
         tcp_client(self.leader_host, self.leader_port, message)
 
-    def _handle_upload_from_json(self, message_dict):
+    def _finish_upload_from_json(self, message_dict, image_bytes, image):
         metadata = message_dict['metadata']
         photo_id = metadata['photo_id']
         photo_name = metadata['photo_name']
-        image_b64 = message_dict['image_b64']
-        image_bytes = base64.b64decode(image_b64)
         saved_image_path = os.path.join(self.photos_dir, f'{photo_name}')
         save_image_bytes(image_bytes, saved_image_path)
         LOGGER.info(f'Saved uploaded image {photo_name} to {saved_image_path}')
-        vector = self.model.encode(saved_image_path)
-        vector_id = self.faiss_index.add(vector)
-        self.faiss_index.save()
+        vector = self.model.encode_tensor(image['tensor'])
+        with self.index_lock:
+            vector_id = self.faiss_index.add(vector)
+            self.faiss_index.save()
 
         insert_data = {
             'vector_id': vector_id,
             'photo_id': photo_id,
             'photo_name': photo_name,
-            'photo_format': 'jpg',
+            'photo_format': image['format'],
             'saved_path': saved_image_path,
+            'primary_silo': message_dict.get('primary_silo', self.silo_id),
         }
         insert_new_photo_vector(self.conn, insert_data, table=self.psql_table_name)
         LOGGER.info('Added uploaded image %s to local vector index as vector_id=%d',
@@ -208,12 +468,185 @@ class Follower:
         message = {
             'message_type': 'upload_reply',
             'silo_id': self.silo_id,
+            'request_id': message_dict.get('request_id'),
+            'metadata': metadata | {
+                'primary_silo': insert_data['primary_silo'],
+                'tags': sorted(set(metadata.get('tags') or []) | set(self._auto_tags(vector)))
+            }
+        }
+        tcp_client(self.leader_host, self.leader_port, message)
+
+    def _handle_replace(self, message_dict):
+        """
+        Queue a stored photo for re-embedding, from its new image bytes if the
+        message carries them and from its saved file otherwise.
+        """
+        photo_id = message_dict['photo_id']
+        row = query_by_photo_id(self.conn, photo_id, table=self.psql_table_name)
+        if row is None:
+            LOGGER.warning(f'Cannot replace photo {photo_id}: it is not stored')
+            return
+        self._ensure_model()
+        if 'image_b64' in message_dict:
+            image_bytes = base64.b64decode(message_dict['image_b64'])
+        else:
+            try:
+                image_bytes = read_image_bytes(row[4])
+            except Exception as e:
+                LOGGER.warning(f'Cannot replace photo {photo_id}: {e}')
+                return
+        # Previews of the old image, including sizes generated on demand
+        self._remove_previews(photo_id)
+        future = self.preprocess_pool.submit(image_bytes, self.previews_dir, photo_id)
+        self.ingest_queue.put((message_dict, image_bytes, future))
+
+    def _finish_replace(self, message_dict, image_bytes, image):
+        photo_id = message_dict['photo_id']
+        row = query_by_photo_id(self.conn, photo_id, table=self.psql_table_name)
+        if row is None:
+            # Deleted while it was being preprocessed
+            return
+        old_vector_id, _, photo_name, photo_format, saved_path, primary_silo = row
+        new_image = 'image_b64' in message_dict
+        if new_image:
+            photo_name = message_dict.get('photo_name', photo_name)
+            photo_format = image['format']
+            old_path = saved_path
+            saved_path = os.path.join(self.photos_dir, f'{photo_id}.{photo_format.lower()}')
+            save_image_bytes(image_bytes, saved_path)
+            if old_path != saved_path and os.path.isfile(old_path):
+                os.remove(old_path)
+        vector = self.model.encode_tensor(image['tensor'])
+        with self.index_lock:
+            self.faiss_index.remove(old_vector_id)
+            vector_id = self.faiss_index.add(vector)
+            self.faiss_index.save()
+            for duplicate_id, _ in delete_photo_vector(self.conn, photo_id,
+                                                       table=self.psql_table_name):
+                # Vectors of copies of the photo ingested concurrently
+                if duplicate_id != old_vector_id:
+                    self.faiss_index.remove(duplicate_id)
+            self.faiss_index.save_tombstones()
+            insert_data = {
+                'vector_id': vector_id,
+                'photo_id': photo_id,
+                'photo_name': photo_name,
+                'photo_format': photo_format,
+                'saved_path': saved_path,
+                'primary_silo': primary_silo,
+            }
+            insert_new_photo_vector(self.conn, insert_data, table=self.psql_table_name)
+        LOGGER.info('Replaced photo %s: vector_id %d -> %d', photo_id, old_vector_id, vector_id)
+
+        # A re-embedded photo keeps its metadata (which may not come from its
+        # EXIF), only a new image brings new metadata
+        metadata = {'photo_id': photo_id, 'tags': self._auto_tags(vector)}
+        if new_image:
+            metadata |= image['metadata'] | {'photo_name': photo_name}
+        message = {
+            'message_type': 'replace_reply',
+            'silo_id': self.silo_id,
             'metadata': metadata
         }
         tcp_client(self.leader_host, self.leader_port, message)
+        self._maybe_compact()
+
+    def _finish_delete(self, message_dict):
+        photo_id = message_dict['photo_id']
+        with self.index_lock:
+            rows = delete_photo_vector(self.conn, photo_id, table=self.psql_table_name)
+            if not rows:
+                LOGGER.info(f'Photo {photo_id} to delete is not stored')
+                return
+            for vector_id, _ in rows:
+                self.faiss_index.remove(vector_id)
+            self.faiss_index.save_tombstones()
+        for saved_path in {saved_path for _, saved_path in rows}:
+            if saved_path and os.path.isfile(saved_path):
+                os.remove(saved_path)
+        self._remove_previews(photo_id)
+        LOGGER.info('Deleted photo %s (vector_ids=%s)', photo_id, [v for v, _ in rows])
+        self._maybe_compact()
+
+    def _remove_previews(self, photo_id):
+        for size in os.listdir(self.previews_dir):
+            path = preview_path(self.previews_dir, photo_id, size, PREVIEW_FORMAT)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _maybe_compact(self):
+        """
+        Drop tombstoned vectors from the index in the background once there
+        are enough of them.
+        """
+        if self.faiss_index.needs_compaction():
+            self._start_rebuild()
+
+    def _start_rebuild(self):
+        """
+        Rebuild the index on a background thread; searches and uploads keep
+        using the current index until the rebuilt one is swapped in.
+        """
+        if self.faiss_index is None:
+            return
+        if self.rebuild_thread is not None and self.rebuild_thread.is_alive():
+            LOGGER.info('Index rebuild already running')
+            return
+        self.rebuild_thread = threading.Thread(target=self._rebuild, name='rebuild',
+                                               daemon=True)
+        self.rebuild_thread.start()
+
+    def _rebuild(self):
+        time_check = time.perf_counter()
+        num_dropped = self.faiss_index.rebuild(self.index_lock, REBUILD_BOUNDED)
+        LOGGER.info('Rebuilt the vector index in %.2f s, dropping %d deleted vectors',
+                    time.perf_counter() - time_check, num_dropped)
+
+    def _auto_tags(self, vector):
+        if self.tagger is None:
+            return []
+        return self.tagger.tag(vector)
+
+    def _handle_fetch_photo(self, message_dict):
+        """
+        Stream an original photo in PHOTO_CHUNK_SIZE chunks over one
+        connection to the reply_port the leader listens on, off the TCP
+        handler.
+        """
+        query_result = query_by_photo_id(self.conn, message_dict['photo_id'],
+                                         table=self.psql_table_name)
+        if not query_result:
+            LOGGER.warning('Requested photo %s is not stored', message_dict['photo_id'])
+            header, chunks = {'error': 'not stored'}, []
+        else:
+            _, photo_id, photo_name, _, saved_path, _ = query_result
+            header = {'photo_id': photo_id, 'photo_name': photo_name,
+                      'total_size': os.path.getsize(saved_path)}
+            chunks = (chunk for _, chunk in read_image_chunks(saved_path, PHOTO_CHUNK_SIZE))
+        threading.Thread(target=self._send_photo, daemon=True,
+                         args=(message_dict['reply_port'], header, chunks)).start()
+
+    def _send_photo(self, reply_port, header, chunks):
+        try:
+            tcp_send_stream(self.leader_host, reply_port, header, chunks, PHOTO_FETCH_TIMEOUT)
+        except OSError as e:
+            LOGGER.warning('Failed to send original %s: %s', header.get('photo_id'), e)
+
+    def _get_preview(self, photo_id, saved_path, size):
+        """
+        Return the cached preview path, generating previews on a cache miss.
+        """
+        path = preview_path(self.previews_dir, photo_id, size, PREVIEW_FORMAT)
+        if not os.path.exists(path):
+            save_image_previews(saved_path, self.previews_dir, photo_id,
+                                set(PREVIEW_SIZES) | {size},
+                                PREVIEW_FORMAT, PREVIEW_QUALITY)
+        return path
 
     def _handle_clear(self):
-        self.faiss_index.clear()
+        with self.index_lock:
+            if self.faiss_index is not None:
+                self.faiss_index.clear()
         clear_all(self.conn, table=self.psql_table_name)
         for filename in os.listdir(self.photos_dir):
             filepath = os.path.join(self.photos_dir, filename)
@@ -222,10 +655,15 @@ class Follower:
                     os.remove(filepath)
                 except Exception as e:
                     LOGGER.warning(f'Failed to remove {filepath}', e)
+        shutil.rmtree(self.previews_dir, ignore_errors=True)
+        os.makedirs(self.previews_dir, exist_ok=True)
         LOGGER.info("Cleared the vector index and all photos")
 
     def _handle_quit(self):
         self.signals['shutdown'] = True
         self.heartbeat_thread.join()
+        self.ingest_thread.join()
+        if self.preprocess_pool is not None:
+            self.preprocess_pool.shutdown()
         LOGGER.info(f'Follower {self.silo_id} exits with 0')
         sys.exit(0)
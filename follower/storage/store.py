@@ -24,9 +24,11 @@ def init_vector_table(
             photo_id        TEXT NOT NULL,
             photo_name      TEXT,
             photo_format    TEXT,
-            saved_path      TEXT
+            saved_path      TEXT,
+            primary_silo    INTEGER
         );
     """)
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS primary_silo INTEGER;")
     cur.close()
     return conn
 
@@ -41,15 +43,17 @@ def insert_new_photo_vector(conn, data: dict, table=DB_FOLLOWER_TABLE_NAME):
     cur = conn.cursor()
     cur.execute(
         f"""
-        INSERT INTO {table} (vector_id, photo_id, photo_name, photo_format, saved_path)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO {table}
+        (vector_id, photo_id, photo_name, photo_format, saved_path, primary_silo)
+        VALUES (%s, %s, %s, %s, %s, %s)
         """,
         (
             data.get('vector_id'),
             data.get('photo_id'),
             data.get('photo_name'),
             data.get('photo_format'),
-            data.get('saved_path')
+            data.get('saved_path'),
+            data.get('primary_silo')
         )
     )
     cur.close()
@@ -59,10 +63,64 @@ def query_by_vector_id(conn, vector_id, table=DB_FOLLOWER_TABLE_NAME):
     cur = conn.cursor()
     cur.execute(
         f"""
-        SELECT * FROM {table}
+        SELECT vector_id, photo_id, photo_name, photo_format, saved_path, primary_silo
+        FROM {table}
         WHERE vector_id = {vector_id}
         """
     )
     row = cur.fetchone()
     cur.close()
     return row
+
+
+def query_by_vector_ids(conn, vector_ids, table=DB_FOLLOWER_TABLE_NAME):
+    """
+    Return {vector_id: row} of the stored vector_ids in a single query.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT vector_id, photo_id, photo_name, photo_format, saved_path, primary_silo
+        FROM {table}
+        WHERE vector_id = ANY(%s)
+        """,
+        ([int(vector_id) for vector_id in vector_ids],)
+    )
+    rows = {row[0]: row for row in cur.fetchall()}
+    cur.close()
+    return rows
+
+
+def query_by_photo_id(conn, photo_id, table=DB_FOLLOWER_TABLE_NAME):
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT vector_id, photo_id, photo_name, photo_format, saved_path, primary_silo
+        FROM {table}
+        WHERE photo_id = %s
+        """,
+        (photo_id,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+
+def delete_photo_vector(conn, photo_id, table=DB_FOLLOWER_TABLE_NAME):
+    """
+    Delete the mappings of photo_id and return their [(vector_id,
+    saved_path), ...], empty if it is not stored. A photo ingested twice
+    concurrently may have several.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        DELETE FROM {table}
+        WHERE photo_id = %s
+        RETURNING vector_id, saved_path
+        """,
+        (photo_id,)
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return rows
@@ -0,0 +1,130 @@
+# follower/storage/vector_store.py
+
+import os
+import json
+import numpy as np
+
+_MAGIC = b'PVEC'
+# Vectors start on a page boundary after the header
+HEADER_SIZE = 4096
+
+
+class VectorStore:
+    """
+    Embeddings of a follower in an append-only file, row vector_id holding
+    the vector of vector_id, read through a memory map.
+
+    The file is the durable copy of every vector the index was given, so the
+    index itself may be compressed: searches re-rank its candidates against
+    these rows and rebuilds re-create it from them without re-running CLIP.
+
+    A HEADER_SIZE JSON header records the model_name, dim and normalize the
+    vectors were embedded with and their dtype (float32, or float16 to halve
+    the file), so vectors of another model are never mixed in.
+    """
+
+    def __init__(self, path: str, dim: int, dtype: str = "float32",
+                 model_name: str = None, normalize: bool = None):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.dim = dim
+        self.header = {'model_name': model_name, 'dim': dim, 'normalize': normalize,
+                       'dtype': dtype}
+        self._map = None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._set_dtype(dtype)
+            self.write_all(np.zeros((0, dim), dtype="float32"))
+            return
+        with open(path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        if not head.startswith(_MAGIC):
+            # Headerless float32 file of an older follower
+            vectors = np.fromfile(path, dtype="float32").reshape(-1, dim)
+            self._set_dtype(dtype)
+            self.write_all(vectors)
+            return
+        saved = json.loads(head[len(_MAGIC):].rstrip(b'\0'))
+        for key in ('model_name', 'dim', 'normalize'):
+            if None not in (saved[key], self.header[key]) and saved[key] != self.header[key]:
+                raise ValueError(f"Vector store {path} has {key}={saved[key]!r}, "
+                                 f"expected {self.header[key]!r}")
+            if self.header[key] is None:
+                self.header[key] = saved[key]
+        self._set_dtype(saved['dtype'])
+        self.size = (os.path.getsize(path) - HEADER_SIZE) // self.row_bytes
+        if saved['dtype'] != dtype:
+            vectors = self.get(np.arange(self.size))
+            self._set_dtype(dtype)
+            self.write_all(vectors)
+        elif saved != self.header:
+            # Fill in model fields unknown when the store was created
+            self._write_header()
+
+    def _set_dtype(self, dtype):
+        self.header['dtype'] = dtype
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dim * self.dtype.itemsize
+
+    def _header_bytes(self):
+        head = _MAGIC + json.dumps(self.header).encode()
+        return head + b'\0' * (HEADER_SIZE - len(head))
+
+    def _write_header(self):
+        with open(self.path, 'r+b') as f:
+            f.write(self._header_bytes())
+
+    def __len__(self):
+        return self.size
+
+    def append(self, vector_id: int, vector: np.ndarray):
+        """
+        Store the vector of vector_id; vector_ids are assigned in order, so
+        any skipped rows are left as zeros.
+        """
+        rows = np.zeros((vector_id + 1 - self.size, self.dim), dtype=self.dtype)
+        rows[-1] = vector.reshape(-1)
+        with open(self.path, 'ab') as f:
+            f.write(rows.tobytes())
+        self.size = vector_id + 1
+
+    def write_all(self, vectors: np.ndarray):
+        """
+        Replace the whole store with vectors (row i for vector_id i).
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(self._header_bytes())
+            f.write(vectors.tobytes())
+        os.replace(self.path + '.tmp', self.path)
+        self.size = len(vectors)
+        self._map = None
+
+    def view(self) -> np.ndarray:
+        """
+        Read-only (size, dim) memory map of the stored vectors, in their
+        stored dtype.
+        """
+        if self._map is None or len(self._map) < self.size:
+            self._map = np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE,
+                                  shape=(self.size, self.dim)) if self.size else \
+                np.zeros((0, self.dim), dtype=self.dtype)
+        return self._map[:self.size]
+
+    def get(self, vector_ids, view=None) -> np.ndarray:
+        """
+        (len(vector_ids), dim) float32 array of the vectors of vector_ids,
+        read from view (an earlier view() of the store) if given; a run of
+        consecutive vector_ids of a float32 store is a view of the memory
+        map rather than a copy.
+        """
+        vector_ids = np.asarray(vector_ids, dtype="int64")
+        view = self.view() if view is None else view
+        if len(vector_ids) and self.dtype == np.float32 and \
+                vector_ids[-1] - vector_ids[0] + 1 == len(vector_ids) and \
+                np.all(np.diff(vector_ids) == 1):
+            return np.asarray(view[vector_ids[0]:vector_ids[-1] + 1])
+        return view[vector_ids].astype("float32", copy=False)
+
+    def clear(self):
+        self.write_all(np.zeros((0, self.dim), dtype=self.dtype))
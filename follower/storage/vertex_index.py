@@ -1,14 +1,45 @@
 # follower/local_storage/vector_index.py
 
 import os
+import re
 import faiss
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
+from follower.storage.vector_store import VectorStore
+from utils.config import (COMPACT_MIN_TOMBSTONES, COMPACT_TOMBSTONE_RATIO,
+                          FOLLOWER_INDEX_SHARDS, FOLLOWER_SEARCH_THREADS, REBUILD_CHUNK_SIZE,
+                          FOLLOWER_INDEX_TYPE, INDEX_TRAIN_SIZE, PQ_M, RERANK_FACTOR,
+                          VECTOR_STORE_DTYPE)
 
 
 class FollowerFaissIndex:
     """
     Local FAISS index wrapper for a follower node.
+
+    Vectors are stored under explicit vector_ids (IndexIDMap2), so single
+    photos can be deleted. Deletes only tombstone the vector_id: searches
+    over-fetch and skip tombstoned ids, and rebuild() drops them from the
+    index once needs_compaction() says they are worth a pass over it.
+
+    The vectors are split over num_shards sub-indexes by vector_id, each
+    saved to its own file; a single shard is saved to index_path itself.
+    A query searches the shards concurrently on search_threads threads
+    (FAISS releases the GIL) and merges their top-k, so on a multi-core box
+    its latency drops with the number of shards even though FAISS searches
+    a single (1, D) query on one core.
+
+    Every vector is also kept in a memory-mapped VectorStore (float32, or
+    float16 with vector_dtype), the durable copy the shards are rebuilt
+    from, so the shards can hold compressed codes (index_type):
+    - 'flat': float32, 4 bytes per dimension, exact.
+    - 'fp16': float16, 2 bytes per dimension.
+    - 'sq8':  8-bit scalar quantization, 1 byte per dimension.
+    - 'pq':   product quantization, PQ_M bytes per vector.
+    The top RERANK_FACTOR * top_k candidates of a compressed index are
+    re-ranked by their exact distance to the query. 'sq8' and 'pq' shards
+    are trained once they hold INDEX_TRAIN_SIZE vectors; until then their
+    vectors are pending and searched exactly from the store.
     """
 
     def __init__(
@@ -16,38 +47,192 @@ class FollowerFaissIndex:
             index_path: str,
             embedding_dim: int,
             metric: str = "l2",  # or "ip" for inner product / cosine
+            mmap: bool = False,
+            num_shards: int = FOLLOWER_INDEX_SHARDS,
+            search_threads: int = FOLLOWER_SEARCH_THREADS,
+            index_type: str = FOLLOWER_INDEX_TYPE,
+            vector_dtype: str = VECTOR_STORE_DTYPE,
+            model_name: Optional[str] = None,
+            normalize: Optional[bool] = None,
     ):
+        """
+        With mmap=True existing index files are memory-mapped read-only for
+        a fast warm restart; they are fully loaded on the first write.
+
+        model_name and normalize are recorded in the vector store, which
+        refuses to open if they differ from those it was written with.
+        """
+        if metric not in ("l2", "ip"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        if index_type not in ("flat", "fp16", "sq8", "pq"):
+            raise ValueError(f"Unsupported index type: {index_type}")
         self.index_path = index_path
         self.embedding_dim = embedding_dim
         self.metric = metric
-        self.index = self._load_or_create_index()
-        self.next_id = self.index.ntotal  # ID: 0 to N - 1
+        self.index_type = index_type
+        root, ext = os.path.splitext(index_path)
+        self.shard_paths = [index_path] if num_shards == 1 else \
+            [f'{root}.shard{i}{ext}' for i in range(num_shards)]
+        self.mmap = mmap
+        self.tombstones_path = root + '.tombstones.npy'
+        self.pending_path = root + '.pending.npy'
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        self.store = VectorStore(root + '.vectors', embedding_dim, vector_dtype,
+                                 model_name, normalize)
+        pending = np.load(self.pending_path) if os.path.exists(self.pending_path) else \
+            np.zeros(0, dtype="int64")
+        self.shards, self.pending = self._load_or_create_shards(pending)
+        # Shards changed since they were last saved
+        self.dirty = set()
+        self.tombstones = set()
+        if os.path.exists(self.tombstones_path):
+            self.tombstones = set(np.load(self.tombstones_path).tolist())
+        ids = self.ids()
+        self.next_id = int(max(ids.max(initial=-1), max(self.tombstones, default=-1),
+                               len(self.store) - 1)) + 1
+        # Bumped by clear()
+        self.generation = 0
+        search_threads = min(search_threads or num_shards, num_shards)
+        self.search_pool = ThreadPoolExecutor(max_workers=search_threads,
+                                              thread_name_prefix='shard_search') \
+            if search_threads > 1 else None
 
-    def _load_or_create_index(self):
+    def _load_or_create_shards(self, pending_ids):
         """
-        Load FAISS index from disk if exists; otherwise create a new empty one.
+        Load the shards and their pending vector_ids from disk if they exist;
+        otherwise create new empty ones. Indexes saved with another number of
+        shards or index type are rebuilt from the vector store.
         """
-        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
-        if os.path.exists(self.index_path):
-            idx = faiss.read_index(self.index_path)
-            if idx.d != self.embedding_dim:
-                raise ValueError(
-                    f"Index dim {idx.d} != expected {self.embedding_dim}"
-                )
-            return idx
-        if self.metric == "l2":
-            idx = faiss.IndexFlatL2(self.embedding_dim)
-        elif self.metric == "ip":
-            idx = faiss.IndexFlatIP(self.embedding_dim)
-        else:
-            raise ValueError(f"Unsupported metric: {self.metric}")
+        saved_paths = saved_index_paths(self.index_path)
+        if not saved_paths:
+            return [self._new_index() for _ in self.shard_paths], \
+                [[] for _ in self.shard_paths]
+        same_layout = set(saved_paths) == set(self.shard_paths)
+        flag = faiss.IO_FLAG_MMAP if self.mmap and same_layout else 0
+        olds = {path: self._read(path, flag) for path in saved_paths}
+        self._backfill_store(list(olds.values()))
+        if same_layout and all(_index_type_of(old) == self.index_type for old in olds.values()):
+            pending = [[] for _ in self.shard_paths]
+            for vector_id in pending_ids.tolist():
+                pending[vector_id % len(pending)].append(vector_id)
+            return [olds[path] for path in self.shard_paths], pending
+        ids = np.sort(np.concatenate([_id_array(old) for old in olds.values()] +
+                                     [pending_ids.astype("int64")]))
+        shards, pending = [], []
+        for i, path in enumerate(self.shard_paths):
+            shard, shard_pending = self._build_shard(ids[ids % len(self.shard_paths) == i])
+            _write_atomic(shard, path)
+            shards.append(shard)
+            pending.append(shard_pending)
+        for path in set(saved_paths) - set(self.shard_paths):
+            os.remove(path)
+        self.mmap = False
+        return shards, pending
+
+    def _read(self, path, flag=0):
+        idx = faiss.read_index(path, flag)
+        if idx.d != self.embedding_dim:
+            raise ValueError(
+                f"Index dim {idx.d} != expected {self.embedding_dim}"
+            )
+        if not isinstance(idx, faiss.IndexIDMap2):
+            # Indexes written before deletes were supported are plain flat
+            # indexes whose vector_ids are their positions
+            vectors = idx.reconstruct_n(0, idx.ntotal)
+            idx = faiss.IndexIDMap2(faiss.IndexFlat(self.embedding_dim, idx.metric_type))
+            idx.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+            self.mmap = False
         return idx
 
+    def _backfill_store(self, shards):
+        """
+        Fill the vector store from the shards of an index saved before the
+        store existed, which are all flat.
+        """
+        ids = [_id_array(shard) for shard in shards]
+        size = max((int(shard_ids.max()) + 1 for shard_ids in ids if len(shard_ids)), default=0)
+        if len(self.store) >= size:
+            return
+        vectors = np.zeros((size, self.embedding_dim), dtype="float32")
+        vectors[:len(self.store)] = self.store.view()
+        for shard, shard_ids in zip(shards, ids):
+            vectors[shard_ids] = shard.index.reconstruct_n(0, shard.ntotal)
+        self.store.write_all(vectors)
+
+    def _new_index(self):
+        metric = faiss.METRIC_L2 if self.metric == "l2" else faiss.METRIC_INNER_PRODUCT
+        d = self.embedding_dim
+        if self.index_type == "fp16":
+            idx = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, metric)
+        elif self.index_type == "sq8":
+            idx = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, metric)
+        elif self.index_type == "pq":
+            # The number of sub-quantizers must divide the dimension
+            m = max(m for m in range(1, PQ_M + 1) if d % m == 0)
+            idx = faiss.IndexPQ(d, m, 8, metric)
+        else:
+            idx = faiss.IndexFlat(d, metric)
+        return faiss.IndexIDMap2(idx)
+
+    def _build_shard(self, ids: np.ndarray, view=None):
+        """
+        Build a shard holding the stored vectors of ids (read from view, a
+        snapshot of the vector store, if given), training it first if it
+        needs to. Returns the shard and the vector_ids left pending because
+        there are too few of them to train it.
+        """
+        shard = self._new_index()
+        if not shard.is_trained:
+            if len(ids) < INDEX_TRAIN_SIZE:
+                return shard, ids.tolist()
+            sample = ids
+            if len(ids) > 4 * INDEX_TRAIN_SIZE:
+                sample = np.sort(np.random.default_rng(0).choice(
+                    ids, 4 * INDEX_TRAIN_SIZE, replace=False))
+            shard.train(self.store.get(sample, view))
+        for start in range(0, len(ids), REBUILD_CHUNK_SIZE):
+            chunk = ids[start:start + REBUILD_CHUNK_SIZE]
+            shard.add_with_ids(self.store.get(chunk, view), chunk)
+        return shard, []
+
+    def ids(self) -> np.ndarray:
+        """
+        vector_ids stored in the index (tombstoned ones included).
+        """
+        return np.concatenate([_id_array(shard) for shard in self.shards] +
+                              [self._pending_ids()])
+
+    def _pending_ids(self) -> np.ndarray:
+        return np.asarray([i for pending in self.pending for i in pending], dtype="int64")
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards) + \
+            sum(len(pending) for pending in self.pending)
+
+    @property
+    def num_live(self) -> int:
+        return self.ntotal - len(self.tombstones)
+
     def save(self):
         """
-        Persist the current index to disk.
+        Persist the changed shards, the pending vector_ids and the tombstones
+        to disk. The vector store is written as vectors are added.
         """
-        faiss.write_index(self.index, self.index_path)
+        for i in sorted(self.dirty):
+            _write_atomic(self.shards[i], self.shard_paths[i])
+        self.dirty.clear()
+        np.save(self.pending_path, self._pending_ids())
+        self.save_tombstones()
+
+    def save_tombstones(self):
+        np.save(self.tombstones_path, np.fromiter(self.tombstones, dtype="int64"))
+
+    def _load_fully(self):
+        if self.mmap:
+            # A memory-mapped index is read-only; load it fully before writing
+            self.shards = [faiss.read_index(path) for path in self.shard_paths]
+            self.mmap = False
 
     def add(self, vector: np.ndarray):
         """
@@ -56,12 +241,102 @@ class FollowerFaissIndex:
         The caller is responsible for keeping any mapping from vector_id
         to higher-level identifiers such as photo_id.
         """
+        self._load_fully()
         vector = vector.reshape(1, -1).astype("float32")
         vector_id = self.next_id
-        self.index.add(vector)
+        self.store.append(vector_id, vector)
+        shard = vector_id % len(self.shards)
+        if self.shards[shard].is_trained:
+            self.shards[shard].add_with_ids(vector, np.array([vector_id], dtype="int64"))
+        else:
+            self.pending[shard].append(vector_id)
+            if len(self.pending[shard]) >= INDEX_TRAIN_SIZE:
+                self.shards[shard], self.pending[shard] = \
+                    self._build_shard(np.asarray(self.pending[shard], dtype="int64"))
+        self.dirty.add(shard)
         self.next_id += 1
         return vector_id
 
+    def remove(self, vector_id: int):
+        """
+        Tombstone vector_id; it is skipped by searches from now on and
+        dropped from the index by the next rebuild().
+        """
+        self.tombstones.add(int(vector_id))
+
+    def needs_compaction(self) -> bool:
+        return len(self.tombstones) >= max(COMPACT_MIN_TOMBSTONES,
+                                           COMPACT_TOMBSTONE_RATIO * self.ntotal)
+
+    def rebuild(self, lock, bounded=False) -> int:
+        """
+        Rebuild the shards without their tombstoned vectors while the current
+        shards keep serving searches, and return how many vectors were dropped.
+        Compressed shards are retrained on their live vectors.
+
+        lock is the lock callers hold around this index. The new shards are
+        built from a memory map of the vector store, whose rows never change,
+        so the lock is only taken to snapshot the vector_ids of the current
+        shards and the store and, at the end, to catch up with the vectors
+        added meanwhile and swap the new shards in. clear() replaces the store
+        file, so the snapshot keeps mapping the old one and a rebuild that
+        raced with clear() is abandoned. New shards are written to disk before
+        the swap.
+
+        With bounded=True the shards are rebuilt and swapped one at a time,
+        so the extra memory is one shard instead of a copy of the index.
+        """
+        num_shards = len(self.shards)
+        groups = [[i] for i in range(num_shards)] if bounded else [list(range(num_shards))]
+        num_dropped = 0
+        for group in groups:
+            with lock:
+                self._load_fully()
+                tombstones = np.fromiter(self.tombstones, dtype="int64")
+                olds = {i: self.shards[i] for i in group}
+                snapshots = {i: np.concatenate([_id_array(self.shards[i]),
+                                                np.asarray(self.pending[i], dtype="int64")])
+                             for i in group}
+                end = self.next_id
+                view = self.store.view()
+                generation = self.generation
+            news, dropped = {}, set()
+            for i in group:
+                dead = np.isin(snapshots[i], tombstones)
+                dropped |= set(snapshots[i][dead].tolist())
+                news[i] = self._build_shard(np.sort(snapshots[i][~dead]), view)
+                _write_atomic(news[i][0], self.shard_paths[i] + '.rebuild')
+            with lock:
+                if self.generation != generation or \
+                        any(self.shards[i] is not olds[i] for i in group):
+                    # Cleared, or trained by add(), during the rebuild
+                    for i in group:
+                        os.remove(self.shard_paths[i] + '.rebuild')
+                    return num_dropped
+                tombstones = np.fromiter(self.tombstones, dtype="int64")
+                for i in group:
+                    shard, pending = news[i]
+                    # Vectors added to the old shard during the rebuild
+                    tail = np.arange(end + (i - end) % num_shards, self.next_id, num_shards,
+                                     dtype="int64")
+                    dead = np.isin(tail, tombstones)
+                    dropped |= set(tail[dead].tolist())
+                    if shard.is_trained:
+                        shard.add_with_ids(self.store.get(tail[~dead]), tail[~dead])
+                    else:
+                        pending += tail[~dead].tolist()
+                    self.shards[i], self.pending[i] = shard, pending
+                    if len(tail):
+                        self.dirty.add(i)
+                        os.remove(self.shard_paths[i] + '.rebuild')
+                    else:
+                        os.replace(self.shard_paths[i] + '.rebuild', self.shard_paths[i])
+                        self.dirty.discard(i)
+                self.tombstones -= dropped
+                self.save()
+            num_dropped += len(dropped)
+        return num_dropped
+
     def search(self, query: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
         """
         Search the index for the nearest neighbors of a query vector.
@@ -77,21 +352,97 @@ class FollowerFaissIndex:
         if query.ndim == 1:
             query = query.reshape(1, -1)
         query = query.astype("float32")
-        distances, indices = self.index.search(query, top_k)
-        # FAISS returns shape (1, top_k) for a single query.
-        return distances[0], indices[0]
+        compressed = self.index_type != "flat"
+        # Over-fetch so that top_k live vectors remain after skipping tombstones,
+        # and RERANK_FACTOR times as many for re-ranking a compressed index
+        num_candidates = top_k * RERANK_FACTOR if compressed else top_k
+        num_fetch = min(num_candidates + len(self.tombstones), self.ntotal) or top_k
+        shards = list(enumerate(self.shards))
+        if self.search_pool is None:
+            results = [self._search_shard(i, shard, query, num_fetch) for i, shard in shards]
+        else:
+            results = list(self.search_pool.map(
+                lambda args: self._search_shard(*args, query, num_fetch), shards))
+        distances = np.concatenate([d for d, _ in results])
+        indices = np.concatenate([i for _, i in results])
+        live = indices != -1
+        if self.tombstones:
+            live &= np.array([i not in self.tombstones for i in indices], dtype=bool)
+        distances, indices = distances[live], indices[live]
+        if compressed:
+            distances = self._exact_distances(query[0], indices)
+        order = np.argsort(distances if self.metric == "l2" else -distances,
+                           kind="stable")[:top_k]
+        return distances[order], indices[order]
+
+    def _search_shard(self, i, shard, query, num_fetch):
+        if shard.is_trained:
+            distances, indices = shard.search(query, num_fetch)
+            # FAISS returns shape (1, num_fetch) for a single query.
+            return distances[0], indices[0]
+        # Not trained yet: scan its pending vectors exactly
+        indices = np.asarray(self.pending[i], dtype="int64")
+        distances = self._exact_distances(query[0], indices)
+        if len(indices) > num_fetch:
+            top = np.argpartition(distances if self.metric == "l2" else -distances,
+                                  num_fetch)[:num_fetch]
+            distances, indices = distances[top], indices[top]
+        return distances, indices
+
+    def _exact_distances(self, query, indices):
+        # Same scores as the flat indexes: squared L2 or inner product
+        vectors = self.store.get(indices)
+        if self.metric == "l2":
+            return ((vectors - query) ** 2).sum(axis=1)
+        return vectors @ query
 
     def clear(self):
         """
-        Remove all vectors from the index by recreating a fresh empty index.
-        Resets next_id to 0 and overwrites the saved index file.
+        Remove all vectors from the index by recreating fresh empty shards.
+        Resets next_id to 0 and overwrites the saved shards, vector store and
+        tombstones.
         """
-        if self.metric == "l2":
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
-        elif self.metric == "ip":
-            self.index = faiss.IndexFlatIP(self.embedding_dim)
-        else:
-            raise ValueError(f"Unsupported metric: {self.metric}")
+        self.shards = [self._new_index() for _ in self.shard_paths]
+        self.pending = [[] for _ in self.shard_paths]
+        self.dirty = set(range(len(self.shards)))
+        self.store.clear()
+        self.tombstones.clear()
+        self.mmap = False
         self.next_id = 0
+        # Makes rebuilds started before the clear abandon their shards
+        self.generation += 1
         self.save()
 
+
+def saved_index_paths(index_path):
+    """
+    Paths of the saved shards of the index at index_path, whatever their number.
+    """
+    directory = os.path.dirname(os.path.abspath(index_path))
+    root, ext = os.path.splitext(os.path.basename(index_path))
+    shard_name = re.compile(re.escape(root) + r'\.shard\d+' + re.escape(ext) + '$')
+    paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+             if shard_name.match(name)] if os.path.isdir(directory) else []
+    return ([index_path] if os.path.exists(index_path) else []) + paths
+
+
+def _id_array(shard):
+    return faiss.vector_to_array(shard.id_map).astype("int64")
+
+
+def _index_type_of(shard) -> Optional[str]:
+    inner = faiss.downcast_index(shard.index)
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return {faiss.ScalarQuantizer.QT_fp16: "fp16",
+                faiss.ScalarQuantizer.QT_8bit: "sq8"}.get(inner.sq.qtype)
+    if isinstance(inner, faiss.IndexPQ):
+        return "pq"
+    return None
+
+
+def _write_atomic(index, path):
+    # Readers (and restarts) see either the old or the new file, never half
+    faiss.write_index(index, path + '.tmp')
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,98 @@
+# leader/evaluation.py
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from leader.storage.store import fetch_photos_by_metadata
+from utils.config import *
+from utils.prompt_metadata import extract_prompt_meta
+
+SEARCH_MODES = ['meta_fusion', 'vector_only', 'metadata_only']
+
+
+@dataclass
+class ModeEvaluation:
+    """Quality and cost of one search mode against the exact ground truth."""
+    search_mode: str
+    num_hits: int = 0
+
+    # recall@k: share of the exact top-k found in the first k hits
+    # precision: share of the first k hits passing the metadata filter
+    recall: Optional[float] = None
+    precision: Optional[float] = None
+
+    latency: float = 0.0
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class Evaluation:
+    """Evaluation of the search modes for a prompt (or the mean over a prompt set)."""
+    prompt: str
+    k: int
+    num_relevant: int = 0
+    modes: List[ModeEvaluation] = field(default_factory=list)
+
+
+def ground_truth(leader, prompt, k):
+    """
+    Exact answer of a prompt: the k photos nearest to the prompt embedding by
+    brute force over every silo, among the photos passing its metadata filter.
+
+    Returns (ranked photo_ids, set of photo_ids passing the filter).
+    """
+    metadata = extract_prompt_meta(prompt)
+    allowed = {p['photo_id'] for p in fetch_photos_by_metadata(
+        leader.conn, metadata, list(leader.silo_counts), limit=None)}
+    exact = leader.search(prompt, search_mode='exact',
+                          use_cache=False).result(timeout=SEARCH_TIMEOUT)
+    relevant = [hit.photo_id for hit in exact.hits if hit.photo_id in allowed]
+    return relevant[:k], allowed
+
+
+def evaluate(leader, prompt, k=VECTOR_SEARCH_TOP_K, search_modes=SEARCH_MODES) -> Evaluation:
+    """
+    Run prompt under each search mode, bypassing the result cache, and score
+    the first k hits against the ground truth.
+    """
+    relevant, allowed = ground_truth(leader, prompt, k)
+    evaluation = Evaluation(prompt, k, len(relevant))
+    for search_mode in search_modes:
+        result = leader.search(prompt, search_mode=search_mode,
+                               use_cache=False).result(timeout=SEARCH_TIMEOUT)
+        top = [hit.photo_id for hit in result.hits[:k]]
+        evaluation.modes.append(ModeEvaluation(
+            search_mode,
+            num_hits=len(result.hits),
+            recall=len(set(top) & set(relevant)) / len(relevant) if relevant else None,
+            precision=sum(p in allowed for p in top) / len(top) if top else None,
+            latency=result.timing.get('total', 0.0),
+            stats=result.stats
+        ))
+    return evaluation
+
+
+def evaluate_prompts(leader, prompts, k=VECTOR_SEARCH_TOP_K,
+                     search_modes=SEARCH_MODES) -> Evaluation:
+    """
+    Evaluate every prompt and return the per-mode mean over the prompt set.
+    Recall and precision are averaged over the prompts where they are defined.
+    """
+    evaluations = [evaluate(leader, prompt, k, search_modes) for prompt in prompts]
+    mean = Evaluation(f'{len(prompts)} prompts', k,
+                      _mean([e.num_relevant for e in evaluations]))
+    for i, search_mode in enumerate(search_modes):
+        modes = [e.modes[i] for e in evaluations]
+        stat_names = {name for m in modes for name in m.stats}
+        mean.modes.append(ModeEvaluation(
+            search_mode,
+            num_hits=_mean([m.num_hits for m in modes]),
+            recall=_mean([m.recall for m in modes if m.recall is not None]),
+            precision=_mean([m.precision for m in modes if m.precision is not None]),
+            latency=_mean([m.latency for m in modes]),
+            stats={name: _mean([m.stats.get(name, 0) for m in modes])
+                   for name in sorted(stat_names)}
+        ))
+    return mean
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
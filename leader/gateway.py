@@ -0,0 +1,181 @@
+# leader/gateway.py
+import os
+import json
+import time
+import asyncio
+import threading
+import dataclasses
+from urllib.parse import urlsplit, parse_qs
+from utils.config import *
+
+HTTP_REASONS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+    503: 'Service Unavailable', 504: 'Gateway Timeout'
+}
+# 'exact' is a full scan for evaluation only
+SEARCH_MODES = ('meta_fusion', 'vector_only', 'metadata_only')
+
+
+class QueryGateway:
+    """
+    Asyncio HTTP front end of the leader serving concurrent clients.
+
+    Endpoints (JSON responses):
+    - GET  /search?q=<prompt>&mode=<meta_fusion|vector_only|metadata_only>
+    - GET  /get?q=<prompt>&dir=<output directory>&quality=<preview|original>
+    - POST /upload?name=<photo name>   (raw image bytes as the body)
+    - GET  /metrics                    (stage histograms, Prometheus text)
+
+    Every request runs through the leader's search/upload pipeline. At most
+    max_inflight requests are served at once; the rest are rejected with
+    503 so that a burst cannot pile up unbounded work on the leader. A
+    search that times out with 504 is cancelled on the leader. Search
+    responses carry a Server-Timing header with the stage breakdown.
+    """
+
+    def __init__(self, leader, host, port, max_inflight=GATEWAY_MAX_INFLIGHT):
+        self.leader = leader
+        self.host = host
+        self.port = port
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.loop = None
+        self.server = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self.host, self.port)
+        )
+        LOGGER.info('Query gateway listening on http://%s:%d', self.host, self.port)
+        self.loop.run_forever()
+        self.server.close()
+        self.loop.close()
+
+    async def _handle_connection(self, reader, writer):
+        time_check = time.perf_counter()
+        try:
+            method, target, body = await _read_request(reader)
+        except (ValueError, asyncio.IncompleteReadError):
+            await _write_response(writer, 400, {'error': 'malformed request'})
+            return
+        if self.inflight >= self.max_inflight:
+            await _write_response(writer, 503, {'error': 'too many requests'},
+                                  {'Retry-After': '1'})
+            return
+        self.inflight += 1
+        try:
+            status, payload, headers = await self._dispatch(method, target, body)
+        except asyncio.TimeoutError:
+            status, payload, headers = 504, {'error': 'search timed out'}, {}
+        except Exception as e:
+            LOGGER.warning('Gateway request %s %s failed: %s', method, target, e)
+            status, payload, headers = 503, {'error': str(e)}, {}
+        finally:
+            self.inflight -= 1
+        headers['X-Response-Time'] = f'{(time.perf_counter() - time_check) * 1000:.3f}ms'
+        await _write_response(writer, status, payload, headers)
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        match method, url.path:
+            case 'GET', '/search':
+                if not params.get('q'):
+                    return 400, {'error': 'missing q'}, {}
+                if params.get('mode', 'meta_fusion') not in SEARCH_MODES:
+                    return 400, {'error': f'mode must be one of {", ".join(SEARCH_MODES)}'}, {}
+                return await self._search(params['q'],
+                                          search_mode=params.get('mode', 'meta_fusion'))
+            case 'GET', '/get':
+                if not params.get('q') or not os.path.isdir(params.get('dir', '')):
+                    return 400, {'error': 'missing q or dir is not a directory'}, {}
+                return await self._search(params['q'], params['dir'],
+                                          quality=params.get('quality', 'preview'))
+            case 'POST', '/upload':
+                if not body or not params.get('name'):
+                    return 400, {'error': 'missing body or name'}, {}
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, self.leader.upload_bytes, body, params['name']
+                )
+                status = {'uploaded': 202, 'unavailable': 503}.get(result['status'], 200)
+                return status, result, {}
+            case 'DELETE', '/photo':
+                if not params.get('id'):
+                    return 400, {'error': 'missing id'}, {}
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, self.leader.delete, params['id']
+                )
+                return 200 if result['status'] == 'deleted' else 404, result, {}
+            case 'GET', '/metrics':
+                return 200, self.leader.metrics.to_prometheus(), {}
+            case _, '/search' | '/get' | '/upload' | '/photo' | '/metrics':
+                return 405, {'error': f'method {method} not allowed'}, {}
+            case _:
+                return 404, {'error': f'unknown path {url.path}'}, {}
+
+    async def _search(self, prompt, output_path=None, search_mode='meta_fusion',
+                      quality='preview'):
+        time_check = time.perf_counter()
+        future = await asyncio.get_running_loop().run_in_executor(
+            None, self.leader.search, prompt, output_path, search_mode, quality
+        )
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future),
+                                            SEARCH_TIMEOUT - (time.perf_counter() - time_check))
+        except asyncio.TimeoutError:
+            # Drop the request and the followers' inflight counts on the leader
+            self.leader.cancel_search(future)
+            raise
+        server_timing = ', '.join(f'{stage};dur={seconds * 1000:.3f}'
+                                  for stage, seconds in result.timing.items())
+        return 200, dataclasses.asdict(result), {'Server-Timing': server_timing}
+
+
+async def _read_request(reader):
+    """
+    Read an HTTP/1.1 request and return (method, target, body).
+    """
+    request_line = await reader.readline()
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    content_length = 0
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value.strip())
+    if content_length > GATEWAY_MAX_BODY_BYTES:
+        raise ValueError('request body too large')
+    body = await reader.readexactly(content_length) if content_length else b''
+    return method, target, body
+
+
+async def _write_response(writer, status, payload, headers=None):
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+    else:
+        body, content_type = json.dumps(payload, default=str).encode('utf-8'), 'application/json'
+    lines = [
+        f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}',
+        f'Content-Type: {content_type}',
+        f'Content-Length: {len(body)}',
+        'Connection: close',
+    ]
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
@@ -0,0 +1,244 @@
+# leader/ingest.py
+import os
+import json
+import queue
+import threading
+import time
+import msgpack
+from collections import OrderedDict
+from leader.storage.store import query_existing_photo_ids
+from utils.config import *
+from utils.image_utils import hash_image_bytes
+
+# Passed down the pipeline once a stage is done
+_END = None
+# Passed instead of the upload message of a photo that is already stored
+_DUPLICATE = 'duplicate'
+
+
+class MsgpackIngestJob:
+    """
+    Streaming, resumable upload of a msgpack dump of photo records.
+
+    Three stages run in their own threads, connected by bounded queues so
+    that at most INGEST_PREFETCH records are held in memory:
+    - decode:   unpack records from the file, starting at the checkpoint offset.
+    - hash:     hash the images and drop the photos already stored, with one
+                metadata query per INGEST_BATCH_SIZE records, and the repeats
+                of the last INGEST_SEEN_PHOTO_IDS photos of the job.
+    - dispatch: send the records to their followers.
+
+    Every INGEST_CHECKPOINT_INTERVAL records the byte offset of the first
+    record whose upload_reply has not arrived yet (or after the last record
+    if all have) is written to the checkpoint file, so that a restarted job
+    resumes from there instead of re-reading and re-hashing the file, without
+    losing the records that were dispatched but not stored. Records that no
+    follower could store (unreadable images, all followers down) are counted
+    as failed and skipped. The checkpoint is removed once every record of the
+    file has been stored or has failed.
+    """
+
+    def __init__(self, leader, file_path, checkpoint_path=None, prefetch=INGEST_PREFETCH):
+        self.leader = leader
+        self.file_path = file_path
+        self.checkpoint_path = checkpoint_path or f'{file_path}.ckpt'
+        self.decoded = queue.Queue(maxsize=prefetch)
+        self.hashed = queue.Queue(maxsize=prefetch)
+        self.stop = threading.Event()
+        self.error = None
+        stat = os.stat(file_path)
+        self.file_id = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        self.start_offset, self.num_records = self._load_checkpoint()
+        # Byte offset after the last dispatched record
+        self.offset = self.start_offset
+        # (byte offset, records done) before each record waiting for its
+        # upload_reply, by request_id
+        self.unacked = {}
+        self.acked = threading.Condition()
+        # photo_ids already dispatched or stored, oldest first
+        self.seen = OrderedDict()
+        self.num_uploaded = 0
+        self.num_duplicates = 0
+        self.num_failed = 0
+
+    def run(self):
+        """
+        Ingest the file from the checkpoint to the end and return the number
+        of uploaded photos.
+        """
+        if self.start_offset:
+            print(f'Resuming {self.file_path} from byte {self.start_offset} '
+                  f'({self.num_records} records done)')
+        time_check = time.perf_counter()
+        stages = [threading.Thread(target=self._run_stage, args=(stage,),
+                                   name=stage.__name__, daemon=True)
+                  for stage in (self._decode, self._hash)]
+        for stage in stages:
+            stage.start()
+        try:
+            self._run_stage(self._dispatch)
+        except KeyboardInterrupt:
+            self.stop.set()
+            self._save_checkpoint()
+            raise
+        for stage in stages:
+            stage.join()
+        if self.error is not None:
+            self._save_checkpoint()
+            raise self.error
+        with self.acked:
+            self.acked.wait_for(lambda: not self.unacked, INGEST_ACK_TIMEOUT)
+            unacked = list(self.unacked)
+        if unacked:
+            for request_id in unacked:
+                self.leader.upload_callbacks.pop(request_id, None)
+            self._save_checkpoint()
+            raise TimeoutError(f'{len(unacked)} uploads of {self.file_path} were not stored; '
+                               f'rerun to resume from byte {self._checkpoint()[0]}')
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        elapsed = time.perf_counter() - time_check
+        size = (self.file_id['size'] - self.start_offset) / 1024 / 1024
+        print(f'Ingested {self.file_path}: {self.num_uploaded} uploaded, '
+              f'{self.num_duplicates} already stored, {self.num_failed} failed, '
+              f'{elapsed: .1f} s ({size / max(elapsed, 1e-9): .1f} MB/s)')
+        return self.num_uploaded
+
+    def _run_stage(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            LOGGER.error('Ingest stage %s failed: %s', stage.__name__, e)
+            self.error = e
+            self.stop.set()
+
+    def _put(self, q, item):
+        # Bounded put that gives up once another stage has failed
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _decode(self):
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.start_offset)
+            unpacker = msgpack.Unpacker(f, raw=False, max_buffer_size=INGEST_MAX_RECORD_BYTES)
+            for record in unpacker:
+                # tell() is relative to where the unpacker started reading
+                if not self._put(self.decoded, (self.start_offset + unpacker.tell(), record)):
+                    return
+        self._put(self.decoded, _END)
+
+    def _hash(self):
+        batch = []
+        while True:
+            item = self._get(self.decoded)
+            if item is not _END:
+                offset, record = item
+                message = None
+                if 'image' in record:
+                    photo_id = hash_image_bytes(record['image'])
+                    message = self.leader.json_upload_message(record, photo_id)
+                batch.append((offset, message))
+            if batch and (item is _END or len(batch) >= INGEST_BATCH_SIZE):
+                photo_ids = [m['metadata']['photo_id'] for _, m in batch
+                             if m and m['metadata']['photo_id'] not in self.seen]
+                existing = query_existing_photo_ids(self.leader.conn, photo_ids)
+                for offset, message in batch:
+                    if message is not None:
+                        photo_id = message['metadata']['photo_id']
+                        # Repeats within the file may not be stored yet
+                        if photo_id in existing or photo_id in self.seen:
+                            message = _DUPLICATE
+                        self._see(photo_id)
+                    if not self._put(self.hashed, (offset, message)):
+                        return
+                batch = []
+            if item is _END:
+                self._put(self.hashed, _END)
+                return
+
+    def _dispatch(self):
+        while True:
+            item = self._get(self.hashed)
+            if item is _END:
+                return
+            offset, message = item
+            if message == _DUPLICATE:
+                self.num_duplicates += 1
+            elif message is not None:
+                with self.acked:
+                    # Held until the record is tracked, in case its reply comes first
+                    request_id = self.leader.send_upload(message, self._on_reply)
+                    if request_id is not None:
+                        self.unacked[request_id] = (self.offset, self.num_records)
+                if request_id is None:
+                    LOGGER.warning('No follower of %s is reachable; skipping it',
+                                   message['metadata']['photo_name'])
+                    self.num_failed += 1
+                else:
+                    self.num_uploaded += 1
+            with self.acked:
+                self.offset = offset
+                self.num_records += 1
+            if self.num_records % INGEST_CHECKPOINT_INTERVAL == 0:
+                self._save_checkpoint()
+                print(f'Inserted {self.num_records} records '
+                      f'({100 * offset / max(self.file_id["size"], 1): .1f}% of file)')
+
+    def _see(self, photo_id):
+        self.seen[photo_id] = True
+        self.seen.move_to_end(photo_id)
+        if len(self.seen) > INGEST_SEEN_PHOTO_IDS:
+            self.seen.popitem(last=False)
+
+    def _on_reply(self, request_id, error=None):
+        with self.acked:
+            if self.unacked.pop(request_id, None) is not None and error is not None:
+                self.num_uploaded -= 1
+                self.num_failed += 1
+            self.acked.notify_all()
+
+    def _checkpoint(self):
+        """
+        Return (byte offset, records done) to resume from: before the first
+        record not stored yet.
+        """
+        with self.acked:
+            if self.unacked:
+                return min(self.unacked.values())
+            return self.offset, self.num_records
+
+    def _load_checkpoint(self):
+        """
+        Return (byte offset, records done) of a checkpoint of the same file,
+        or (0, 0) to start from the beginning.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return 0, 0
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('file_id') != self.file_id:
+            LOGGER.warning('Ignoring checkpoint %s of a different version of %s',
+                           self.checkpoint_path, self.file_path)
+            return 0, 0
+        return checkpoint['offset'], checkpoint['records']
+
+    def _save_checkpoint(self):
+        offset, num_records = self._checkpoint()
+        checkpoint = {'file_id': self.file_id, 'offset': offset, 'records': num_records}
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
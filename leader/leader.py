@@ -1,56 +1,106 @@
 import sys
+import json
 import time
+import asyncio
+import itertools
 import random
 import threading
 import base64
-import msgpack
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import timedelta
 from typing import List, Dict, Optional, Any
 from leader.storage.store import *
+from leader.ingest import MsgpackIngestJob
+from leader.metadata_index import ColumnarMetadataIndex
+from leader.result_cache import ResultCache
+from leader.search_result import SearchHit, SearchResult
 from utils.config import *
 from utils.image_utils import *
 from utils.prompt_metadata import extract_prompt_meta
 from utils.photo_to_vector import ImageEmbeddingModel
 from utils.network import tcp_server
+from utils.tracing import StageMetrics, Trace
+from utils.profiler import RuntimeProfiler
 from utils.network import tcp_client
+from utils.network import tcp_receive_stream
+from utils.network import tcp_stream_listener
 from utils.network import udp_server
 
 
 class Leader:
-    def __init__(self, host, port, base_dir, model_name, device, normalize):
+    def __init__(self, host, port, base_dir, model_name, device, normalize,
+                 backend='eager', num_threads=None,
+                 replication_factor=REPLICATION_FACTOR, metadata_mirror=METADATA_MIRROR,
+                 db_name=DB_NAME):
         self.host = host
         self.port = port
         self.signals = {'shutdown': False}
         self.followers: List[Dict[str, Optional[Any]]] = []
         self.pending_client_request: Dict[str, Dict[str, Optional[Any]]] = {}
+        # Searches are answered on the TCP handler and cancelled by the gateway
+        self.requests_lock = threading.Lock()
+        # send_upload callbacks waiting for an upload_reply, by request_id:
+        # {'on_reply': ..., 'sent': replicas reached, 'errors': error replies,
+        #  'error': the last one}
+        self.upload_callbacks: Dict[str, Dict[str, Any]] = {}
+        self.uploads_lock = threading.Lock()
+        # Gets waiting for their originals, by request_id
+        self.pending_downloads: Dict[str, Dict[str, Any]] = {}
+        self.downloads_lock = threading.Lock()
+        # Originals are requested off the TCP handler, which receives their chunks
+        self.fetch_pool = ThreadPoolExecutor(max_workers=PHOTO_FETCH_WORKERS,
+                                             thread_name_prefix='fetch_photo')
+        self.request_counter = itertools.count()
+        self.result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES,
+                                        RESULT_CACHE_MAX_BUMPS)
+        self.metrics = StageMetrics('leader')
+        self.profiler = RuntimeProfiler('leader')
         self.model = ImageEmbeddingModel(model_name=model_name,
                                          device=device,
-                                         normalize=normalize)
+                                         normalize=normalize,
+                                         backend=backend,
+                                         num_threads=num_threads)
 
         # Unified follower index/model parameters
         self.base_dir = base_dir
         self.model_name = model_name
         self.device = device
         self.normalize = normalize
+        self.backend = backend
+        self.num_threads = num_threads
+        self.replication_factor = replication_factor
 
-        self.check_heartbeat_thread = threading.Thread(target=self._check_heartbeat)
+        self.check_heartbeat_thread = threading.Thread(target=self._check_heartbeat,
+                                                       name='check_heartbeat')
         self.udp_listen_thread = threading.Thread(
-            target=udp_server, args=(host, port, self.signals, self._udp_listen)
+            target=udp_server, args=(host, port, self.signals, self._udp_listen),
+            name='udp_listen'
         )
         self.tcp_listen_thread = threading.Thread(
-            target=tcp_server, args=(host, port, self.signals, self._tcp_listen)
+            target=tcp_server, args=(host, port, self.signals, self._tcp_listen),
+            name='tcp_listen'
         )
 
         self.check_heartbeat_thread.start()
         self.udp_listen_thread.start()
         self.tcp_listen_thread.start()
-        self.conn = init_metadata_table()
+        self.conn = init_metadata_table(database=db_name)
+        # Photos per primary silo and, per replica follower, how many of them
+        # it stores; a follower with all of them can serve the silo's searches.
+        self.silo_counts, self.replica_counts = query_replica_counts(self.conn)
+        # Optional in-memory columnar mirror of photos_meta for the prefilter
+        self.metadata_index = None
+        if metadata_mirror:
+            time_check = time.perf_counter()
+            self.metadata_index = ColumnarMetadataIndex.from_rows(iter_photo_rows(self.conn))
+            LOGGER.info('Loaded %d photos into the metadata mirror in %.2f s',
+                        self.metadata_index.size, time.perf_counter() - time_check)
         LOGGER.info('Leader initialized')
 
     def list_member(self):
         print('Leader: Host = %s, Port = %d' % (self.host, self.port))
         for i, follower in enumerate(self.followers):
-            print('Follower: ID = %d, Host = %s, Port = %d, Status = %s'
+            print('Follower: ID = %d, Host = %s, Port = %s, Status = %s'
                   % (i, follower['host'], follower['port'], follower['status']))
 
     def list_num_photo(self):
@@ -66,25 +116,34 @@ class Leader:
         except Exception as e:
             print(f'Failed to read image from {image_path}: {e}')
             return
+        self.upload_bytes(image_bytes, os.path.basename(image_path))
+
+    def upload_bytes(self, image_bytes, photo_name):
+        """
+        Upload raw image bytes to their followers.
+
+        Returns {'photo_id': ..., 'status': 'uploaded' | 'duplicate' | 'no_followers'
+                 | 'unavailable'}, the latter if no follower could be reached.
+        """
         image_hash = hash_image_bytes(image_bytes)
-        photo_name = os.path.basename(image_path)
         photo_id = image_hash  # can be updated later with upload_time/user_id
+        if len(self.followers) == 0:
+            print('No follower nodes are assigned to the leader')
+            return {'photo_id': photo_id, 'status': 'no_followers'}
         if query_by_photo_id(self.conn, photo_id):
             print(photo_name, 'has already been stored')
-            return
-        digest = hashlib.sha256(photo_id.encode("utf-8")).hexdigest()
-        index = int(digest, 16) % len(self.followers)
+            return {'photo_id': photo_id, 'status': 'duplicate'}
         image_b64 = base64.b64encode(image_bytes).decode("ascii")
         message = {
             'message_type': 'upload',
             'photo_id': photo_id,
             'photo_name': photo_name,
-            'photo_format': get_format_from_bytes(image_bytes),
             'image_b64': image_b64
         }
-        tcp_client(self.followers[index]['host'],
-                   self.followers[index]['port'],
-                   message)
+        if not self._send_to_replicas(photo_id, message):
+            print(f'No follower could store {photo_name}')
+            return {'photo_id': photo_id, 'status': 'unavailable'}
+        return {'photo_id': photo_id, 'status': 'uploaded'}
 
     def mass_upload(self, image_dir):
         photo_paths = list_photo_paths(image_dir)
@@ -97,17 +156,30 @@ class Leader:
         if len(self.followers) == 0:
             print('No follower nodes are assigned to the leader')
             return
+        if 'image' not in record:
+            return
+        photo_id = hash_image_bytes(record['image'])
+        message = self.json_upload_message(record, photo_id)
+        if message is None:
+            return
+        if query_by_photo_id(self.conn, photo_id):
+            print(message['metadata']['photo_name'], 'has already been stored')
+            return
+        if not self._send_to_replicas(photo_id, message):
+            print(f'No follower could store {message["metadata"]["photo_name"]}')
+
+    def json_upload_message(self, record, photo_id):
+        """
+        Build the upload_from_json message of a msgpack/JSON photo record, or
+        return None if the record misses a required field.
+        """
         try:
             image_bytes = record['image']
             photo_name = record['id'].replace('/', '+')
             latitude = record['latitude']
             longitude = record['longitude']
         except KeyError:
-            return
-        photo_id = hash_image_bytes(image_bytes)
-        if query_by_photo_id(self.conn, photo_id):
-            print(photo_name, 'has already been stored')
-            return
+            return None
         if 'timestamp' in record:
             timestamp = record['timestamp']
         else:
@@ -125,84 +197,271 @@ class Leader:
             'camera_make': None,
             'camera_model': None
         }
-        digest = hashlib.sha256(photo_id.encode("utf-8")).hexdigest()
-        index = int(digest, 16) % len(self.followers)
         image_b64 = base64.b64encode(image_bytes).decode("ascii")
-        message = {
+        return {
             'message_type': 'upload_from_json',
             'image_b64': image_b64,
             'metadata': metadata
         }
-        tcp_client(self.followers[index]['host'],
-                   self.followers[index]['port'],
-                   message)
+
+    def _place(self, photo_id):
+        """
+        Return the silo_ids of the followers to store a new photo_id, primary
+        first: the hashed live follower and the next replication_factor - 1
+        live followers. Slots of warm-restarted followers that have not
+        registered again are skipped; the photo's followers are recorded in
+        the metadata table, so placement may change as followers come and go.
+        """
+        live = [f['silo_id'] for f in self.followers if f['status'] == 'alive']
+        if not live:
+            return []
+        digest = hashlib.sha256(photo_id.encode("utf-8")).hexdigest()
+        index = int(digest, 16) % len(live)
+        num_replicas = min(self.replication_factor, len(live))
+        return [live[(index + i) % len(live)] for i in range(num_replicas)]
+
+    def send_upload(self, message, on_reply=None):
+        """
+        Send an upload_from_json message to the followers of its photo and
+        return its request_id, or None if no follower could be reached (or
+        all of them already replied with an error).
+
+        Otherwise on_reply(request_id, error) is called once: with error None
+        when the first follower's upload_reply is recorded in the metadata
+        table, or with the error of the last reply if every follower failed
+        to store the photo.
+        """
+        request_id = f"upload-{int(time.time() * 10000)}-{next(self.request_counter)}"
+        message['request_id'] = request_id
+        if on_reply is not None:
+            # Registered first, as a reply may arrive before the send returns
+            with self.uploads_lock:
+                self.upload_callbacks[request_id] = {'on_reply': on_reply, 'sent': None,
+                                                     'errors': 0, 'error': None}
+        num_sent = self._send_to_replicas(message['metadata']['photo_id'], message)
+        if on_reply is None:
+            return request_id if num_sent else None
+        with self.uploads_lock:
+            upload = self.upload_callbacks.get(request_id)
+            if upload is None:
+                # Already stored
+                return request_id
+            upload['sent'] = num_sent
+            if num_sent and upload['errors'] < num_sent:
+                return request_id
+            self.upload_callbacks.pop(request_id)
+        return None
+
+    def _send_to_replicas(self, photo_id, message):
+        """
+        Send message to the live followers of photo_id and return how many
+        of them it reached.
+        """
+        replicas = self._place(photo_id)
+        if not replicas:
+            LOGGER.warning(f'No live follower to upload {photo_id} to')
+            return 0
+        message['primary_silo'] = replicas[0]
+        num_sent = 0
+        for silo_id in replicas:
+            follower = self.followers[silo_id]
+            if follower['status'] != 'alive':
+                LOGGER.warning(f'Skip uploading {photo_id} to dead follower {silo_id}')
+                continue
+            try:
+                tcp_client(follower['host'], follower['port'], message)
+                num_sent += 1
+            except OSError as e:
+                LOGGER.warning(f'Failed to upload {photo_id} to follower {silo_id}: {e}')
+        return num_sent
+
+    def delete(self, photo_id):
+        """
+        Delete a photo from the metadata database and its followers.
+
+        Returns {'photo_id': ..., 'status': 'deleted' | 'not_found'}
+        """
+        row = delete_photo(self.conn, photo_id)
+        if row is None:
+            print(f'Photo {photo_id} is not stored')
+            return {'photo_id': photo_id, 'status': 'not_found'}
+        silo_id, replicas = row
+        replicas = replicas or [silo_id]
+        self.silo_counts[silo_id] = self.silo_counts.get(silo_id, 1) - 1
+        replica_counts = self.replica_counts.setdefault(silo_id, {})
+        for replica in replicas:
+            replica_counts[replica] = replica_counts.get(replica, 1) - 1
+        self.result_cache.bump(silo_id)
+        if self.metadata_index is not None:
+            self.metadata_index.remove(photo_id)
+        message = {'message_type': 'delete', 'photo_id': photo_id}
+        self._send_to_followers(replicas, photo_id, message)
+        LOGGER.info(f'Deleted photo {photo_id} from silo {silo_id}')
+        return {'photo_id': photo_id, 'status': 'deleted'}
+
+    def replace(self, photo_id, image_path=None):
+        """
+        Re-embed (and re-tag) a stored photo on its followers, with the image
+        at image_path as its new content if given. The photo keeps its
+        photo_id; its metadata row is updated from the followers' replies.
+
+        Returns {'photo_id': ..., 'status': 'replaced' | 'not_found'}
+        """
+        message = {'message_type': 'replace', 'photo_id': photo_id}
+        if image_path is not None:
+            try:
+                image_bytes = read_image_bytes(image_path)
+            except Exception as e:
+                print(f'Failed to read image from {image_path}: {e}')
+                return {'photo_id': photo_id, 'status': 'not_found'}
+            message['image_b64'] = base64.b64encode(image_bytes).decode("ascii")
+            message['photo_name'] = os.path.basename(image_path)
+        row = query_replicas(self.conn, photo_id)
+        if row is None:
+            print(f'Photo {photo_id} is not stored')
+            return {'photo_id': photo_id, 'status': 'not_found'}
+        silo_id, replicas = row
+        self._send_to_followers(replicas or [silo_id], photo_id, message)
+        return {'photo_id': photo_id, 'status': 'replaced'}
+
+    def _send_to_followers(self, silo_ids, photo_id, message):
+        for silo_id in silo_ids:
+            follower = self.followers[silo_id] if silo_id < len(self.followers) else None
+            if follower is None or follower['status'] != 'alive':
+                LOGGER.warning(f'Skip sending {message["message_type"]} of {photo_id} '
+                               f'to dead follower {silo_id}')
+                continue
+            tcp_client(follower['host'], follower['port'], message)
 
     def upload_from_msgpack(self, file_path):
-        with open(file_path, "rb") as f:
-            unpacker = msgpack.Unpacker(f, raw=False)
-            for i, record in enumerate(unpacker):
-                self.upload_from_json(record)
-                if i % 50 == 0:
-                    print(f'Inserting {i}/N photos...')
-                    time.sleep(0.5)
+        """
+        Upload the records of a msgpack dump through a streaming ingest job,
+        resuming from its checkpoint if a previous run was interrupted.
+        """
+        if len(self.followers) == 0:
+            print('No follower nodes are assigned to the leader')
+            return
+        if not os.path.isfile(file_path):
+            print(f"Error: The file '{file_path}' was not found.")
+            return
+        MsgpackIngestJob(self, file_path).run()
 
-    def search(self, prompt, output_path=None, search_mode='meta_fusion'):
+    def search(self, prompt, output_path=None, search_mode='meta_fusion',
+               quality='preview', use_cache=True) -> Future:
         """
         Search/Get photos using given prompt under following modes:
         - 'metadata_only': Search by only metadata psql.
         - 'vector_only': Search by only vector index.
         - 'meta_fusion': Search combining metadata psql and vector index.
+        - 'exact': Brute-force vector search returning every stored photo
+          ranked by distance, used as ground truth by leader.evaluation.
+
+        When getting photos, quality selects between downscaled 'preview'
+        images inlined in the result and 'original' photos streamed in chunks.
+
+        Returns a Future resolving to a SearchResult once all assigned
+        followers have replied. Gets always bypass the result cache.
         """
+        future = Future()
         if len(self.followers) == 0:
-            print("No follower nodes available.")
-            return
+            future.set_exception(RuntimeError('No follower nodes available.'))
+            return future
         time_check1 = time.perf_counter()
-        metadata = extract_prompt_meta(prompt)
+        cache_key = None
+        if use_cache and output_path is None:
+            cache_key = ResultCache.make_key(prompt, search_mode, VECTOR_SEARCH_TOP_K)
+            hits = self.result_cache.get(cache_key)
+            if hits is not None:
+                future.set_result(SearchResult(
+                    prompt, search_mode, hits,
+                    {'total': time.perf_counter() - time_check1}, cached=True
+                ))
+                return future
+        # Taken before the silos are read, so that uploads racing with the
+        # search keep its result out of the cache
+        generations = self.result_cache.snapshot()
+        request_id = f"search-{int(time.time() * 10000)}-{next(self.request_counter)}"
+        trace = Trace(request_id)
+        metadata = extract_prompt_meta(prompt, trace)
         LOGGER.info('Extracted prompt meta data: %s', metadata)
 
-        if search_mode == 'vector_only':
+        if search_mode in ('vector_only', 'exact'):
             # Skip pre-filtering for vector_only
-            silo_ids = {f['silo_id'] for f in self.followers}
             cand_silos = [(f['silo_id'], VECTOR_SEARCH_TOP_K) for f in self.followers]
             cand_photo_ids = set()
         else:
             # Common pre-filtering for metadata_only and meta_fusion
-            cand_silos = prefilter_candidate_silos(self.conn, metadata)
+            with trace.span('sql_prefilter'):
+                cand_silos = self._prefilter_candidate_silos(metadata)
             LOGGER.info("Candidate silos (silo_id, count): %s", cand_silos)
             if not cand_silos:
-                print("No candidate silos from metadata; skip vector search.")
-                return
+                LOGGER.info("No candidate silos from metadata; skip vector search.")
+                elapsed = time.perf_counter() - time_check1
+                future.set_result(SearchResult(prompt, search_mode, [],
+                                               {'extract': elapsed, 'total': elapsed},
+                                               trace=self._finish_trace(trace, elapsed)))
+                return future
             silo_ids = {s for (s, _) in cand_silos}
-            cand_photos = fetch_photos_by_metadata(self.conn, metadata, list(silo_ids))
+            with trace.span('sql_prefilter'):
+                cand_photos = self._fetch_photos_by_metadata(metadata, list(silo_ids))
             cand_photo_ids = {p['photo_id'] for p in cand_photos}
             # Immediately return results if metadata only search
             if search_mode == 'metadata_only':
-                print(f'\n{"=" * 60}')
-                print(f'Search Mode: METADATA_ONLY')
-                print(f'Prompt: "{prompt}"')
-                print(f'Time spent: {time.perf_counter() - time_check1: .4f} s')
-                print(f'Total Results: {len(cand_photos)}')
-                print(f'{"=" * 60}')
-                for i, photo in enumerate(cand_photos):
-                    print(f'{i + 1}. Filename = {photo["photo_name"]}')
-                print(f'{"=" * 60}')
-                return
+                hits = [SearchHit(p['photo_id'], p['photo_name'], p['silo_id'],
+                                  ts=p['ts'], lat=p['lat'], lon=p['lon'])
+                        for p in cand_photos]
+                if cache_key:
+                    self.result_cache.put(cache_key, hits, generations, silo_ids, metadata)
+                elapsed = time.perf_counter() - time_check1
+                future.set_result(SearchResult(prompt, search_mode, hits,
+                                               {'extract': elapsed, 'total': elapsed},
+                                               stats={'silos': len(silo_ids)},
+                                               trace=self._finish_trace(trace, elapsed)))
+                return future
         time_check2 = time.perf_counter()
-        query_vec = self.model.encode_text(prompt)
+        with trace.span('text_encode'):
+            query_vec = self.model.encode_text(prompt)
 
         # Initialize message and request info
-        LOGGER.info(f"Sending vector search to {len(cand_silos)} followers")
-        request_id = f"search-{int(time.time() * 10000)}"
-        self.pending_client_request[request_id] = {
+        assignment, unavailable = self._assign_replicas(cand_silos)
+        if unavailable:
+            LOGGER.warning(f'No live follower stores silos {unavailable}; searching without them')
+        if not assignment:
+            elapsed = time.perf_counter() - time_check1
+            future.set_result(SearchResult(prompt, search_mode, [],
+                                           {'extract': elapsed, 'total': elapsed},
+                                           stats={'silos': len(cand_silos), 'followers': 0},
+                                           unavailable_silos=unavailable,
+                                           trace=self._finish_trace(trace, elapsed)))
+            return future
+        LOGGER.info(f"Sending vector search to {len(assignment)} followers")
+        request = {
             'prompt': prompt,
-            'recipients': silo_ids.copy(),
+            'recipients': set(assignment),
             'first_check': time_check1,
             'second_check': time_check2,
             'third_check': time.perf_counter(),
             'cand_photo_ids': cand_photo_ids,
             'result': [],
-            'search_mode': search_mode
+            'search_mode': search_mode,
+            # Results missing silos are not cached
+            'cache_key': None if unavailable else cache_key,
+            'unavailable_silos': unavailable,
+            'generations': generations,
+            'silo_ids': [s for s, _ in cand_silos],
+            'metadata': None if search_mode in ('vector_only', 'exact') else metadata,
+            'stats': {
+                'silos': len(cand_silos),
+                'followers': len(assignment),
+                'vectors_scanned': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0
+            },
+            'trace': trace,
+            'future': future
         }
+        with self.requests_lock:
+            self.pending_client_request[request_id] = request
         message = {
             'message_type': 'search',
             'request_id': request_id,
@@ -212,47 +471,194 @@ class Leader:
         if output_path and os.path.isdir(output_path):
             message['message_type'] = 'get'
             message['output_path'] = output_path
+            message['quality'] = quality
 
-        # Send message to assigned followers
-        for silo_id, num in cand_silos:
-            message['top_k'] = max(num * 2, VECTOR_SEARCH_TOP_K)
+        # Send message to the followers serving the candidate silos
+        stats = request['stats']
+        for silo_id, silos in assignment.items():
+            if search_mode == 'exact':
+                # Every photo of the silos
+                top_ks = [max(self.silo_counts.get(s, 0), 1) for s, _ in silos]
+            else:
+                top_ks = [max(num * 2, VECTOR_SEARCH_TOP_K) for _, num in silos]
+            # The follower returns up to top_ks[i] photos of silos[i], searching
+            # deeper than top_k if photos of other silos it replicates crowd them out
+            follower_message = message | {'silos': [s for s, _ in silos], 'top_ks': top_ks,
+                                          'top_k': sum(top_ks)}
+            stats['bytes_sent'] += len(json.dumps(follower_message))
             follower = self.followers[silo_id]
-            if follower.get('status') != 'alive':
-                if 'pending_message' in follower:
-                    follower['pending_message'][request_id] = message
+            with self.requests_lock:
+                follower['inflight'] = follower.get('inflight', 0) + 1
+            try:
+                with trace.span('dispatch'):
+                    tcp_client(follower['host'], follower['port'], follower_message)
+            except OSError as e:
+                # Crashed since its last heartbeat
+                LOGGER.warning(f'Follower {silo_id} is unreachable, searching without '
+                               f'silos {follower_message["silos"]}: {e}')
+                self._drop_recipient(request_id, silo_id, follower_message['silos'],
+                                     message.get('output_path'))
+        return future
+
+    def _drop_recipient(self, request_id, silo_id, silos, output_path=None):
+        """
+        Give up on the reply of follower silo_id to a search (a get if
+        output_path is set), whose silos become unavailable, and finish the
+        search if it was the last one.
+        """
+        with self.requests_lock:
+            request = self.pending_client_request.get(request_id)
+            if request is None:
+                return
+            request['unavailable_silos'] += silos
+            request['cache_key'] = None
+        self._handle_search_result({'silo_id': silo_id, 'request_id': request_id,
+                                    'results': [], 'output_path': output_path},
+                                   get_photo=output_path is not None)
+
+    async def search_async(self, prompt, output_path=None, search_mode='meta_fusion',
+                           quality='preview', use_cache=True) -> SearchResult:
+        """
+        Awaitable version of search for asyncio callers.
+        """
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, self.search, prompt, output_path, search_mode, quality, use_cache
+        )
+        return await asyncio.wrap_future(future)
+
+    def cancel_search(self, future):
+        """
+        Forget the search behind future, which its caller stopped waiting
+        for, so that late follower replies are dropped and the followers it
+        was assigned to count as idle again.
+        """
+        with self.requests_lock:
+            for request_id, request in list(self.pending_client_request.items()):
+                if request['future'] is future:
+                    del self.pending_client_request[request_id]
+                    for silo_id in request['recipients']:
+                        follower = self.followers[silo_id]
+                        follower['inflight'] = max(follower.get('inflight', 0) - 1, 0)
+                    break
+        with self.downloads_lock:
+            for request_id, download in list(self.pending_downloads.items()):
+                if download['future'] is future:
+                    del self.pending_downloads[request_id]
+                    break
+        future.cancel()
+
+    def _prefilter_candidate_silos(self, metadata):
+        if self.metadata_index is not None:
+            return self.metadata_index.prefilter_candidate_silos(metadata)
+        return prefilter_candidate_silos(self.conn, metadata)
+
+    def _fetch_photos_by_metadata(self, metadata, silo_ids):
+        if self.metadata_index is not None:
+            return self.metadata_index.fetch_photos_by_metadata(metadata, silo_ids)
+        return fetch_photos_by_metadata(self.conn, metadata, silo_ids)
+
+    def _full_replicas(self, silo_id):
+        """
+        Return the followers holding every photo of the primary silo.
+        """
+        replica_counts = self.replica_counts.get(silo_id, {})
+        silo_count = self.silo_counts.get(silo_id, 0)
+        replicas = [r for r, count in replica_counts.items() if count >= silo_count]
+        return replicas or [silo_id]
+
+    def _assign_replicas(self, cand_silos):
+        """
+        Pick the least-loaded live follower with a full replica of each
+        candidate silo.
+
+        Returns ({follower silo_id: [(primary silo_id, count), ...]},
+                 [primary silo_ids without a live full replica])
+        """
+        assignment, unavailable = {}, []
+        for silo_id, num in cand_silos:
+            live = [r for r in self._full_replicas(silo_id)
+                    if r < len(self.followers) and self.followers[r]['status'] == 'alive']
+            if not live:
+                unavailable.append(silo_id)
                 continue
-            tcp_client(follower['host'], follower['port'], message)
+            chosen = min(live, key=lambda r: (
+                self.followers[r].get('inflight', 0) + len(assignment.get(r, [])),
+                r != silo_id
+            ))
+            assignment.setdefault(chosen, []).append((silo_id, num))
+        return assignment, unavailable
 
-    def mass_search(self, prompt_file_path):
+    def mass_search(self, prompt_file_path) -> List[SearchResult]:
+        """
+        Run the prompts of the file one after another, bypassing the result
+        cache, and return their results.
+        """
         prompts = []
         try:
             with open(prompt_file_path, 'r') as file:
                 lines = file.readlines()
                 for line in lines:
-                    prompts.append(line.strip())
+                    if line.strip():
+                        prompts.append(line.strip())
         except FileNotFoundError:
             print(f"Error: The file '{prompt_file_path}' was not found.")
-        self.pending_client_request['mass_search'] = {
-            'num_prompt': len(prompts),
-            'num_received': 0,
-            'extract_time': 0,
-            'vector_time': 0,
-            'query_time': 0
-        }
-        for prompt in prompts:
-            self.search(prompt)
-            time.sleep(0.5)
+        return [self.search(prompt, use_cache=False).result(timeout=SEARCH_TIMEOUT)
+                for prompt in prompts]
+
+    def profile(self, duration, mode='sample', target='all'):
+        """
+        Profile the leader and/or followers for duration seconds without
+        restarting them; a duration of 0 stops running profiles early.
+        target is 'leader', 'all' or a follower silo_id. Each node writes its
+        profile under its own base_dir.
+        """
+        if target in ('leader', 'all'):
+            if duration <= 0:
+                self.profiler.stop()
+            elif self.profiler.start(duration, mode, self.base_dir) is None:
+                print('Leader is already being profiled')
+        if target == 'leader':
+            return
+        message = {'message_type': 'profile', 'duration': duration, 'mode': mode}
+        for follower in self.followers:
+            if target != 'all' and follower['silo_id'] != int(target):
+                continue
+            if follower['status'] != 'alive':
+                continue
+            tcp_client(follower['host'], follower['port'], message)
+
+    def rebuild(self, target='all'):
+        """
+        Have followers rebuild their vector index in the background, dropping
+        deleted vectors. target is 'all' or a follower silo_id.
+        """
+        message = {'message_type': 'rebuild'}
+        for follower in self.followers:
+            if target != 'all' and follower['silo_id'] != int(target):
+                continue
+            if follower['status'] != 'alive':
+                continue
+            tcp_client(follower['host'], follower['port'], message)
 
     def clear(self):
         clear_all_photos(self.conn)
+        self.result_cache.bump_all()
+        if self.metadata_index is not None:
+            self.metadata_index.clear()
+        self.silo_counts, self.replica_counts = {}, {}
         LOGGER.info('Cleared photos in metadata database')
         message = {'message_type': 'clear'}
         for follower in self.followers:
+            if follower['status'] != 'alive':
+                continue
             tcp_client(follower['host'], follower['port'], message)
 
     def quit(self):
         message = {'message_type': 'quit'}
         for follower in self.followers:
+            if follower['status'] != 'alive':
+                continue
             tcp_client(follower['host'], follower['port'], message)
         self.signals['shutdown'] = True
         self.tcp_listen_thread.join()
@@ -261,11 +667,20 @@ class Leader:
         sys.exit(0)
 
     def _check_heartbeat(self):
+        metrics_path = os.path.join(self.base_dir, LEADER_METRICS_FILE)
+        last_dump = time.time()
         while not self.signals['shutdown']:
+            if time.time() - last_dump > METRICS_DUMP_INTERVAL:
+                os.makedirs(self.base_dir, exist_ok=True)
+                self.metrics.dump(metrics_path)
+                last_dump = time.time()
             for follower in self.followers:
                 if follower['status'] == 'alive' and \
                         time.time() - follower['heartbeat'] > FOLLOWER_TIMEOUT:
                     follower['status'] = 'dead'
+                    # Its searches will not be answered
+                    with self.requests_lock:
+                        follower['inflight'] = 0
                     LOGGER.info('Set follower %d to dead' % (follower['silo_id']))
             time.sleep(FOLLOWER_HEARTBEAT_INTERVAL)
 
@@ -275,36 +690,65 @@ class Leader:
                 self.followers[message_dict['silo_id']]['heartbeat'] = time.time()
 
     def _tcp_listen(self, message_dict):
+        self.profiler.call(self._handle_message, message_dict)
+
+    def _handle_message(self, message_dict):
         match message_dict['message_type']:
             case 'register':
                 self._handle_register(message_dict)
             case 'upload_reply':
                 self._handle_upload_reply(message_dict)
+            case 'replace_reply':
+                self._handle_replace_reply(message_dict)
             case 'search_result':
                 self._handle_search_result(message_dict)
             case 'get_result':
                 self._handle_search_result(message_dict, get_photo=True)
+            case 'profile':
+                self.profile(message_dict.get('duration', 0),
+                             message_dict.get('mode', 'sample'), 'leader')
 
     def _handle_register(self, message_dict):
         host = message_dict['host']
         port = message_dict['port']
-        for i, follower in enumerate(self.followers):
-            if follower['host'] == host and follower['port'] == port:
-                silo_id = i
-                follower['status'] = 'alive'
-                follower['heartbeat'] = time.time()
-                break
+        silo_id = message_dict.get('silo_id')
+        if silo_id is not None:
+            # Warm-restarted follower keeps its silo even if host:port changed
+            while len(self.followers) <= silo_id:
+                self.followers.append({
+                    'silo_id': len(self.followers),
+                    'host': None,
+                    'port': None,
+                    'status': 'dead',
+                    'heartbeat': 0
+                })
+            follower = self.followers[silo_id]
+            follower['host'] = host
+            follower['port'] = port
+            follower['status'] = 'alive'
+            follower['heartbeat'] = time.time()
+            with self.requests_lock:
+                follower['inflight'] = 0
         else:
-            silo_id = len(self.followers)
-            new_follower = {
-                'silo_id': silo_id,
-                'host': host,
-                'port': port,
-                'status': 'alive',
-                'heartbeat': time.time(),
-                'pending_message': {}
-            }
-            self.followers.append(new_follower)
+            for i, follower in enumerate(self.followers):
+                if follower['host'] == host and follower['port'] == port:
+                    silo_id = i
+                    follower['status'] = 'alive'
+                    follower['heartbeat'] = time.time()
+                    with self.requests_lock:
+                        follower['inflight'] = 0
+                    break
+            else:
+                silo_id = len(self.followers)
+                new_follower = {
+                    'silo_id': silo_id,
+                    'host': host,
+                    'port': port,
+                    'status': 'alive',
+                    'heartbeat': time.time(),
+                    'inflight': 0
+                }
+                self.followers.append(new_follower)
         message = {
             'message_type': 'register_ack',
             'silo_id': silo_id,
@@ -313,7 +757,9 @@ class Leader:
             'base_dir': self.base_dir,
             'model_name': self.model_name,
             'device': self.device,
-            'normalize': self.normalize
+            'normalize': self.normalize,
+            'backend': self.backend,
+            'num_threads': self.num_threads
         }
         try:
             tcp_client(host, port, message)
@@ -324,11 +770,54 @@ class Leader:
 
     def _handle_upload_reply(self, message_dict):
         silo_id = message_dict['silo_id']
+        if message_dict.get('error'):
+            LOGGER.warning(f'Follower {silo_id} failed to store upload '
+                           f'{message_dict.get("request_id")}: {message_dict["error"]}')
+            self._upload_replied(message_dict.get('request_id'), message_dict['error'])
+            return
         metadata = message_dict['metadata']
-        insert_new_photo(self.conn, silo_id, metadata)
+        inserted = insert_new_photo(self.conn, silo_id, metadata)
+        if inserted is not None:
+            primary_silo = metadata.get('primary_silo', silo_id)
+            if inserted:
+                self.silo_counts[primary_silo] = self.silo_counts.get(primary_silo, 0) + 1
+            replica_counts = self.replica_counts.setdefault(primary_silo, {})
+            replica_counts[silo_id] = replica_counts.get(silo_id, 0) + 1
+            if inserted:
+                self.result_cache.bump(primary_silo, metadata)
+                if self.metadata_index is not None:
+                    self.metadata_index.add_metadata(silo_id, metadata)
+        self._upload_replied(message_dict.get('request_id'))
         LOGGER.info(f'Inserted photo {metadata["photo_name"]} into metadata database.'
                     f'Assigned to follower {silo_id}')
 
+    def _upload_replied(self, request_id, error=None):
+        """
+        Call the send_upload callback of request_id on its first stored
+        reply, or once every follower it was sent to has failed.
+        """
+        with self.uploads_lock:
+            upload = self.upload_callbacks.get(request_id)
+            if upload is None:
+                return
+            if error is not None:
+                upload['errors'] += 1
+                upload['error'] = error
+                if upload['sent'] is None or upload['errors'] < upload['sent']:
+                    return
+            self.upload_callbacks.pop(request_id)
+        upload['on_reply'](request_id, error)
+
+    def _handle_replace_reply(self, message_dict):
+        row = update_photo(self.conn, message_dict['metadata'])
+        if row is None:
+            return
+        # Entries may have matched the old metadata or ranked the old vector
+        self.result_cache.bump(row[1])
+        if self.metadata_index is not None:
+            self.metadata_index.add(*row)
+        LOGGER.info(f'Updated photo {row[0]} replaced on follower {message_dict["silo_id"]}')
+
     def _handle_search_result(self, message_dict, get_photo=False):
         """
         Handle text-to-image search results coming back from a follower.
@@ -336,66 +825,150 @@ class Leader:
         silo_id = message_dict.get('silo_id')
         request_id = message_dict.get('request_id')
         partial_result = message_dict.get('results', [])
-        request = self.pending_client_request.get(request_id)
-        if not request:
-            LOGGER.warning(f'Receiving unknown search result from follower{silo_id}')
-            return
-        request['recipients'].remove(silo_id)
-        request['result'] += partial_result
-        if len(request['recipients']) > 0:
-            return
-
-        # If received results from all assigned followers
-        time_check4 = time.perf_counter()
-        if 'mass_search' in self.pending_client_request:
-            mass_request = self.pending_client_request['mass_search']
-            mass_request['num_received'] += 1
-            mass_request['extract_time'] += (request.get("second_check") -
-                                             request.get("first_check"))
-            mass_request['vector_time'] += (request.get("third_check") -
-                                            request.get("second_check"))
-            mass_request['query_time'] += time_check4 - request.get('third_check')
-            if mass_request['num_received'] < mass_request['num_prompt']:
+        with self.requests_lock:
+            request = self.pending_client_request.get(request_id)
+            if not request or silo_id not in request['recipients']:
+                # Unknown, or cancelled after timing out
+                LOGGER.warning(f'Receiving unknown search result from follower{silo_id}')
                 return
-            print(f'\n{"=" * 60}')
-            print(f'Search Mode: MASS_META_FUSION')
-            print(f'Prompt: {mass_request["num_prompt"]}')
-            print(f'Time of prompt metadata extraction: '
-                  f'{mass_request["extract_time"]: .4f} s')
-            print(f'Time of prompt vectorization: {mass_request["vector_time"]: .4f} s')
-            print(f'Time of query: {mass_request["query_time"]: .4f} s')
-            print(f'\n{"=" * 60}')
-            self.pending_client_request.pop('mass_search')
-            return
+            request['recipients'].remove(silo_id)
+            follower = self.followers[silo_id]
+            follower['inflight'] = max(follower.get('inflight', 0) - 1, 0)
+            for r in partial_result:
+                # Hits report the photo's primary silo; originals are fetched from
+                # the follower that answered
+                r['replica_silo'] = silo_id
+                r['silo_id'] = r.get('primary_silo', silo_id)
+            request['result'] += partial_result
+            request['stats']['vectors_scanned'] += message_dict.get('num_scanned', 0)
+            request['stats']['bytes_received'] += len(json.dumps(message_dict))
+            request['trace'].merge(message_dict.get('trace', {}), prefix='follower_')
+            if len(request['recipients']) > 0:
+                return
+            # If received results from all assigned followers
+            self.pending_client_request.pop(request_id)
+        time_check4 = time.perf_counter()
+        trace = request['trace']
         search_mode = request.get('search_mode', 'unknown')
-        print(f'\n{"="*60}')
-        print(f'Search Mode: {search_mode.upper()}')
-        print(f'Prompt: "{request["prompt"]}"')
-        print(f'Time Spent: {time_check4 - request.get("second_check"): .4f} s')
 
-        # Post filtering and print result photos
+        # Post filtering and rank result photos
         results = request['result']
         results = sorted(results, key=lambda x: x.get('score', 0))
-        results = results[:int(len(results) * VECTOR_SCORE_FILTER_PORTION)]
+        if search_mode != 'exact':
+            results = results[:int(len(results) * VECTOR_SCORE_FILTER_PORTION)]
         if search_mode == 'meta_fusion':
             results = [
                 r for r in results if r.get('photo_id') in request.get('cand_photo_ids')
             ]
-        print(f'Total Results: {len(results)}')
-        print(f'{"="*60}')
-        if not request['result']:
-            print("(no results)")
+        hits, downloads = [], {}
+        for r in results:
+            hit = SearchHit(r['photo_id'], r['photo_name'], r['silo_id'],
+                            score=r.get('score'), vector_id=r.get('vector_id'),
+                            photo_format=r.get('photo_format'))
+            if get_photo and message_dict.get('quality') == 'original':
+                # saved_path is set once the last chunk of the original is written
+                downloads[r['photo_id']] = (hit, r['replica_silo'])
+            elif get_photo and 'image_b64' in r:
+                image_bytes = base64.b64decode(r['image_b64'])
+                preview_name = (f'{os.path.splitext(r["photo_name"])[0]}.'
+                                f'{r["preview_format"]}')
+                hit.saved_path = os.path.join(message_dict['output_path'], preview_name)
+                save_image_bytes(image_bytes, hit.saved_path)
+            hits.append(hit)
+        if request.get('cache_key'):
+            self.result_cache.put(request['cache_key'], hits, request['generations'],
+                                  request['silo_ids'], request['metadata'])
+        trace.add('merge', time.perf_counter() - time_check4)
+        timing = {
+            'extract': request['second_check'] - request['first_check'],
+            'encode': request['third_check'] - request['second_check'],
+            'query': time_check4 - request['third_check'],
+            'total': time_check4 - request['first_check']
+        }
+        result = SearchResult(request['prompt'], search_mode, hits, timing,
+                              stats=request['stats'],
+                              unavailable_silos=request['unavailable_silos'],
+                              trace=self._finish_trace(trace, timing['total']))
+        if downloads:
+            self._start_downloads(request_id, downloads, message_dict['output_path'],
+                                  request['future'], result)
         else:
-            i = 1
-            for r in results:
-                score = r.get('score')
-                photo_name = r.get('photo_name')
-                print(f'{i}. Filename = {photo_name}, Score = {score: .4f}')
-                if get_photo:
-                    image_bytes = base64.b64decode(r['image_b64'])
-                    output_path = os.path.join(message_dict['output_path'], photo_name)
-                    save_image_bytes(image_bytes, output_path)
-                    print(f'   Saved to {output_path}')
-                i += 1
-        print(f'{"="*60}\n')
-        self.pending_client_request.pop(request_id)
+            _resolve(request['future'], result)
+
+    def _finish_trace(self, trace, total):
+        """
+        Record the spans of a finished search in the stage histograms and
+        return them.
+        """
+        trace.add('total', total)
+        self.metrics.record(trace)
+        LOGGER.debug('Trace of %s: %s', trace.request_id, trace.spans)
+        return trace.spans
+
+    def _start_downloads(self, request_id, downloads, output_path, future, result):
+        """
+        Have the followers stream the originals of a get and resolve future
+        to result once every one of them is written or has failed.
+
+        downloads is {photo_id: (hit, silo_id of the follower storing it)}.
+        """
+        with self.downloads_lock:
+            self.pending_downloads[request_id] = {
+                'hits': {photo_id: hit for photo_id, (hit, _) in downloads.items()},
+                'future': future,
+                'result': result
+            }
+        for photo_id, (_, silo_id) in downloads.items():
+            self.fetch_pool.submit(self._fetch_photo, silo_id, photo_id, request_id,
+                                   output_path)
+
+    def _fetch_photo(self, silo_id, photo_id, request_id, output_path):
+        """
+        Have the follower storing the photo stream the original back over a
+        connection of its own, so that the leader's TCP handler stays free.
+        """
+        follower = self.followers[silo_id]
+        message = {
+            'message_type': 'fetch_photo',
+            'request_id': request_id,
+            'photo_id': photo_id
+        }
+        saved_path = None
+        try:
+            with tcp_stream_listener(self.host, PHOTO_FETCH_TIMEOUT) as listener:
+                message['reply_port'] = listener.getsockname()[1]
+                tcp_client(follower['host'], follower['port'], message, PHOTO_FETCH_TIMEOUT)
+                stream = tcp_receive_stream(listener)
+                header = next(stream)
+                if header.get('error'):
+                    raise FileNotFoundError(header['error'])
+                path = os.path.join(output_path, header['photo_name'])
+                num_bytes = 0
+                with open(path, 'wb') as f:
+                    for chunk in stream:
+                        f.write(chunk)
+                        num_bytes += len(chunk)
+            if num_bytes != header['total_size']:
+                raise ConnectionError(f'received {num_bytes} of {header["total_size"]} bytes')
+            saved_path = path
+            print(f'Saved original {header["photo_name"]} to {saved_path}')
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f'Failed to fetch original {photo_id} from follower {silo_id}: {e}')
+        self._finish_download(request_id, photo_id, saved_path)
+
+    def _finish_download(self, request_id, photo_id, saved_path):
+        with self.downloads_lock:
+            download = self.pending_downloads.get(request_id)
+            if download is None or photo_id not in download['hits']:
+                return
+            download['hits'].pop(photo_id).saved_path = saved_path
+            if download['hits']:
+                return
+            self.pending_downloads.pop(request_id)
+        _resolve(download['future'], download['result'])
+
+
+def _resolve(future, result):
+    # The gateway cancels the future of a search it stopped waiting for
+    if future.set_running_or_notify_cancel():
+        future.set_result(result)
@@ -0,0 +1,261 @@
+# leader/metadata_index.py
+import itertools
+import threading
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+from utils import geohash
+from utils.config import GEO_GRID_PRECISION, GEO_GRID_MAX_CELLS
+
+# NULL timestamps are stored as the smallest int64
+TS_NULL = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class ColumnarMetadataIndex:
+    """
+    In-memory columnar mirror of photos_meta for the metadata prefilter.
+
+    Rows are kept in insertion order in NumPy columns: ts as int64 UTC
+    microseconds (TS_NULL for NULL), lat/lon as float32 (NaN for NULL),
+    silo_id as int16 and tags as int32 ids into a tag vocabulary (CSR layout).
+    Rows are also bucketed into a grid of GEO_GRID_PRECISION geohash cells,
+    so that a prompt with a location only evaluates the rows of the cells
+    covering it (plus the rows without a location). Filters are evaluated
+    as vectorized boolean masks with the same NULL semantics as the SQL of
+    leader.storage.store, so the mirror is a drop-in replacement for
+    prefilter_candidate_silos and fetch_photos_by_metadata.
+
+    Deleted rows, and the old rows of re-added photo_ids, are flagged in a
+    deleted column rather than removed, so rows never move.
+
+    Naive datetimes (prompt filters, EXIF timestamps) are taken as UTC, as
+    in the leader's Postgres session.
+    Camera fields are not mirrored and come back as None.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.lock = threading.Lock()
+        self._reset(capacity)
+
+    def _reset(self, capacity):
+        self.size = 0
+        self.photo_ids: List[str] = []
+        self.rows_by_id: Dict[str, int] = {}
+        self.photo_names: List[str] = []
+        self.ts = np.full(capacity, TS_NULL, dtype=np.int64)
+        self.lat = np.full(capacity, np.nan, dtype=np.float32)
+        self.lon = np.full(capacity, np.nan, dtype=np.float32)
+        self.silo_id = np.zeros(capacity, dtype=np.int16)
+        self.deleted = np.zeros(capacity, dtype=bool)
+        # NULL tags of photos stored before uploads were tagged
+        self.untagged = np.zeros(capacity, dtype=bool)
+        self.tag_vocab: Dict[str, int] = {}
+        # Tags of row i are tag_ids[tag_offsets[i]:tag_offsets[i + 1]]
+        self.tag_offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.tag_ids = np.zeros(capacity, dtype=np.int32)
+        self.grid: Dict[str, List[int]] = {}
+        self.no_location: List[int] = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the mirror from (photo_id, silo_id, photo_name, ts, lat, lon,
+        tags) rows, e.g. those of store.iter_photo_rows.
+        """
+        index = cls()
+        for photo_id, silo_id, photo_name, ts, lat, lon, tags in rows:
+            index.add(photo_id, silo_id, photo_name, ts, lat, lon, tags)
+        return index
+
+    def add(self, photo_id, silo_id, photo_name=None, ts: Optional[datetime] = None,
+            lat=None, lon=None, tags=None):
+        with self.lock:
+            if self.size == len(self.ts):
+                self._grow(2 * len(self.ts))
+            i = self.size
+            if photo_id in self.rows_by_id:
+                self.deleted[self.rows_by_id[photo_id]] = True
+            self.rows_by_id[photo_id] = i
+            self.photo_ids.append(photo_id)
+            self.photo_names.append(photo_name)
+            self.ts[i] = TS_NULL if ts is None else _to_micros(ts)
+            self.lat[i] = np.nan if lat is None else lat
+            self.lon[i] = np.nan if lon is None else lon
+            self.silo_id[i] = silo_id
+            self.untagged[i] = tags is None
+            if lat is None or lon is None:
+                self.no_location.append(i)
+            else:
+                self.grid.setdefault(geohash.encode(lat, lon, GEO_GRID_PRECISION), []).append(i)
+            tag_ids = [self.tag_vocab.setdefault(tag, len(self.tag_vocab)) for tag in tags or []]
+            start = self.tag_offsets[i]
+            if start + len(tag_ids) > len(self.tag_ids):
+                old = self.tag_ids
+                self.tag_ids = np.zeros(max(2 * len(old), start + len(tag_ids)), dtype=np.int32)
+                self.tag_ids[:start] = old[:start]
+            self.tag_ids[start:start + len(tag_ids)] = tag_ids
+            self.tag_offsets[i + 1] = start + len(tag_ids)
+            # Publish the row only once all its columns are written
+            self.size += 1
+
+    def add_metadata(self, silo_id, metadata):
+        """
+        Mirror a row inserted by store.insert_new_photo from the upload
+        metadata of a follower.
+        """
+        timestamp = metadata.get('timestamp')
+        if timestamp:
+            timestamp = datetime.strptime(timestamp, "%Y:%m:%d %H:%M:%S")
+        self.add(metadata['photo_id'], metadata.get('primary_silo', silo_id),
+                 metadata.get('photo_name'),
+                 timestamp or None, metadata.get('latitude'), metadata.get('longitude'),
+                 metadata.get('tags'))
+
+    def remove(self, photo_id):
+        with self.lock:
+            i = self.rows_by_id.pop(photo_id, None)
+            if i is not None:
+                self.deleted[i] = True
+
+    def clear(self):
+        with self.lock:
+            self._reset(1024)
+
+    def prefilter_candidate_silos(self, metadata):
+        """
+        [(silo_id, count), ...] of the rows passing metadata, by count
+        descending, like store.prefilter_candidate_silos.
+        """
+        rows, columns = self._select(metadata)
+        counts = np.bincount(columns['silo_id'][rows].astype(np.int64))
+        silo_ids = np.flatnonzero(counts)
+        order = np.argsort(-counts[silo_ids], kind='stable')
+        return [(int(silo_ids[i]), int(counts[silo_ids[i]])) for i in order]
+
+    def fetch_photos_by_metadata(self, metadata, silo_ids, limit=1000):
+        """
+        Rows passing metadata in the given silos, latest first (NULL
+        timestamps first, as in Postgres), like store.fetch_photos_by_metadata.
+        """
+        rows, columns = self._select(metadata)
+        rows = rows[np.isin(columns['silo_id'][rows], np.asarray(list(silo_ids), dtype=np.int16))]
+        ts = columns['ts'][rows]
+        # Postgres puts NULLs first in descending order
+        key = np.where(ts == TS_NULL, np.iinfo(np.int64).max, ts)
+        if limit is not None and len(rows) > limit:
+            top = np.argpartition(-key, limit)[:limit]
+            rows, key = rows[top], key[top]
+        rows = rows[np.argsort(-key, kind='stable')]
+        tag_names = {tag_id: tag for tag, tag_id in columns['tag_vocab'].items()}
+        return [self._row(i, columns, tag_names) for i in rows]
+
+    def _columns(self, cells=None):
+        # Rows [0, size) are never rewritten, so views taken under the lock
+        # stay valid while later rows are appended or the arrays regrown.
+        with self.lock:
+            n = self.size
+            if cells is None:
+                rows = np.arange(n)
+            else:
+                rows = np.fromiter(itertools.chain(
+                    self.no_location, *(self.grid.get(cell, ()) for cell in cells)
+                ), dtype=np.int64)
+            return rows, {
+                'ts': self.ts[:n],
+                'lat': self.lat[:n],
+                'lon': self.lon[:n],
+                'silo_id': self.silo_id[:n],
+                # Copied, as unlike the other columns it is updated in place
+                'deleted': self.deleted[:n].copy(),
+                'untagged': self.untagged[:n],
+                'photo_ids': self.photo_ids,
+                'photo_names': self.photo_names,
+                'tag_offsets': self.tag_offsets[:n + 1],
+                'tag_ids': self.tag_ids[:self.tag_offsets[n]],
+                'tag_vocab': dict(self.tag_vocab)
+            }
+
+    def _select(self, metadata):
+        """
+        Rows passing metadata, and the columns they index.
+        """
+        cells = None
+        if metadata.get('radius_km') is not None:
+            cells = geohash.covering_cells(metadata['min_lat'], metadata['max_lat'],
+                                           metadata['min_lon'], metadata['max_lon'],
+                                           GEO_GRID_PRECISION)
+            if len(cells) > GEO_GRID_MAX_CELLS:
+                cells = None
+        rows, columns = self._columns(cells)
+        ts, lat, lon = columns['ts'][rows], columns['lat'][rows], columns['lon'][rows]
+        start, end = _to_micros(metadata['start_ts']), _to_micros(metadata['end_ts'])
+        mask = ~columns['deleted'][rows]
+        mask &= (ts == TS_NULL) | ((ts >= start) & (ts <= end))
+        mask &= np.isnan(lat) | ((lat >= metadata['min_lat']) & (lat <= metadata['max_lat']))
+        mask &= np.isnan(lon) | ((lon >= metadata['min_lon']) & (lon <= metadata['max_lon']))
+        if metadata.get('radius_km') is not None:
+            distance = _haversine_km(metadata['center_lat'], metadata['center_lon'], lat, lon)
+            mask &= np.isnan(distance) | (distance <= metadata['radius_km'])
+        if metadata.get('any_tags'):
+            mask &= self._has_any_tag(rows, columns, metadata['any_tags'])
+        return rows[mask], columns
+
+    def _has_any_tag(self, rows, columns, tags):
+        """
+        Whether each row has NULL tags or one of tags.
+        """
+        query = [columns['tag_vocab'][tag] for tag in tags if tag in columns['tag_vocab']]
+        offsets = columns['tag_offsets']
+        start, lengths = offsets[rows], offsets[rows + 1] - offsets[rows]
+        # Positions in tag_ids of the tags of the rows, row after row
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(start - ends + lengths,
+                                                                         lengths)
+        # Running count of matching tags, so a row's matches are a difference
+        hits = np.concatenate(([0], np.cumsum(np.isin(columns['tag_ids'][positions], query))))
+        return columns['untagged'][rows] | (hits[ends] > hits[ends - lengths])
+
+    def _row(self, i, columns, tag_names):
+        ts, lat, lon = columns['ts'][i], columns['lat'][i], columns['lon'][i]
+        tags = None if columns['untagged'][i] else [
+            tag_names[t] for t in
+            columns['tag_ids'][columns['tag_offsets'][i]:columns['tag_offsets'][i + 1]]]
+        return {
+            "photo_id": columns['photo_ids'][i],
+            "silo_id": int(columns['silo_id'][i]),
+            "photo_name": columns['photo_names'][i],
+            "ts": None if ts == TS_NULL else _EPOCH + int(ts) * _MICROSECOND,
+            "lat": None if np.isnan(lat) else float(lat),
+            "lon": None if np.isnan(lon) else float(lon),
+            "cam_make": None,
+            "cam_model": None,
+            "tags": tags,
+        }
+
+    def _grow(self, capacity):
+        for name, fill in (('ts', TS_NULL), ('lat', np.nan), ('lon', np.nan), ('silo_id', 0),
+                           ('deleted', False), ('untagged', False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        tag_offsets = np.zeros(capacity + 1, dtype=np.int64)
+        tag_offsets[:len(self.tag_offsets)] = self.tag_offsets
+        self.tag_offsets = tag_offsets
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    # Vectorized utils.geohash.haversine_km; NaN where lat2 or lon2 is NaN
+    lat1, lon1 = np.radians(lat1), np.radians(lon1)
+    lat2, lon2 = np.radians(lat2.astype(np.float64)), np.radians(lon2.astype(np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * geohash.EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(a), 1.0))
+
+
+def _to_micros(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // _MICROSECOND
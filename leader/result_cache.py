@@ -0,0 +1,147 @@
+# leader/result_cache.py
+import copy
+import json
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from utils.geohash import haversine_km
+
+
+class ResultCache:
+    """
+    LRU cache of final search results keyed by (normalized prompt, search_mode, k).
+
+    Every entry remembers the generation of each silo it read. An upload to a
+    silo bumps its generation, which makes the entries over that silo stale.
+    An upload to a silo an entry did not read evicts the entry only if the new
+    photo passes the entry's metadata filter (None filters pass every photo).
+    A search takes a snapshot before it picks the silos to read, and its
+    result is only cached if none of those silos changed since and none of
+    the last max_bumps uploads to other silos passes its metadata filter.
+    Results are copied in and out, so callers may modify them.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, max_bumps: int = 10000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.generations = {}
+        # Last (seq, silo_id, photo_metadata) bumps; silo_id None for bump_all
+        self.bumps = deque(maxlen=max_bumps)
+        self.seq = 0
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, search_mode, k):
+        return ' '.join(prompt.lower().split()), search_mode, k
+
+    def snapshot(self):
+        """
+        Return the current state of the silos, to be taken before the search
+        picks its candidate silos and passed to put.
+        """
+        with self.lock:
+            return self.seq, dict(self.generations)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if any(self.generations.get(s, 0) != g
+                   for s, g in entry['generations'].items()):
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            results = entry['results']
+        return copy.deepcopy(results)
+
+    def put(self, key, results, snapshot, silo_ids, metadata=None):
+        """
+        Cache the results of a search that read silo_ids, given the snapshot
+        taken when it started.
+        """
+        size = len(json.dumps(results, default=str))
+        if size > self.max_bytes:
+            return
+        results = copy.deepcopy(results)
+        seq, generations = snapshot
+        with self.lock:
+            if any(self.generations.get(s, 0) != generations.get(s, 0) for s in silo_ids):
+                # A silo it read changed while the search was in flight
+                return
+            if self.seq - seq > len(self.bumps) or any(
+                    s is None or _matches(metadata, photo_metadata)
+                    for bump_seq, s, photo_metadata in self.bumps
+                    if bump_seq > seq and s not in silo_ids):
+                # Another silo may have gained a photo the prefilter would now
+                # pass, or too many uploads happened to tell
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = {
+                'results': results,
+                'generations': {s: generations.get(s, 0) for s in silo_ids},
+                'metadata': metadata,
+                'size': size
+            }
+            self.num_bytes += size
+            while len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def bump(self, silo_id, photo_metadata=None):
+        """
+        Invalidate the entries affected by a new photo stored in silo_id.
+        """
+        with self.lock:
+            self.generations[silo_id] = self.generations.get(silo_id, 0) + 1
+            self.seq += 1
+            self.bumps.append((self.seq, silo_id, photo_metadata))
+            stale = [
+                key for key, entry in self.entries.items()
+                if silo_id not in entry['generations']
+                and _matches(entry['metadata'], photo_metadata)
+            ]
+            for key in stale:
+                self._remove(key)
+
+    def bump_all(self):
+        with self.lock:
+            for silo_id in self.generations:
+                self.generations[silo_id] += 1
+            self.seq += 1
+            self.bumps.append((self.seq, None, None))
+            self.entries.clear()
+            self.num_bytes = 0
+
+    def _remove(self, key):
+        self.num_bytes -= self.entries.pop(key)['size']
+
+
+def _matches(metadata, photo_metadata):
+    """
+    Whether a photo passes a prompt metadata filter, with the same NULL
+    semantics as prefilter_candidate_silos.
+    """
+    if metadata is None or photo_metadata is None:
+        return True
+    timestamp = photo_metadata.get('timestamp')
+    if timestamp:
+        ts = datetime.strptime(timestamp, "%Y:%m:%d %H:%M:%S")
+        if not metadata['start_ts'] <= ts <= metadata['end_ts']:
+            return False
+    lat, lon = photo_metadata.get('latitude'), photo_metadata.get('longitude')
+    if lat is not None and not metadata['min_lat'] <= lat <= metadata['max_lat']:
+        return False
+    if lon is not None and not metadata['min_lon'] <= lon <= metadata['max_lon']:
+        return False
+    if lat is not None and lon is not None and metadata.get('radius_km') is not None and \
+            haversine_km(metadata['center_lat'], metadata['center_lon'], lat, lon) \
+            > metadata['radius_km']:
+        return False
+    tags = photo_metadata.get('tags')
+    if tags is not None and metadata.get('any_tags') and \
+            not set(tags) & set(metadata['any_tags']):
+        return False
+    return True
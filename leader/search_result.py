@@ -0,0 +1,55 @@
+# leader/search_result.py
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+@dataclass
+class SearchHit:
+    """A ranked photo returned by a search."""
+    photo_id: str
+    photo_name: str
+    silo_id: Optional[int] = None
+
+    # Vector search fields; None for metadata_only hits
+    score: Optional[float] = None
+    vector_id: Optional[int] = None
+    photo_format: Optional[str] = None
+
+    # Metadata fields; only filled for metadata_only hits
+    ts: Optional[datetime] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+    # Where a get saved the photo; None if its original could not be fetched
+    saved_path: Optional[str] = None
+
+
+@dataclass
+class SearchResult:
+    """Ranked hits of a search and its timing breakdown in seconds."""
+    prompt: str
+    search_mode: str
+    hits: List[SearchHit] = field(default_factory=list)
+
+    # 'extract': prompt parsing and metadata prefilter
+    # 'encode':  prompt text encoding
+    # 'query':   follower dispatch, search and merge
+    # 'total':   end to end
+    timing: Dict[str, float] = field(default_factory=dict)
+    cached: bool = False
+
+    # 'silos':           primary silos searched
+    # 'followers':       followers the search was sent to
+    # 'vectors_scanned': vectors compared by the followers
+    # 'bytes_sent':      JSON bytes of the search messages
+    # 'bytes_received':  JSON bytes of the follower replies
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    # Candidate silos without a live follower storing all their photos; the
+    # hits miss their photos
+    unavailable_silos: List[int] = field(default_factory=list)
+
+    # Per-stage spans in seconds (see utils.tracing); follower stages are
+    # prefixed 'follower_' and taken from the slowest follower
+    trace: Dict[str, float] = field(default_factory=dict)
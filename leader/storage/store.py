@@ -1,9 +1,18 @@
 # leader/storage/store.py
 import psycopg2
 from datetime import datetime
-from psycopg2.extras import register_default_jsonb
+from psycopg2.extras import execute_batch, register_default_jsonb
+from utils import geohash
 from utils.config import *
 
+# Great-circle distance in km from the prompt location, for radius queries
+_DISTANCE_SQL = """
+    2 * %(earth_radius_km)s * asin(least(1, sqrt(
+        power(sin(radians(lat - %(center_lat)s) / 2), 2)
+        + cos(radians(%(center_lat)s)) * cos(radians(lat))
+        * power(sin(radians(lon - %(center_lon)s) / 2), 2))))
+"""
+
 
 def init_metadata_table(
         database=DB_NAME, username=DB_USERNAME, password=DB_PASSWORD,
@@ -13,9 +22,11 @@ def init_metadata_table(
     Initialize the global metadata table in PostgreSQL.
     """
     register_default_jsonb(loads=None)
+    # Naive EXIF timestamps and prompt ranges are UTC, as in the in-memory
+    # metadata mirror, whatever the server's time zone
     conn = psycopg2.connect(
         database=database, user=username, password=password,
-        host=host, port=port
+        host=host, port=port, options='-c TimeZone=UTC'
     )
     conn.autocommit = True
     cur = conn.cursor()
@@ -31,44 +42,114 @@ def init_metadata_table(
             cam_make    TEXT,
             cam_model   TEXT,
             tags        TEXT[] DEFAULT '{{}}',
-            extra       JSONB  DEFAULT '{{}}'::jsonb
+            extra       JSONB  DEFAULT '{{}}'::jsonb,
+            replicas    INTEGER[] DEFAULT '{{}}'
         );
     """)
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS replicas INTEGER[] DEFAULT '{{}}';")
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS geohash TEXT;")
 
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_silo_ts ON {table}(silo_id, ts);")
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_tags ON {table} USING GIN(tags);")
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_lat_lon ON {table}(lat, lon);")
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table}(ts);")
+    # Prefix (LIKE 'abc%') scans over the geohash cells covering a location
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_geohash "
+                f"ON {table}(geohash text_pattern_ops);")
 
     cur.close()
+    _backfill_geohash(conn, table)
     return conn
 
 
+def reset_database(
+        database, username=DB_USERNAME, password=DB_PASSWORD,
+        host=DB_HOST, port=DB_PORT
+):
+    """
+    Drop and re-create a scratch database, e.g. for a benchmark that must
+    not touch the tables of a live deployment.
+    """
+    conn = psycopg2.connect(
+        database='postgres', user=username, password=password,
+        host=host, port=port
+    )
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'DROP DATABASE IF EXISTS {database};')
+    cur.execute(f'CREATE DATABASE {database};')
+    cur.close()
+    conn.close()
+
+
+def _backfill_geohash(conn, table=DB_LEADER_TABLE_NAME):
+    """
+    Fill in the geohash of rows stored before the column existed.
+    """
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT photo_id, lat, lon FROM {table}
+        WHERE geohash IS NULL AND lat IS NOT NULL AND lon IS NOT NULL
+    """)
+    rows = cur.fetchall()
+    if rows:
+        execute_batch(
+            cur, f"UPDATE {table} SET geohash = %s WHERE photo_id = %s",
+            [(geohash.encode(lat, lon, GEOHASH_PRECISION), photo_id)
+             for photo_id, lat, lon in rows]
+        )
+        LOGGER.info('Backfilled the geohash of %d photos', len(rows))
+    cur.close()
+
+
 def insert_new_photo(conn, silo_id, metadata, table=DB_LEADER_TABLE_NAME):
+    """
+    Record that follower silo_id stores the photo. The first reply inserts
+    the row under its primary silo; replies from other replicas are appended
+    to the replicas column.
+
+    Returns True if the row was inserted, False if a replica was appended and
+    None if the reply was a duplicate.
+    """
     cur = conn.cursor()
     timestamp = metadata.get('timestamp')
     if timestamp:
         timestamp = datetime.strptime(timestamp, "%Y:%m:%d %H:%M:%S")
+    lat, lon = metadata.get('latitude'), metadata.get('longitude')
+    cell = geohash.encode(lat, lon, GEOHASH_PRECISION) \
+        if lat is not None and lon is not None else None
     cur.execute(
         f"""
         INSERT INTO {table}
-        (photo_id, silo_id, photo_name, ts, lat, lon, cam_make, cam_model, tags, extra)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        (photo_id, silo_id, photo_name, ts, lat, lon, cam_make, cam_model, tags, extra,
+         replicas, geohash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, ARRAY[%s]::INTEGER[], %s)
+        ON CONFLICT (photo_id) DO UPDATE
+            SET replicas = array_append({table}.replicas, %s)
+            WHERE NOT %s = ANY({table}.replicas)
+        RETURNING (xmax = 0) AS inserted
         """,
         (
             metadata.get('photo_id'),
-            silo_id,
+            metadata.get('primary_silo', silo_id),
             metadata.get('photo_name'),
             timestamp,
-            metadata.get('latitude'),
-            metadata.get('longitude'),
+            lat,
+            lon,
             metadata.get('camera_make'),
             metadata.get('camera_model'),
+            # NULL only for photos stored before uploads were tagged
+            metadata.get('tags'),
             None,
-            None,
+            silo_id,
+            cell,
+            silo_id,
+            silo_id,
         )
     )
+    row = cur.fetchone()
     cur.close()
+    return row[0] if row else None
 
 
 def clear_all_photos(conn, table='photos_meta'):
@@ -88,6 +169,33 @@ def query_by_photo_id(conn, photo_id, table=DB_LEADER_TABLE_NAME):
     return rows
 
 
+def iter_photo_rows(conn, batch_size=100000, table=DB_LEADER_TABLE_NAME):
+    """
+    Stream (photo_id, silo_id, photo_name, ts, lat, lon, tags) of every photo
+    through a server-side cursor, batch_size rows at a time.
+    """
+    cur = conn.cursor(name=f'{table}_scan', withhold=True)
+    cur.itersize = batch_size
+    cur.execute(f"SELECT photo_id, silo_id, photo_name, ts, lat, lon, tags FROM {table}")
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+def query_existing_photo_ids(conn, photo_ids, table=DB_LEADER_TABLE_NAME):
+    """
+    Return the subset of photo_ids already stored, in one query.
+    """
+    if not photo_ids:
+        return set()
+    cur = conn.cursor()
+    cur.execute(f"SELECT photo_id FROM {table} WHERE photo_id = ANY(%s)", (list(photo_ids),))
+    rows = cur.fetchall()
+    cur.close()
+    return {row[0] for row in rows}
+
+
 def query_photo_num(conn, table=DB_LEADER_TABLE_NAME):
     cur = conn.cursor()
     cur.execute(f"""
@@ -98,28 +206,52 @@ def query_photo_num(conn, table=DB_LEADER_TABLE_NAME):
     return row
 
 
+def query_replica_counts(conn, table=DB_LEADER_TABLE_NAME):
+    """
+    Return ({silo_id: num photos}, {silo_id: {replica silo_id: num photos}})
+    for every primary silo. Rows stored before replication count as replicated
+    on their primary silo only.
+    """
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT silo_id, replica, COUNT(*)
+        FROM {table},
+            unnest(CASE WHEN cardinality(replicas) > 0
+                        THEN replicas ELSE ARRAY[silo_id] END) AS replica
+        GROUP BY silo_id, replica
+    """)
+    replica_rows = cur.fetchall()
+    cur.execute(f"SELECT silo_id, COUNT(*) FROM {table} GROUP BY silo_id")
+    silo_rows = cur.fetchall()
+    cur.close()
+    silo_counts = {silo_id: count for silo_id, count in silo_rows}
+    replica_counts = {}
+    for silo_id, replica, count in replica_rows:
+        replica_counts.setdefault(silo_id, {})[replica] = count
+    return silo_counts, replica_counts
+
+
 def prefilter_candidate_silos(conn, metadata, limit=None, table=DB_LEADER_TABLE_NAME):
     """
     Prefilter silos based on metadata, returning matching counts per silo:
     [(silo_id, count), ...] sorted by count descending
     """
     cur = conn.cursor()
+    where, params = _metadata_filter(metadata)
 
     sql = f"""
         SELECT silo_id, COUNT(*) AS cnt
         FROM {table}
-        WHERE (ts IS NULL OR ts >= %(start_ts)s AND ts <= %(end_ts)s)
-            AND (lat IS NULL OR lat >= %(min_lat)s AND lat <= %(max_lat)s)
-            AND (lon IS NULL OR lon >= %(min_lon)s AND lon <= %(max_lon)s)
+        WHERE {where}
         GROUP BY silo_id
         ORDER BY cnt DESC
     """
 
     if limit is not None:
         sql += " LIMIT %(limit)s"
-        metadata["limit"] = limit
+        params["limit"] = limit
 
-    cur.execute(sql, metadata)
+    cur.execute(sql, params)
     rows = cur.fetchall()
     cur.close()
     return rows
@@ -136,22 +268,21 @@ def fetch_photos_by_metadata(conn, metadata, silo_ids, limit=1000,
       - Grouping by silo_id to send each follower the list of photo_ids they need to search
     """
     cur = conn.cursor()
+    where, params = _metadata_filter(metadata)
 
     sql = f"""
         SELECT photo_id, silo_id, photo_name, ts, lat, lon, cam_make, cam_model, tags
         FROM {table}
-        WHERE (ts IS NULL OR ts >= %(start_ts)s AND ts <= %(end_ts)s)
-            AND (lat IS NULL OR lat >= %(min_lat)s AND lat <= %(max_lat)s)
-            AND (lon IS NULL OR lon >= %(min_lon)s AND lon <= %(max_lon)s)
+        WHERE {where}
             AND silo_id = ANY(%(silo_ids)s)
         ORDER BY ts DESC
         LIMIT %(limit)s
     """
 
-    metadata["limit"] = limit
-    metadata["silo_ids"] = silo_ids
+    params["limit"] = limit
+    params["silo_ids"] = silo_ids
 
-    cur.execute(sql, metadata)
+    cur.execute(sql, params)
     rows = cur.fetchall()
     cur.close()
 
@@ -170,3 +301,100 @@ def fetch_photos_by_metadata(conn, metadata, silo_ids, limit=1000,
             "tags": tags,
         })
     return results
+
+
+def _metadata_filter(metadata):
+    """
+    Return the WHERE clause of a prompt metadata filter and its parameters.
+
+    Photos without a time or location pass the corresponding filter, and
+    photos stored before uploads were tagged (NULL tags) the tag filter;
+    other photos must have one of any_tags (a GIN lookup), so those the
+    tagger found no tag for ('{}') are pruned. If the
+    prompt names a location (radius_km is set), rows must also lie in one of
+    the geohash cells covering its bounding box, so the scan only touches
+    those cells, and within radius_km of its center.
+    """
+    params = dict(metadata)
+    where = """(ts IS NULL OR ts >= %(start_ts)s AND ts <= %(end_ts)s)
+            AND (lat IS NULL OR lat >= %(min_lat)s AND lat <= %(max_lat)s)
+            AND (lon IS NULL OR lon >= %(min_lon)s AND lon <= %(max_lon)s)"""
+    if metadata.get('any_tags'):
+        # Rows uploaded before tags were stored have NULL tags
+        where += "\n            AND (tags IS NULL OR tags && %(any_tags)s::TEXT[])"
+        params['any_tags'] = list(metadata['any_tags'])
+    if metadata.get('radius_km') is not None:
+        cells = geohash.cover(metadata['min_lat'], metadata['max_lat'],
+                              metadata['min_lon'], metadata['max_lon'],
+                              GEO_MAX_CELLS, GEOHASH_PRECISION)
+        geo_where = f"{_DISTANCE_SQL} <= %(radius_km)s"
+        if cells:
+            cell_where = ' OR '.join(f"geohash LIKE %(geo_cell_{i})s" for i in range(len(cells)))
+            geo_where = f"({cell_where}) AND {geo_where}"
+            params.update({f'geo_cell_{i}': cell + '%' for i, cell in enumerate(cells)})
+        where += f"\n            AND (geohash IS NULL OR {geo_where})"
+        params['earth_radius_km'] = geohash.EARTH_RADIUS_KM
+    return where, params
+
+
+def delete_photo(conn, photo_id, table=DB_LEADER_TABLE_NAME):
+    """
+    Delete photo_id and return its (silo_id, replicas), or None if it is not
+    stored.
+    """
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM {table} WHERE photo_id = %s RETURNING silo_id, replicas",
+                (photo_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+
+def update_photo(conn, metadata, table=DB_LEADER_TABLE_NAME):
+    """
+    Overwrite the columns of metadata['photo_id'] given in metadata (e.g. after
+    the photo was replaced or re-tagged) and return its
+    (photo_id, silo_id, photo_name, ts, lat, lon, tags), or None if it is not
+    stored.
+    """
+    columns = {}
+    if 'timestamp' in metadata:
+        timestamp = metadata['timestamp']
+        columns['ts'] = datetime.strptime(timestamp, "%Y:%m:%d %H:%M:%S") if timestamp else None
+    if 'latitude' in metadata and 'longitude' in metadata:
+        lat, lon = metadata['latitude'], metadata['longitude']
+        columns['lat'], columns['lon'] = lat, lon
+        columns['geohash'] = geohash.encode(lat, lon, GEOHASH_PRECISION) \
+            if lat is not None and lon is not None else None
+    for key, column in (('photo_name', 'photo_name'), ('camera_make', 'cam_make'),
+                        ('camera_model', 'cam_model')):
+        if key in metadata:
+            columns[column] = metadata[key]
+    if 'tags' in metadata:
+        columns['tags'] = metadata['tags'] or []
+    if not columns:
+        return None
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        UPDATE {table}
+        SET {', '.join(f'{column} = %({column})s' for column in columns)}
+        WHERE photo_id = %(photo_id)s
+        RETURNING photo_id, silo_id, photo_name, ts, lat, lon, tags
+        """,
+        columns | {'photo_id': metadata['photo_id']}
+    )
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+
+def query_replicas(conn, photo_id, table=DB_LEADER_TABLE_NAME):
+    """
+    Return the (silo_id, replicas) of photo_id, or None if it is not stored.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT silo_id, replicas FROM {table} WHERE photo_id = %s", (photo_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row
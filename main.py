@@ -1,14 +1,81 @@
 import os
 import sys
 import time
+import concurrent.futures
 
 import typer
-from leader.leader import Leader
-from follower.follower import Follower
 
 app = typer.Typer(help='MetaFusion distributed photo system CLI')
 
 
+def print_search_result(result):
+    """Print a SearchResult returned by Leader.search."""
+    print(f'\n{"=" * 60}')
+    print(f'Search Mode: {result.search_mode.upper()}{" (cached)" if result.cached else ""}')
+    print(f'Prompt: "{result.prompt}"')
+    print('Time Spent: ' + ', '.join(f'{stage} {seconds: .4f} s'
+                                     for stage, seconds in result.timing.items()))
+    print(f'Total Results: {len(result.hits)}')
+    print(f'{"=" * 60}')
+    if not result.hits:
+        print("(no results)")
+    for i, hit in enumerate(result.hits):
+        if hit.score is None:
+            print(f'{i + 1}. Filename = {hit.photo_name}')
+        else:
+            print(f'{i + 1}. Filename = {hit.photo_name}, Score = {hit.score: .4f}')
+        if hit.saved_path:
+            print(f'   Saved to {hit.saved_path}')
+    print(f'{"=" * 60}\n')
+
+
+def print_mass_search_result(results):
+    """Print the summed timing of the results of Leader.mass_search."""
+    print(f'\n{"=" * 60}')
+    print(f'Search Mode: MASS_META_FUSION')
+    print(f'Prompt: {len(results)}')
+    for stage, label in (('extract', 'prompt metadata extraction'),
+                         ('encode', 'prompt vectorization'),
+                         ('query', 'query')):
+        total = sum(r.timing.get(stage, 0) for r in results)
+        print(f'Time of {label}: {total: .4f} s')
+    print(f'\n{"=" * 60}')
+
+
+def print_evaluation(evaluation):
+    """Print the per-mode table of a leader.evaluation.Evaluation."""
+    def fmt(value, spec):
+        return 'n/a' if value is None else format(value, spec)
+
+    print(f'\n{"=" * 60}')
+    print(f'Prompt: "{evaluation.prompt}"')
+    print(f'Relevant photos (exact top-{evaluation.k} under the metadata filter): '
+          f'{fmt(evaluation.num_relevant, ".1f")}')
+    print(f'{"=" * 60}')
+    print(f'{"Mode":<15}{"Recall":>8}{"Prec.":>8}{"Time(s)":>9}{"Silos":>7}'
+          f'{"Scanned":>9}{"KB":>9}')
+    print('-' * 65)
+    for mode in evaluation.modes:
+        stats = mode.stats
+        kb = (stats.get('bytes_sent', 0) + stats.get('bytes_received', 0)) / 1024
+        print(f'{mode.search_mode:<15}{fmt(mode.recall, ".3f"):>8}'
+              f'{fmt(mode.precision, ".3f"):>8}{mode.latency:>9.4f}'
+              f'{stats.get("silos", 0):>7.0f}{stats.get("vectors_scanned", 0):>9.0f}'
+              f'{kb:>9.1f}')
+    print(f'{"=" * 60}\n')
+
+
+def run_search(leader_node, *args, **kwargs):
+    """Run a search from the REPL and print its result."""
+    from utils.config import SEARCH_TIMEOUT
+    try:
+        print_search_result(leader_node.search(*args, **kwargs).result(SEARCH_TIMEOUT))
+    except concurrent.futures.TimeoutError:
+        print(f'Search timed out after {SEARCH_TIMEOUT} s')
+    except RuntimeError as e:
+        print(e)
+
+
 @app.command()
 def leader(
         host: str = typer.Option('localhost', help='Leader IP address'),
@@ -20,10 +87,29 @@ def leader(
         device: str = typer.Option('cpu',
                                    help='Follower image embedding model device'),
         normalize: bool = typer.Option(True,
-                                       help='Follower image embedding normalization')
+                                       help='Follower image embedding normalization'),
+        backend: str = typer.Option('eager',
+                                    help='Image embedding inference backend: '
+                                         'eager, int8, compile or script'),
+        num_threads: int = typer.Option(None,
+                                        help='Torch threads for embedding inference'),
+        replication_factor: int = typer.Option(1,
+                                               help='Number of followers storing each photo'),
+        http_port: int = typer.Option(None,
+                                      help='Serve the HTTP query gateway on this port'),
+        metadata_mirror: bool = typer.Option(False,
+                                             help='Prefilter on an in-memory columnar '
+                                                  'mirror of the metadata table'),
+        db_name: str = typer.Option('meta_fusion',
+                                    help='PostgreSQL database of the metadata table')
 ):
     """Start the leader node."""
-    leader_node = Leader(host, port, base_dir, model_name, device, normalize)
+    from leader.leader import Leader
+    leader_node = Leader(host, port, base_dir, model_name, device, normalize,
+                         backend, num_threads, replication_factor, metadata_mirror, db_name)
+    if http_port is not None:
+        from leader.gateway import QueryGateway
+        QueryGateway(leader_node, host, http_port).start()
 
     # If the Leader doesn't include an extractor, you can create one here in main:
 
@@ -44,6 +130,18 @@ def leader(
                     leader_node.list_member()
                 case 'ls_num_photo':
                     leader_node.list_num_photo()
+                case 'metrics':
+                    print(leader_node.metrics.to_prometheus())
+                case 'profile':
+                    parts = arg.split()
+                    if not parts or not parts[0].replace('.', '', 1).isdigit():
+                        print('Usage: profile <seconds> <optional sample|cprofile> '
+                              '<optional leader|all|silo_id>')
+                        continue
+                    try:
+                        leader_node.profile(float(parts[0]), *parts[1:3])
+                    except ValueError as e:
+                        print(e)
                 case 'upload':
                     if not arg:
                         print('Usage: upload <image path>')
@@ -55,45 +153,98 @@ def leader(
                     leader_node.mass_upload(arg)
                 case 'upload_from_msgpack':
                     leader_node.upload_from_msgpack(arg)
+                case 'delete':
+                    if not arg:
+                        print('Usage: delete <photo_id>')
+                        continue
+                    leader_node.delete(arg)
+                case 'replace':
+                    parts = arg.split(maxsplit=1)
+                    if not parts:
+                        print('Usage: replace <photo_id> <optional new image path>')
+                        continue
+                    leader_node.replace(*parts)
+                case 'rebuild':
+                    try:
+                        leader_node.rebuild(arg or 'all')
+                    except ValueError:
+                        print('Usage: rebuild <optional silo_id>')
                 case 'clear':
                     leader_node.clear()
                 case 'search':
                     if not arg:
                         print("Usage: search <natural language prompt>")
                         continue
-                    leader_node.search(arg, search_mode='meta_fusion')
+                    run_search(leader_node, arg, search_mode='meta_fusion')
                 case 'mass_search':
                     if not arg:
                         print("Usage: mass_search <prompt file>")
                         continue
-                    leader_node.mass_search(arg)
+                    try:
+                        print_mass_search_result(leader_node.mass_search(arg))
+                    except concurrent.futures.TimeoutError:
+                        print('Mass search timed out')
                 case 'search_metadata':
                     if not arg:
                         print("Usage: search_metadata <natural language prompt>")
                         continue
-                    leader_node.search(arg, search_mode='metadata_only')
+                    run_search(leader_node, arg, search_mode='metadata_only')
                 case 'search_vector':
                     if not arg:
                         print("Usage: search_vector <natural language prompt>")
                         continue
-                    leader_node.search(arg, search_mode='vector_only')
+                    run_search(leader_node, arg, search_mode='vector_only')
+                case 'compare':
+                    if not arg:
+                        print("Usage: compare <natural language prompt>")
+                        continue
+                    from leader.evaluation import evaluate
+                    try:
+                        print_evaluation(evaluate(leader_node, arg))
+                    except concurrent.futures.TimeoutError:
+                        print('Compare timed out')
+                case 'evaluate':
+                    if not os.path.isfile(arg):
+                        print("Usage: evaluate <prompt file>")
+                        continue
+                    from leader.evaluation import evaluate_prompts
+                    with open(arg, 'r') as file:
+                        prompts = [line.strip() for line in file if line.strip()]
+                    try:
+                        print_evaluation(evaluate_prompts(leader_node, prompts))
+                    except concurrent.futures.TimeoutError:
+                        print('Evaluate timed out')
                 case 'get':
                     parts = arg.split(maxsplit=1)
                     if len(parts) <= 1:
                         print('Usage: get <output directory> <natural language prompt>')
                         continue
-                    leader_node.search(parts[1], parts[0], search_mode='meta_fusion')
+                    run_search(leader_node, parts[1], parts[0], search_mode='meta_fusion')
+                case 'get_original':
+                    parts = arg.split(maxsplit=1)
+                    if len(parts) <= 1:
+                        print('Usage: get_original <output directory> <natural language prompt>')
+                        continue
+                    run_search(leader_node, parts[1], parts[0], search_mode='meta_fusion',
+                               quality='original')
                 case 'help':
                     print("\n可用命令:")
                     print("  ls                          - 列出所有follower节点")
                     print("  upload <path>               - 上传单张图片")
                     print("  mass_upload <dir>           - 批量上传图片目录")
+                    print("  delete <photo_id>           - 删除单张图片")
+                    print("  replace <photo_id> [path]   - 重新编码图片, 或替换为新图片")
+                    print("  rebuild [silo_id]           - 在后台重建follower的向量索引")
                     print("  clear                       - 清空所有数据")
                     print("  search <prompt>             - MetaFusion搜索 (默认)")
                     print("  search_metadata <prompt>    - 仅元数据搜索")
                     print("  search_vector <prompt>      - 仅向量搜索")
                     print("  compare <prompt>            - 比较三种搜索方法")
-                    print("  get <dir> <prompt>          - 搜索并下载图片")
+                    print("  evaluate <file>             - 在提示词文件上评估三种搜索方法")
+                    print("  metrics                     - 显示各阶段延迟直方图")
+                    print("  profile <sec> [mode] [node] - 在运行时对节点进行性能剖析")
+                    print("  get <dir> <prompt>          - 搜索并下载预览图")
+                    print("  get_original <dir> <prompt> - 搜索并下载原图")
                     print("  help                        - 显示帮助信息")
                     print("  exit/quit                   - 退出程序\n")
                 case 'exit' | 'quit':
@@ -117,9 +268,26 @@ def follower(
         port: int = typer.Option(9000, help='Follower port'),
         leader_host: str = typer.Option('localhost', help='Leader IP address'),
         leader_port: int = typer.Option(8000, help='Leader port'),
+        base_dir: str = typer.Option('state/',
+                                     help='Base directory to restore follower state from'),
+        silo_id: int = typer.Option(None,
+                                    help='Silo to restore if host/port changed'),
+        index_shards: int = typer.Option(1,
+                                         help='Split the vector index into this many shards '
+                                              'searched concurrently'),
+        search_threads: int = typer.Option(0,
+                                           help='Threads per search over the shards '
+                                                '(0: one per shard)'),
+        index_type: str = typer.Option('flat',
+                                       help='Vector index codes kept in RAM: flat, fp16, sq8 '
+                                            'or pq (compressed ones are re-ranked exactly)'),
+        db_name: str = typer.Option('meta_fusion',
+                                    help='PostgreSQL database of the vector_map tables'),
 ):
     """Start a follower node."""
-    follower_node = Follower(host, port)
+    from follower.follower import Follower
+    follower_node = Follower(host, port, base_dir, silo_id, index_shards, search_threads,
+                             index_type, db_name)
     follower_node.register(leader_host, leader_port)
 
 
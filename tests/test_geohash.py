@@ -0,0 +1,51 @@
+import random
+import pytest
+
+from utils import geohash
+
+
+def test_encode_known_cells():
+    assert geohash.encode(42.605, -5.603, 5) == 'ezs42'
+    assert geohash.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    # The upper edges belong to the last cells
+    assert geohash.encode(90.0, 180.0, 3) == 'zzz'
+
+
+def test_cell_size():
+    assert geohash.cell_size(1) == (45.0, 45.0)
+    assert geohash.cell_size(2) == (180.0 / 32, 360.0 / 32)
+
+
+def test_cover_contains_every_point_in_box():
+    rng = random.Random(0)
+    box = (47.3, 47.6, 8.4, 8.7)
+    cells = geohash.cover(*box, max_cells=64)
+    precision = len(cells[0])
+    assert len(cells) <= 64
+    assert all(len(cell) == precision for cell in cells)
+    for _ in range(1000):
+        lat, lon = rng.uniform(box[0], box[1]), rng.uniform(box[2], box[3])
+        assert geohash.encode(lat, lon, precision) in cells
+    # A finer covering would need more cells
+    assert len(geohash.covering_cells(*box, precision + 1)) > 64
+
+
+def test_cover_too_large_box():
+    assert geohash.cover(-90.0, 90.0, -180.0, 180.0, max_cells=4) is None
+    assert len(geohash.cover(-90.0, 90.0, -180.0, 180.0, max_cells=32)) == 32
+
+
+def test_bbox_around_contains_circle():
+    rng = random.Random(0)
+    lat, lon, radius_km = 60.0, 25.0, 50.0
+    min_lat, max_lat, min_lon, max_lon = geohash.bbox_around(lat, lon, radius_km)
+    assert geohash.haversine_km(lat, lon, max_lat, lon) == pytest.approx(radius_km)
+    num_inside = 0
+    for _ in range(5000):
+        point = rng.uniform(59.0, 61.0), rng.uniform(23.0, 27.0)
+        if geohash.haversine_km(lat, lon, *point) <= radius_km:
+            num_inside += 1
+            assert min_lat <= point[0] <= max_lat and min_lon <= point[1] <= max_lon
+    assert num_inside
+    # Near the poles the box spans every longitude
+    assert geohash.bbox_around(89.9, 0.0, 50.0)[2:] == (-180.0, 180.0)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+pytest.importorskip('psycopg2')
+
+import leader.ingest
+from leader.ingest import MsgpackIngestJob
+from utils.image_utils import hash_image_bytes
+
+
+class FakeLeader:
+    """
+    Stands in for the leader: records the uploads and replies to them from
+    another thread, as the leader's TCP handler does, except those of photo
+    names in hold (never) and fail (with an error). Photo names in
+    unreachable are not sent at all.
+    """
+
+    def __init__(self, hold=(), fail=(), unreachable=()):
+        self.conn = None
+        self.hold, self.fail, self.unreachable = set(hold), set(fail), set(unreachable)
+        self.sent = []
+        self.upload_callbacks = {}
+
+    def json_upload_message(self, record, photo_id):
+        return {'metadata': {'photo_id': photo_id, 'photo_name': record['id']}}
+
+    def send_upload(self, message, on_reply=None):
+        photo_name = message['metadata']['photo_name']
+        if photo_name in self.unreachable:
+            return None
+        request_id = f'request-{len(self.sent)}'
+        self.sent.append(photo_name)
+        if photo_name in self.hold:
+            self.upload_callbacks[request_id] = on_reply
+        else:
+            error = 'failed to decode' if photo_name in self.fail else None
+            threading.Thread(target=on_reply, args=(request_id, error)).start()
+        return request_id
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """photo_ids the metadata table already holds."""
+    stored = set()
+    monkeypatch.setattr(leader.ingest, 'query_existing_photo_ids',
+                        lambda conn, photo_ids: stored & set(photo_ids))
+    return stored
+
+
+def _write_dump(path, names):
+    with open(path, 'wb') as f:
+        for name in names:
+            record = {'id': name}
+            if name != 'no_image':
+                record['image'] = name.split('_')[0].encode()
+            f.write(msgpack.packb(record))
+    return str(path)
+
+
+def test_ingest_counts(tmp_path, stored):
+    path = _write_dump(tmp_path / 'dump.msgpack',
+                       ['a', 'b', 'a_again', 'stored', 'no_image', 'bad', 'down', 'c'])
+    stored.add(hash_image_bytes(b'stored'))
+    fake = FakeLeader(fail={'bad'}, unreachable={'down'})
+    job = MsgpackIngestJob(fake, path)
+    assert job.run() == 2 + 1
+    assert fake.sent == ['a', 'b', 'bad', 'c']
+    assert (job.num_uploaded, job.num_duplicates, job.num_failed) == (3, 2, 2)
+    assert job.num_records == 8
+    assert not os.path.exists(job.checkpoint_path)
+
+
+def test_resume_from_first_unacked_record(tmp_path, stored, monkeypatch):
+    monkeypatch.setattr(leader.ingest, 'INGEST_ACK_TIMEOUT', 0.1)
+    names = [f'{i}' for i in range(6)]
+    path = _write_dump(tmp_path / 'dump.msgpack', names)
+    fake = FakeLeader(hold={'2'})
+    job = MsgpackIngestJob(fake, path)
+    with pytest.raises(TimeoutError):
+        job.run()
+    assert fake.sent == names
+    assert not fake.upload_callbacks
+    with open(job.checkpoint_path) as f:
+        checkpoint = json.load(f)
+    assert checkpoint['records'] == 2
+
+    # Photos 0 and 1 are stored, and so are 3 to 5 though the checkpoint is before them
+    stored.update(hash_image_bytes(name.encode()) for name in names if name != '2')
+    fake = FakeLeader()
+    job = MsgpackIngestJob(fake, path)
+    assert (job.start_offset, job.num_records) == (checkpoint['offset'], 2)
+    assert job.run() == 1
+    assert fake.sent == ['2']
+    assert job.num_duplicates == 3 and job.num_records == 6
+    assert not os.path.exists(job.checkpoint_path)
+
+
+def test_checkpoint_every_interval(tmp_path, stored, monkeypatch):
+    monkeypatch.setattr(leader.ingest, 'INGEST_CHECKPOINT_INTERVAL', 2)
+    monkeypatch.setattr(leader.ingest, 'INGEST_ACK_TIMEOUT', 0.1)
+    path = _write_dump(tmp_path / 'dump.msgpack', ['a', 'b', 'c', 'd', 'e'])
+    checkpoints = []
+    save_checkpoint = MsgpackIngestJob._save_checkpoint
+
+    def record_checkpoint(job):
+        save_checkpoint(job)
+        with open(job.checkpoint_path) as f:
+            checkpoints.append(json.load(f)['records'])
+
+    monkeypatch.setattr(MsgpackIngestJob, '_save_checkpoint', record_checkpoint)
+    with pytest.raises(TimeoutError):
+        MsgpackIngestJob(FakeLeader(hold={'c'}), path).run()
+    # Saved after records 2 and 4 and on the timeout, never past the unacked 'c'
+    assert len(checkpoints) == 3
+    assert checkpoints[0] <= 2 and checkpoints[1] <= 2 and checkpoints[2] == 2
+
+
+def test_checkpoint_of_other_file_is_ignored(tmp_path, stored):
+    path = _write_dump(tmp_path / 'dump.msgpack', ['a', 'b'])
+    with open(f'{path}.ckpt', 'w') as f:
+        json.dump({'file_id': {'size': 1, 'mtime': 0}, 'offset': 5, 'records': 1}, f)
+    fake = FakeLeader()
+    job = MsgpackIngestJob(fake, path)
+    assert (job.start_offset, job.num_records) == (0, 0)
+    job.run()
+    assert fake.sent == ['a', 'b']
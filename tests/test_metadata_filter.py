@@ -0,0 +1,55 @@
+from datetime import datetime
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+pytest.importorskip('numpy')
+
+from leader.metadata_index import ColumnarMetadataIndex
+from leader.storage.store import (init_metadata_table, reset_database, insert_new_photo,
+                                  iter_photo_rows, prefilter_candidate_silos,
+                                  fetch_photos_by_metadata)
+
+TEST_DB_NAME = 'meta_fusion_test'
+BEACH_PROMPT = {
+    'start_ts': datetime(2000, 1, 1),
+    'end_ts': datetime(2030, 1, 1),
+    'min_lat': -90.0, 'max_lat': 90.0,
+    'min_lon': -180.0, 'max_lon': 180.0,
+    'radius_km': None,
+    'any_tags': ['beach'],
+}
+
+
+@pytest.fixture
+def conn():
+    try:
+        reset_database(TEST_DB_NAME)
+        conn = init_metadata_table(database=TEST_DB_NAME)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f'PostgreSQL is not available: {e}')
+    # A photo stored before uploads carried tags
+    cur = conn.cursor()
+    cur.execute("INSERT INTO photos_meta (photo_id, silo_id, photo_name, tags) "
+                "VALUES ('legacy', 0, 'legacy.jpg', NULL)")
+    cur.close()
+    for photo_id, tags in (('beach', ['beach', 'sea']), ('dog', ['dog']), ('untagged', [])):
+        insert_new_photo(conn, 1, {'photo_id': photo_id, 'photo_name': f'{photo_id}.jpg',
+                                   'tags': tags})
+    yield conn
+    conn.close()
+
+
+def test_only_null_tags_pass_tag_filter(conn):
+    # 'untagged' was tagged without a match, so it is pruned
+    photos = fetch_photos_by_metadata(conn, BEACH_PROMPT, [0, 1])
+    assert {p['photo_id'] for p in photos} == {'legacy', 'beach'}
+    assert sorted(prefilter_candidate_silos(conn, BEACH_PROMPT)) == [(0, 1), (1, 1)]
+
+
+def test_mirror_matches_sql(conn):
+    mirror = ColumnarMetadataIndex.from_rows(iter_photo_rows(conn))
+    photos = mirror.fetch_photos_by_metadata(BEACH_PROMPT, [0, 1])
+    assert {p['photo_id'] for p in photos} == \
+        {p['photo_id'] for p in fetch_photos_by_metadata(conn, BEACH_PROMPT, [0, 1])}
+    assert sorted(mirror.prefilter_candidate_silos(BEACH_PROMPT)) == \
+        sorted(prefilter_candidate_silos(conn, BEACH_PROMPT))
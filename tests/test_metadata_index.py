@@ -0,0 +1,142 @@
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+
+pytest.importorskip('numpy')
+
+from leader.metadata_index import ColumnarMetadataIndex
+from utils import geohash
+
+TAGS = ['beach', 'dog', 'sea', 'city', 'food']
+
+
+def _prompt(start_ts=datetime(2000, 1, 1), end_ts=datetime(2030, 1, 1),
+            box=(-90.0, 90.0, -180.0, 180.0), center=None, radius_km=None, any_tags=None):
+    prompt = {
+        'start_ts': start_ts, 'end_ts': end_ts,
+        'min_lat': box[0], 'max_lat': box[1],
+        'min_lon': box[2], 'max_lon': box[3],
+        'radius_km': radius_km,
+        'any_tags': any_tags,
+    }
+    if center is not None:
+        prompt['center_lat'], prompt['center_lon'] = center
+    return prompt
+
+
+def _random_rows(num_rows, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num_rows):
+        ts = None if rng.random() < 0.1 else \
+            datetime(2010, 1, 1) + timedelta(seconds=rng.randrange(10 ** 9))
+        lat, lon = (None, None) if rng.random() < 0.1 else \
+            (rng.uniform(45.0, 50.0), rng.uniform(5.0, 10.0))
+        tags = None if rng.random() < 0.1 else rng.sample(TAGS, rng.randrange(3))
+        rows.append((f'p{i}', rng.randrange(4), f'p{i}.jpg', ts, lat, lon, tags))
+    return rows
+
+
+def _passes(row, prompt):
+    _, _, _, ts, lat, lon, tags = row
+    if ts is not None and not prompt['start_ts'] <= ts <= prompt['end_ts']:
+        return False
+    if lat is not None and not prompt['min_lat'] <= lat <= prompt['max_lat']:
+        return False
+    if lon is not None and not prompt['min_lon'] <= lon <= prompt['max_lon']:
+        return False
+    if lat is not None and prompt['radius_km'] is not None and geohash.haversine_km(
+            prompt['center_lat'], prompt['center_lon'], lat, lon) > prompt['radius_km']:
+        return False
+    if prompt['any_tags'] and tags is not None and not set(tags) & set(prompt['any_tags']):
+        return False
+    return True
+
+
+def _photo_ids(photos):
+    return {p['photo_id'] for p in photos}
+
+
+PROMPTS = [
+    _prompt(),
+    _prompt(start_ts=datetime(2015, 1, 1), end_ts=datetime(2020, 1, 1)),
+    _prompt(box=(46.0, 47.0, 6.0, 8.0)),
+    _prompt(box=geohash.bbox_around(47.5, 7.5, 40.0), center=(47.5, 7.5), radius_km=40.0),
+    _prompt(any_tags=['beach', 'sea']),
+    _prompt(start_ts=datetime(2012, 1, 1), box=geohash.bbox_around(48.0, 6.0, 100.0),
+            center=(48.0, 6.0), radius_km=100.0, any_tags=['dog']),
+]
+
+
+@pytest.mark.parametrize('prompt', PROMPTS)
+def test_filters_match_brute_force(prompt):
+    rows = _random_rows(3000)
+    index = ColumnarMetadataIndex.from_rows(rows)
+    expected = [row for row in rows if _passes(row, prompt)]
+    photos = index.fetch_photos_by_metadata(prompt, [0, 1, 2, 3], limit=None)
+    assert _photo_ids(photos) == {row[0] for row in expected}
+    counts = {}
+    for row in expected:
+        counts[row[1]] = counts.get(row[1], 0) + 1
+    silos = index.prefilter_candidate_silos(prompt)
+    assert dict(silos) == counts
+    assert [count for _, count in silos] == sorted(counts.values(), reverse=True)
+    in_silos = index.fetch_photos_by_metadata(prompt, [1, 3], limit=None)
+    assert _photo_ids(in_silos) == {row[0] for row in expected if row[1] in (1, 3)}
+
+
+def test_order_and_limit():
+    index = ColumnarMetadataIndex()
+    index.add('old', 0, ts=datetime(2011, 1, 1))
+    index.add('null', 0)
+    index.add('new', 0, ts=datetime(2012, 1, 1))
+    index.add('middle', 0, ts=datetime(2011, 6, 1))
+    photos = index.fetch_photos_by_metadata(_prompt(), [0])
+    # NULL timestamps first, then latest first, as in Postgres
+    assert [p['photo_id'] for p in photos] == ['null', 'new', 'middle', 'old']
+    photos = index.fetch_photos_by_metadata(_prompt(), [0], limit=2)
+    assert [p['photo_id'] for p in photos] == ['null', 'new']
+
+
+def test_row_values():
+    index = ColumnarMetadataIndex()
+    index.add('a', 2, 'a.jpg', datetime(2020, 1, 2, 3, 4, 5), 47.5, 7.5, ['beach'])
+    index.add('legacy', 2, 'legacy.jpg')
+    index.add('untagged', 2, 'untagged.jpg', tags=[])
+    photos = {p['photo_id']: p for p in index.fetch_photos_by_metadata(_prompt(), [2])}
+    assert photos['a']['ts'] == datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert photos['a']['lat'] == pytest.approx(47.5)
+    assert photos['a']['tags'] == ['beach']
+    assert photos['a']['silo_id'] == 2 and photos['a']['photo_name'] == 'a.jpg'
+    assert photos['legacy']['tags'] is None and photos['legacy']['ts'] is None
+    assert photos['untagged']['tags'] == []
+    # Only NULL tags pass a tag filter
+    beach = index.fetch_photos_by_metadata(_prompt(any_tags=['beach']), [2])
+    assert _photo_ids(beach) == {'a', 'legacy'}
+
+
+def test_remove_and_readd():
+    index = ColumnarMetadataIndex(capacity=2)
+    for i in range(10):
+        index.add(f'p{i}', 0, tags=['dog'])
+    index.remove('p3')
+    index.add('p5', 1, tags=['beach'])
+    assert _photo_ids(index.fetch_photos_by_metadata(_prompt(), [0, 1])) == \
+        {f'p{i}' for i in range(10)} - {'p3'}
+    assert index.prefilter_candidate_silos(_prompt()) == [(0, 8), (1, 1)]
+    assert _photo_ids(index.fetch_photos_by_metadata(_prompt(any_tags=['beach']), [0, 1])) \
+        == {'p5'}
+    index.clear()
+    assert index.prefilter_candidate_silos(_prompt()) == []
+
+
+def test_add_metadata():
+    index = ColumnarMetadataIndex()
+    index.add_metadata(3, {'photo_id': 'a', 'photo_name': 'a.jpg',
+                           'timestamp': '2020:01:02 03:04:05',
+                           'latitude': 47.5, 'longitude': 7.5, 'tags': ['sea']})
+    index.add_metadata(3, {'photo_id': 'b', 'primary_silo': 1, 'timestamp': ''})
+    photos = {p['photo_id']: p for p in index.fetch_photos_by_metadata(_prompt(), [1, 3])}
+    assert photos['a']['ts'] == datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert photos['a']['silo_id'] == 3 and photos['a']['tags'] == ['sea']
+    assert photos['b']['silo_id'] == 1 and photos['b']['ts'] is None
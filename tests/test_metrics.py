@@ -0,0 +1,51 @@
+from utils.tracing import StageMetrics, Trace
+
+
+def test_to_prometheus():
+    metrics = StageMetrics('leader', buckets=[0.5, 0.1, 1])
+    trace = Trace('request')
+    trace.add('search', 0.05)
+    trace.add('search', 0.05)
+    trace.add('cache', 2.0)
+    metrics.record(trace)
+    metrics.observe('search', 0.5)
+    assert metrics.to_prometheus().splitlines() == [
+        '# HELP metafusion_stage_seconds Latency of request stages.',
+        '# TYPE metafusion_stage_seconds histogram',
+        'metafusion_stage_seconds_bucket{role="leader",stage="cache",le="0.1"} 0',
+        'metafusion_stage_seconds_bucket{role="leader",stage="cache",le="0.5"} 0',
+        'metafusion_stage_seconds_bucket{role="leader",stage="cache",le="1"} 0',
+        'metafusion_stage_seconds_bucket{role="leader",stage="cache",le="+Inf"} 1',
+        'metafusion_stage_seconds_sum{role="leader",stage="cache"} 2.0',
+        'metafusion_stage_seconds_count{role="leader",stage="cache"} 1',
+        'metafusion_stage_seconds_bucket{role="leader",stage="search",le="0.1"} 1',
+        # Buckets are upper bounds, inclusive
+        'metafusion_stage_seconds_bucket{role="leader",stage="search",le="0.5"} 2',
+        'metafusion_stage_seconds_bucket{role="leader",stage="search",le="1"} 2',
+        'metafusion_stage_seconds_bucket{role="leader",stage="search",le="+Inf"} 2',
+        'metafusion_stage_seconds_sum{role="leader",stage="search"} 0.6',
+        'metafusion_stage_seconds_count{role="leader",stage="search"} 2',
+    ]
+
+
+def test_empty_and_dump(tmp_path):
+    metrics = StageMetrics('follower')
+    assert metrics.to_prometheus() == (
+        '# HELP metafusion_stage_seconds Latency of request stages.\n'
+        '# TYPE metafusion_stage_seconds histogram\n')
+    metrics.observe('embed', 0.002)
+    path = str(tmp_path / 'metrics.prom')
+    metrics.dump(path)
+    with open(path) as f:
+        assert f.read() == metrics.to_prometheus()
+
+
+def test_merge_keeps_slowest_participant():
+    trace = Trace()
+    trace.merge({'search': 0.2, 'embed': 0.1}, prefix='follower.')
+    trace.merge({'search': 0.1}, prefix='follower.')
+    with trace.span('total'):
+        pass
+    assert trace.spans['follower.search'] == 0.2
+    assert trace.spans['follower.embed'] == 0.1
+    assert trace.spans['total'] >= 0
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from leader.result_cache import ResultCache
+
+BEACH_PROMPT = {
+    'start_ts': datetime(2020, 1, 1),
+    'end_ts': datetime(2021, 1, 1),
+    'min_lat': -90.0, 'max_lat': 90.0,
+    'min_lon': -180.0, 'max_lon': 180.0,
+    'radius_km': None,
+    'any_tags': ['beach'],
+}
+
+
+def _put(cache, key, silo_ids, metadata=None, results=None):
+    cache.put(key, results or [{'photo_id': key}], cache.snapshot(), silo_ids, metadata)
+
+
+def test_get_returns_copy():
+    cache = ResultCache(max_entries=10, max_bytes=10000)
+    results = [{'photo_id': 'a'}]
+    cache.put('k', results, cache.snapshot(), [0])
+    results[0]['photo_id'] = 'changed'
+    hit = cache.get('k')
+    assert hit == [{'photo_id': 'a'}]
+    hit.append({'photo_id': 'b'})
+    assert cache.get('k') == [{'photo_id': 'a'}]
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResultCache(max_entries=2, max_bytes=10000)
+    _put(cache, 'a', [0])
+    _put(cache, 'b', [0])
+    cache.get('a')
+    _put(cache, 'c', [0])
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+    cache = ResultCache(max_entries=10, max_bytes=40)
+    _put(cache, 'a', [0])
+    _put(cache, 'b', [0])
+    _put(cache, 'c', [0])
+    assert cache.get('a') is None
+    assert cache.num_bytes <= 40
+    # Results larger than the cache are not stored
+    _put(cache, 'big', [0], results=[{'photo_id': 'x' * 100}])
+    assert cache.get('big') is None
+
+
+def test_bump_invalidates_silos_read():
+    cache = ResultCache(max_entries=10, max_bytes=10000)
+    _put(cache, 'a', [0, 1])
+    _put(cache, 'b', [2], BEACH_PROMPT)
+    cache.bump(1, {'tags': ['dog']})
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+
+
+def test_bump_other_silo_evicts_only_matching_entries():
+    cache = ResultCache(max_entries=10, max_bytes=10000)
+    _put(cache, 'beach', [0], BEACH_PROMPT)
+    cache.bump(1, {'timestamp': '2019:06:01 12:00:00', 'tags': ['beach']})
+    cache.bump(1, {'timestamp': '2020:06:01 12:00:00', 'tags': ['dog']})
+    assert cache.get('beach') is not None
+    # Photos without tags pass the tag filter, like NULL tags in SQL
+    cache.bump(1, {'timestamp': '2020:06:01 12:00:00'})
+    assert cache.get('beach') is None
+
+
+def test_put_after_concurrent_bump():
+    cache = ResultCache(max_entries=10, max_bytes=10000)
+    snapshot = cache.snapshot()
+    cache.bump(0)
+    cache.put('read', [], snapshot, [0])
+    assert cache.get('read') is None
+    # An upload to another silo only matters if it passes the filter
+    snapshot = cache.snapshot()
+    cache.bump(1, {'tags': ['dog']})
+    cache.put('beach', [], snapshot, [0], BEACH_PROMPT)
+    assert cache.get('beach') == []
+    snapshot = cache.snapshot()
+    cache.bump(1, {'tags': ['beach']})
+    cache.put('beach2', [], snapshot, [0], BEACH_PROMPT)
+    assert cache.get('beach2') is None
+
+
+def test_put_after_too_many_bumps():
+    cache = ResultCache(max_entries=10, max_bytes=10000, max_bumps=2)
+    snapshot = cache.snapshot()
+    for _ in range(3):
+        cache.bump(1, {'tags': ['dog']})
+    cache.put('beach', [], snapshot, [0], BEACH_PROMPT)
+    assert cache.get('beach') is None
+
+
+def test_bump_all():
+    cache = ResultCache(max_entries=10, max_bytes=10000)
+    _put(cache, 'a', [0])
+    snapshot = cache.snapshot()
+    cache.bump_all()
+    assert cache.get('a') is None
+    cache.put('b', [], snapshot, [5], BEACH_PROMPT)
+    assert cache.get('b') is None
@@ -0,0 +1,181 @@
+import os
+import threading
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('faiss')
+
+from follower.storage.vector_store import VectorStore
+from follower.storage.vertex_index import FollowerFaissIndex, saved_index_paths
+
+DIM = 16
+
+
+class _RacingLock:
+    """Lock that runs race() just before rebuild() takes it to swap shards in."""
+
+    def __init__(self, race):
+        self.lock = threading.Lock()
+        self.race = race
+        self.num_enters = 0
+
+    def __enter__(self):
+        self.num_enters += 1
+        if self.num_enters == 2:
+            self.race()
+        self.lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def _vectors(num_vectors, seed=0):
+    return np.random.default_rng(seed).standard_normal((num_vectors, DIM)).astype('float32')
+
+
+def _index(tmp_path, **kwargs):
+    return FollowerFaissIndex(str(tmp_path / 'index.faiss'), DIM, **kwargs)
+
+
+def test_tombstoned_vectors_are_skipped(tmp_path):
+    index = _index(tmp_path)
+    vectors = _vectors(20)
+    assert [index.add(v) for v in vectors] == list(range(20))
+    _, ids = index.search(vectors[5], top_k=3)
+    assert ids[0] == 5
+    index.remove(5)
+    _, ids = index.search(vectors[5], top_k=3)
+    assert 5 not in ids and len(ids) == 3
+    assert index.ntotal == 20 and index.num_live == 19
+    index.save()
+    reopened = _index(tmp_path)
+    assert reopened.tombstones == {5}
+    assert reopened.add(vectors[0]) == 20
+
+
+@pytest.mark.parametrize('num_shards,bounded', [(1, False), (3, False), (3, True)])
+def test_rebuild_drops_tombstones(tmp_path, num_shards, bounded):
+    index = _index(tmp_path, num_shards=num_shards)
+    vectors = _vectors(30)
+    for v in vectors:
+        index.add(v)
+    for vector_id in (0, 7, 29):
+        index.remove(vector_id)
+    assert index.rebuild(threading.Lock(), bounded=bounded) == 3
+    assert sorted(index.ids().tolist()) == sorted(set(range(30)) - {0, 7, 29})
+    assert not index.tombstones
+    _, ids = index.search(vectors[7], top_k=1)
+    assert ids[0] != 7
+    reopened = _index(tmp_path, num_shards=num_shards)
+    assert sorted(reopened.ids().tolist()) == sorted(index.ids().tolist())
+    assert not reopened.tombstones
+
+
+@pytest.mark.parametrize('num_shards,bounded', [(1, False), (3, False), (3, True)])
+def test_rebuild_racing_with_adds_and_removes(tmp_path, num_shards, bounded):
+    index = _index(tmp_path, num_shards=num_shards)
+    vectors = _vectors(40)
+    for v in vectors[:30]:
+        index.add(v)
+    index.remove(3)
+    raced = []
+
+    def race():
+        if raced:
+            return
+        raced.extend(index.add(v) for v in vectors[30:])
+        # One vector of the snapshot and one added during the rebuild
+        index.remove(10)
+        index.remove(raced[2])
+
+    index.rebuild(_RacingLock(race), bounded=bounded)
+    # Shards snapshotted before 10 was removed keep it for the next rebuild;
+    # a bounded rebuild snapshots shard 1 only after shard 0 is swapped in
+    left = set() if bounded else {10}
+    assert sorted(index.ids().tolist()) == sorted(set(range(40)) - {3, raced[2]} - ({10} - left))
+    assert index.tombstones == left
+    for vector_id in (10, 35):
+        _, ids = index.search(vectors[vector_id], top_k=5)
+        assert 10 not in ids and raced[2] not in ids
+    _, ids = index.search(vectors[35], top_k=1)
+    assert ids[0] == 35
+    reopened = _index(tmp_path, num_shards=num_shards)
+    assert sorted(reopened.ids().tolist()) == sorted(index.ids().tolist())
+    assert reopened.tombstones == left
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.rebuild')]
+
+
+def test_rebuild_racing_with_clear(tmp_path):
+    index = _index(tmp_path)
+    for v in _vectors(10):
+        index.add(v)
+    index.remove(1)
+    index.rebuild(_RacingLock(index.clear))
+    assert index.ntotal == 0 and not index.tombstones
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.rebuild')]
+
+
+def test_reload_with_other_number_of_shards(tmp_path):
+    index = _index(tmp_path, num_shards=2)
+    vectors = _vectors(25)
+    for v in vectors:
+        index.add(v)
+    index.save()
+    assert len(saved_index_paths(index.index_path)) == 2
+    distances, ids = index.search(vectors[12], top_k=5)
+
+    resharded = _index(tmp_path, num_shards=3)
+    assert len(saved_index_paths(index.index_path)) == 3
+    assert sorted(resharded.ids().tolist()) == list(range(25))
+    reshard_distances, reshard_ids = resharded.search(vectors[12], top_k=5)
+    assert reshard_ids.tolist() == ids.tolist()
+    np.testing.assert_allclose(reshard_distances, distances, rtol=1e-5)
+
+    single = _index(tmp_path, num_shards=1)
+    assert saved_index_paths(index.index_path) == [index.index_path]
+    assert sorted(single.ids().tolist()) == list(range(25))
+    assert single.add(vectors[0]) == 25
+
+
+def test_reload_mmap(tmp_path):
+    index = _index(tmp_path)
+    vectors = _vectors(10)
+    for v in vectors:
+        index.add(v)
+    index.save()
+    mapped = _index(tmp_path, mmap=True)
+    assert mapped.search(vectors[4], top_k=1)[1][0] == 4
+    # Fully loaded on the first write
+    assert mapped.add(vectors[4]) == 10
+    assert sorted(mapped.search(vectors[4], top_k=2)[1].tolist()) == [4, 10]
+
+
+def test_vector_store_dtype_migration(tmp_path):
+    path = str(tmp_path / 'vectors')
+    vectors = _vectors(5)
+    store = VectorStore(path, DIM, model_name='ViT-B/32', normalize=True)
+    for i, v in enumerate(vectors):
+        store.append(i, v)
+    half = VectorStore(path, DIM, 'float16')
+    assert half.header == {'model_name': 'ViT-B/32', 'dim': DIM, 'normalize': True,
+                           'dtype': 'float16'}
+    assert len(half) == 5 and half.view().dtype == np.float16
+    np.testing.assert_allclose(half.get([0, 2, 4]), vectors[[0, 2, 4]], atol=1e-2)
+    back = VectorStore(path, DIM, 'float32')
+    assert back.get(np.arange(5)).dtype == np.float32
+    np.testing.assert_allclose(back.get(np.arange(5)), vectors, atol=1e-2)
+    with pytest.raises(ValueError):
+        VectorStore(path, DIM, model_name='RN50')
+
+
+def test_vector_store_headerless_file(tmp_path):
+    path = str(tmp_path / 'vectors')
+    vectors = _vectors(3)
+    vectors.tofile(path)
+    store = VectorStore(path, DIM)
+    assert len(store) == 3
+    np.testing.assert_array_equal(store.get([0, 1, 2]), vectors)
+    # Skipped vector_ids are left as zeros
+    store.append(5, vectors[0])
+    assert len(store) == 6
+    np.testing.assert_array_equal(store.get([3, 4]), np.zeros((2, DIM), dtype='float32'))
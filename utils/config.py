@@ -1,3 +1,4 @@
+import os
 import logging
 
 DB_NAME = 'meta_fusion'
@@ -16,3 +17,93 @@ FOLLOWER_TIMEOUT = 10
 
 VECTOR_SEARCH_TOP_K = 5
 VECTOR_SCORE_FILTER_PORTION = 0.5
+
+PREVIEW_SIZES = [256, 1024]
+PREVIEW_FORMAT = 'WEBP'
+PREVIEW_QUALITY = 80
+PHOTO_CHUNK_SIZE = 1024 * 1024
+# Threads asking followers for originals, and their connect/send timeout in s
+PHOTO_FETCH_WORKERS = 4
+PHOTO_FETCH_TIMEOUT = 10
+
+PREPROCESS_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+MODEL_BACKENDS = ['eager', 'int8', 'compile', 'script']
+MIN_BACKEND_RECALL = 0.95
+
+FOLLOWER_STATE_FILE = 'follower.json'
+
+REPLICATION_FACTOR = 1
+
+RESULT_CACHE_MAX_ENTRIES = 1024
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Uploads remembered to check the searches in flight while they happened
+RESULT_CACHE_MAX_BUMPS = 10000
+
+SEARCH_TIMEOUT = 60
+
+GATEWAY_MAX_INFLIGHT = 64
+GATEWAY_MAX_BODY_BYTES = 64 * 1024 * 1024
+
+TRACE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_DUMP_INTERVAL = 10
+LEADER_METRICS_FILE = 'leader.prom'
+FOLLOWER_METRICS_FILE = 'metrics.prom'
+
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MAX_DURATION = 600
+
+INGEST_PREFETCH = 256
+INGEST_BATCH_SIZE = 64
+INGEST_CHECKPOINT_INTERVAL = 1000
+INGEST_MAX_RECORD_BYTES = 256 * 1024 * 1024
+# Seconds to wait for the upload_reply of the last dispatched records
+INGEST_ACK_TIMEOUT = 120
+# photo_ids an ingest job remembers to drop repeats the metadata table has
+# not recorded yet
+INGEST_SEEN_PHOTO_IDS = 1000000
+
+METADATA_MIRROR = False
+
+# Geohash length stored per photo and of the metadata mirror's grid cells
+GEO_SEARCH_RADIUS_KM = 50.0
+GEOHASH_PRECISION = 8
+GEO_MAX_CELLS = 32
+GEO_GRID_PRECISION = 4
+GEO_GRID_MAX_CELLS = 4096
+
+# Vocabulary of the zero-shot tags followers attach to uploaded photos, and
+# the tags a prompt can filter on; empty disables auto-tagging
+AUTO_TAG_VOCABULARY = [
+    'beach', 'sea', 'lake', 'river', 'waterfall', 'mountain', 'snow', 'desert',
+    'forest', 'tree', 'flower', 'garden', 'park', 'field', 'sky', 'sunset',
+    'night', 'city', 'street', 'building', 'bridge', 'church', 'temple', 'castle',
+    'museum', 'restaurant', 'food', 'drink', 'car', 'train', 'boat', 'airplane',
+    'bicycle', 'person', 'family', 'child', 'crowd', 'concert', 'wedding', 'party',
+    'sport', 'dog', 'cat', 'bird', 'horse', 'animal', 'document', 'screenshot'
+]
+AUTO_TAG_TOP_K = 3
+AUTO_TAG_MIN_PROB = 0.1
+
+# Follower indexes drop deleted vectors once this many (and this share of the
+# index) are tombstoned
+COMPACT_MIN_TOMBSTONES = 1000
+COMPACT_TOMBSTONE_RATIO = 0.1
+
+# Sub-indexes per follower index, vectors added per batch by a rebuild, and
+# whether rebuilds swap one shard at a time to bound their memory
+FOLLOWER_INDEX_SHARDS = 1
+REBUILD_CHUNK_SIZE = 16384
+REBUILD_BOUNDED = False
+# Threads searching the shards of one query concurrently (0: one per shard)
+FOLLOWER_SEARCH_THREADS = 0
+# Codes held in RAM by follower indexes ('flat', 'fp16', 'sq8' or 'pq'); the
+# full vectors are memory-mapped from disk to re-rank RERANK_FACTOR * k
+# candidates of compressed indexes. 'sq8' and 'pq' train on INDEX_TRAIN_SIZE
+# vectors, and 'pq' uses up to PQ_M bytes per vector
+FOLLOWER_INDEX_TYPE = 'flat'
+RERANK_FACTOR = 4
+INDEX_TRAIN_SIZE = 10000
+PQ_M = 64
+# dtype of the follower vector files ('float32', or 'float16' to halve them)
+VECTOR_STORE_DTYPE = 'float32'
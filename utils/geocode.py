@@ -2,9 +2,12 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import Optional, Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
+from utils.geohash import bbox_around
 
-from geopy.geocoders import Nominatim
+# geopy is imported on first use; only the leader geocodes prompts.
+if TYPE_CHECKING:
+    from geopy.geocoders import Nominatim
 
 
 # A global geolocator to avoid creating one each time
@@ -14,6 +17,7 @@ _geolocator: Optional[Nominatim] = None
 def _get_geolocator() -> Nominatim:
     global _geolocator
     if _geolocator is None:
+        from geopy.geocoders import Nominatim
         # user_agent should be any non-empty string
         _geolocator = Nominatim(user_agent="metafusion-geocoder")
     return _geolocator
@@ -40,12 +44,9 @@ def geocode_location(name: str) -> Tuple[Optional[float], Optional[float]]:
 
 def geocode_bbox(name: str, radius_km: float = 50.0) -> Optional[Tuple[float, float, float, float]]:
     """
-        Convert a place name into an approximate latitude/longitude bounding box,
-        suitable for SQL lat/lon range filtering.
-
-        Simplifying assumptions:
-            - 1 degree latitude ≈ 111km
-            - longitude uses the same conversion (acceptable error at mid-latitudes)
+        Convert a place name into the latitude/longitude bounding box of the
+        circle of radius_km around it, suitable for SQL lat/lon range filtering.
+        Longitude is scaled by the latitude of the place.
 
         Returns:
             (min_lat, max_lat, min_lon, max_lon) or None
@@ -54,9 +55,4 @@ def geocode_bbox(name: str, radius_km: float = 50.0) -> Optional[Tuple[float, fl
     if lat is None or lon is None:
         return None
 
-    delta_deg = radius_km / 111.0
-    min_lat = lat - delta_deg
-    max_lat = lat + delta_deg
-    min_lon = lon - delta_deg
-    max_lon = lon + delta_deg
-    return min_lat, max_lat, min_lon, max_lon
+    return bbox_around(lat, lon, radius_km)
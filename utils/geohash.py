@@ -0,0 +1,103 @@
+# utils/geohash.py
+import math
+from typing import List, Optional, Tuple
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(lat: float, lon: float, precision: int = 8) -> str:
+    """
+    Geohash of (lat, lon): precision base32 characters, interleaving one
+    bit of longitude and one of latitude, longitude first.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, x = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if x >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """
+    (height, width) in degrees of the cells of a geohash precision.
+    """
+    num_bits = 5 * precision
+    lon_bits = (num_bits + 1) // 2
+    lat_bits = num_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(min_lat, max_lat, min_lon, max_lon, precision: int) -> List[str]:
+    """
+    Geohashes of the given precision whose cells intersect the box.
+    """
+    height, width = cell_size(precision)
+    rows = _cell_range(min_lat, max_lat, -90.0, height)
+    cols = _cell_range(min_lon, max_lon, -180.0, width)
+    return [encode(-90.0 + (i + 0.5) * height, -180.0 + (j + 0.5) * width, precision)
+            for i in rows for j in cols]
+
+
+def cover(min_lat, max_lat, min_lon, max_lon, max_cells: int,
+          max_precision: int = 8) -> Optional[List[str]]:
+    """
+    Finest covering of the box by at most max_cells geohashes, or None if
+    even single-character cells need more.
+    """
+    cells = None
+    for precision in range(1, max_precision + 1):
+        height, width = cell_size(precision)
+        num_cells = len(_cell_range(min_lat, max_lat, -90.0, height)) * \
+            len(_cell_range(min_lon, max_lon, -180.0, width))
+        if num_cells > max_cells:
+            break
+        cells = (min_lat, max_lat, min_lon, max_lon, precision)
+    return covering_cells(*cells) if cells else None
+
+
+def bbox_around(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    (min_lat, max_lat, min_lon, max_lon) of the smallest box containing the
+    circle, with longitude scaled by the latitude. Boxes are clamped at the
+    poles and the antimeridian rather than wrapped around them.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    # Widest point of the circle, where its meridians are tangent
+    delta_lon = math.degrees(math.asin(min(math.sin(radius_km / EARTH_RADIUS_KM)
+                                           / math.cos(math.radians(lat)), 1.0)))
+    return min_lat, max_lat, max(lon - delta_lon, -180.0), min(lon + delta_lon, 180.0)
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    """
+    Great-circle distance in km between two points.
+    """
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def _cell_range(low, high, origin, size):
+    first = int((low - origin) // size)
+    last = int((high - origin) // size)
+    # The upper edge (90 or 180) belongs to the last cell
+    last = min(last, int(round((-2 * origin) / size)) - 1)
+    return range(max(first, 0), last + 1)
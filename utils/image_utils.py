@@ -29,6 +29,80 @@ def save_image_bytes(image_bytes: bytes, output_path: str):
         f.write(image_bytes)
 
 
+def read_image_chunks(image_path: str, chunk_size: int):
+    """
+    Yield (offset, chunk) pairs of the image file so that it can be
+    streamed without holding the whole file in memory.
+    """
+    offset = 0
+    with open(image_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield offset, chunk
+            offset += len(chunk)
+
+
+def preview_path(preview_dir: str, photo_id: str, size: int, image_format: str) -> str:
+    """
+    Return the path of the cached preview of photo_id at the given size.
+    """
+    return os.path.join(preview_dir, str(size), f'{photo_id}.{image_format.lower()}')
+
+
+def save_image_previews(image_path: str, preview_dir: str, photo_id: str,
+                        sizes, image_format: str, quality: int) -> dict:
+    """
+    Downscale the image at image_path to each of the given sizes (longest edge)
+    and save the previews under preview_dir. Returns {size: preview path}.
+    """
+    with Image.open(image_path) as image:
+        return save_previews_from_image(image, preview_dir, photo_id, sizes,
+                                        image_format, quality)
+
+
+def save_previews_from_image(image: Image.Image, preview_dir: str, photo_id: str,
+                             sizes, image_format: str, quality: int) -> dict:
+    """
+    Same as save_image_previews but for an already decoded image.
+    """
+    paths = {}
+    image = image.convert('RGB')
+    for size in sorted(sizes, reverse=True):
+        path = preview_path(preview_dir, photo_id, size, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image.thumbnail((size, size))
+        image.save(path, format=image_format, quality=quality)
+        paths[size] = path
+    return paths
+
+
+def ingest_image_bytes(image_bytes: bytes, preprocess=None, draft_size: int = 224) -> dict:
+    """
+    Open the image bytes once in memory and return together:
+    - 'format':   image file format (e.g. 'JPEG')
+    - 'metadata': EXIF metadata as returned by extract_photo_metadata
+    - 'image':    decoded RGB image
+    - 'tensor':   preprocess(image), or None if no preprocess is given
+
+    JPEGs are decoded with draft() at the smallest DCT scale still covering
+    draft_size, which is much cheaper than a full-resolution decode.
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        image_format = image.format
+        metadata = _metadata_from_exif(_exif_from_image(image))
+        if image_format == 'JPEG' and draft_size:
+            image.draft('RGB', (draft_size, draft_size))
+        image = image.convert('RGB')
+    return {
+        'format': image_format,
+        'metadata': metadata,
+        'image': image,
+        'tensor': preprocess(image) if preprocess else None
+    }
+
+
 def get_format_from_bytes(image_bytes: bytes):
     """
     Get file format of the image.
@@ -62,7 +136,13 @@ def extract_photo_metadata(image_path: str) -> dict:
     """
     Extract photo metadata of the image at image_path.
     """
-    exif_data = _extract_exif(image_path)
+    return _metadata_from_exif(_extract_exif(image_path))
+
+
+def _metadata_from_exif(exif_data: dict) -> dict:
+    """
+    Convert EXIF metadata into timestamp, GPS and camera fields.
+    """
     timestamp = exif_data.get('DateTimeOriginal') or exif_data.get('DateTime') \
                 or None
     lat, lon = _extract_gps(exif_data)
@@ -79,7 +159,14 @@ def _extract_exif(image_path: str) -> dict:
     """
     Extract EXIF metadata of the image at image_path.
     """
-    image = Image.open(image_path)
+    with Image.open(image_path) as image:
+        return _exif_from_image(image)
+
+
+def _exif_from_image(image: Image.Image) -> dict:
+    """
+    Extract EXIF metadata of an opened image.
+    """
     exif_info = image._getexif()
     if exif_info is None:
         return {}
@@ -81,11 +81,14 @@ def udp_server(host, port, signals, handle_func):  # recv
             handle_func(message_dict)
 
 
-def tcp_client(host, port, message):  # send
+def tcp_client(host, port, message, timeout=None):  # send
     """Test TCP Socket Client."""
     # create an INET, STREAMing socket, this is TCP
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
 
+        # Without a timeout, connect and send block until the OS gives up
+        sock.settimeout(timeout)
+
         # connect to the server
         sock.connect((host, port))
 
@@ -94,6 +97,50 @@ def tcp_client(host, port, message):  # send
         sock.sendall(message.encode('utf-8'))
 
 
+def tcp_stream_listener(host, timeout=None):
+    """TCP socket listening on a free port for a single tcp_send_stream."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    sock.listen(1)
+    # Bounds both the wait for the connection and each recv
+    sock.settimeout(timeout)
+    return sock
+
+
+def tcp_send_stream(host, port, header, chunks, timeout=None):
+    """Send a JSON header line and then the raw byte chunks over one connection."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect((host, port))
+        sock.sendall(json.dumps(header).encode('utf-8') + b'\n')
+        for chunk in chunks:
+            sock.sendall(chunk)
+
+
+def tcp_receive_stream(listener):
+    """
+    Accept a tcp_send_stream on a tcp_stream_listener, yield its header and
+    then its raw bytes as they arrive.
+    """
+    clientsocket, _ = listener.accept()
+    clientsocket.settimeout(listener.gettimeout())
+    with clientsocket:
+        data = b''
+        while b'\n' not in data:
+            received = clientsocket.recv(4096)
+            if not received:
+                raise ConnectionError('Stream closed before its header')
+            data += received
+        header, data = data.split(b'\n', 1)
+        yield json.loads(header.decode('utf-8'))
+        while True:
+            if data:
+                yield data
+            data = clientsocket.recv(64 * 1024)
+            if not data:
+                break
+
+
 def udp_client(host, port, message):
     """Test UDP Socket Client."""
     # Create an INET, DGRAM socket, this is UDP
@@ -1,11 +1,16 @@
-from typing import Optional
+from __future__ import annotations
+
+from typing import List, Optional, TYPE_CHECKING
 
-import clip
 import numpy as np
-import torch
 from PIL import Image
 from io import BytesIO
 
+# torch and clip are imported where they are used so that importing this
+# module (e.g. by a follower that has not received an upload yet) is cheap.
+if TYPE_CHECKING:
+    import torch
+
 
 class ImageEmbeddingModel:
     """
@@ -17,24 +22,69 @@ class ImageEmbeddingModel:
         model_name: str = "ViT-B/32",
         device: Optional[str] = None,
         normalize: bool = True,
+        backend: str = "eager",
+        num_threads: Optional[int] = None,
     ):
+        """
+        backend selects the inference mode:
+        - 'eager':   fp32 eager mode (reference).
+        - 'int8':    dynamic int8 quantization of linear layers (CPU only).
+        - 'compile': torch.compile of the image and text encoders.
+        - 'script':  TorchScript tracing of the image encoder.
+        num_threads, if given, sets the torch intra-op thread count.
+        """
+        import torch
         self.model_name = model_name
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.normalize = normalize
+        self.backend = backend
+        if num_threads:
+            torch.set_num_threads(num_threads)
         self.model, self.preprocess = self._load_model()
         self.model.eval()
+        self._encode_image, self._encode_text = self._build_backend()
 
         # Probe embedding dimension once so that downstream components
-        # (like FAISS index) can be initialized correctly.
+        # (like FAISS index) can be initialized correctly. This also warms
+        # up compiled/traced backends.
         with torch.no_grad():
             dummy = torch.zeros(1, 3, 224, 224, device=self.device)
-            emb = self.model.encode_image(dummy)
+            emb = self._encode_image(dummy)
         self.embedding_dim = emb.shape[-1]
 
     def _load_model(self):
+        import clip
         model, preprocess = clip.load(self.model_name, device=self.device)
         return model, preprocess
 
+    def _build_backend(self):
+        """
+        Return (encode_image, encode_text) callables for the chosen backend.
+        """
+        import torch
+        match self.backend:
+            case "eager":
+                return self.model.encode_image, self.model.encode_text
+            case "int8":
+                if self.device != "cpu":
+                    raise ValueError("int8 backend is only supported on cpu")
+                self.model = torch.ao.quantization.quantize_dynamic(
+                    self.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                return self.model.encode_image, self.model.encode_text
+            case "compile":
+                return (torch.compile(self.model.encode_image),
+                        torch.compile(self.model.encode_text))
+            case "script":
+                dummy = torch.zeros(1, 3, 224, 224, device=self.device,
+                                    dtype=self.model.dtype)
+                with torch.no_grad():
+                    visual = torch.jit.trace(self.model.visual, dummy)
+                return (lambda image: visual(image.type(self.model.dtype)),
+                        self.model.encode_text)
+            case _:
+                raise ValueError(f"Unsupported backend: {self.backend}")
+
     def encode(self, image_path: str = "", image_bytes: bytes = None) -> np.ndarray:
         """
         Convert an image file into a single embedding vector.
@@ -50,12 +100,37 @@ class ImageEmbeddingModel:
             image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
         else:
             raise ValueError
+        return self.encode_tensor(image_tensor)
+
+    def encode_tensor(self, image_tensor: torch.Tensor) -> np.ndarray:
+        """
+        Convert an already preprocessed image tensor of shape (3, H, W) or
+        (1, 3, H, W) into a single embedding vector.
+
+        Returns:
+            np.ndarray of shape (D,), dtype float32
+        """
+        if image_tensor.ndim == 3:
+            image_tensor = image_tensor.unsqueeze(0)
+        return self.encode_tensors(image_tensor)[0]
+
+    def encode_tensors(self, image_tensors) -> np.ndarray:
+        """
+        Batched encode_tensor: convert a list of preprocessed (3, H, W) image
+        tensors, or a (N, 3, H, W) tensor, in one forward pass.
+
+        Returns:
+            np.ndarray of shape (N, D), dtype float32
+        """
+        import torch
+        if isinstance(image_tensors, (list, tuple)):
+            image_tensors = torch.stack(image_tensors)
+        image_tensors = image_tensors.to(self.device)
         with torch.no_grad():
-            embedding = self.model.encode_image(image_tensor)
+            embeddings = self._encode_image(image_tensors)
         if self.normalize:
-            embedding = embedding / embedding.norm(dim=-1, keepdim=True)
-        embedding = embedding.squeeze(0).cpu().numpy().astype("float32")
-        return embedding
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        return embeddings.cpu().numpy().astype("float32")
 
     def encode_text(self, text: str) -> np.ndarray:
         """
@@ -68,11 +143,81 @@ class ImageEmbeddingModel:
         Returns:
             np.ndarray of shape (D,), dtype float32
         """
-        # CLIP expects a batch of tokenized texts.
-        tokens = clip.tokenize([text]).to(self.device)
+        return self.encode_texts([text])[0]
+
+    def encode_texts(self, texts) -> np.ndarray:
+        """
+        Batched encode_text: encode a list of texts in one forward pass.
+
+        Returns:
+            np.ndarray of shape (N, D), dtype float32
+        """
+        import clip
+        import torch
+        tokens = clip.tokenize(list(texts)).to(self.device)
         with torch.no_grad():
-            embedding = self.model.encode_text(tokens)
+            embeddings = self._encode_text(tokens)
         if self.normalize:
-            embedding = embedding / embedding.norm(dim=-1, keepdim=True)
-        embedding = embedding.squeeze(0).cpu().numpy().astype("float32")
-        return embedding
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        return embeddings.cpu().numpy().astype("float32")
+
+
+class ZeroShotTagger:
+    """
+    CLIP zero-shot classification of image embeddings against a fixed tag
+    vocabulary.
+
+    The text embeddings of "a photo of a <tag>" are computed once; tagging
+    a batch of images is then a single (N, D) x (D, T) matrix multiply
+    followed by a softmax over the vocabulary (with CLIP's logit scale).
+    A photo gets its top_k tags whose probability is at least min_prob.
+    """
+
+    def __init__(self, model: ImageEmbeddingModel, vocabulary, top_k: int = 3,
+                 min_prob: float = 0.1, template: str = "a photo of a {}"):
+        self.vocabulary = list(vocabulary)
+        self.top_k = top_k
+        self.min_prob = min_prob
+        text_embeddings = model.encode_texts([template.format(tag) for tag in self.vocabulary])
+        # Transposed once so that tagging is a plain matmul
+        self.text_embeddings = _unit(text_embeddings).T.copy()
+
+    def tag(self, embedding: np.ndarray) -> List[str]:
+        return self.tag_batch(embedding[None, :])[0]
+
+    def tag_batch(self, embeddings: np.ndarray) -> List[List[str]]:
+        logits = 100.0 * _unit(embeddings) @ self.text_embeddings
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        top = np.argsort(-probs, axis=1)[:, :self.top_k]
+        return [[self.vocabulary[j] for j in row if p[j] >= self.min_prob]
+                for row, p in zip(top, probs)]
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def embedding_recall(
+    ref_images: np.ndarray,
+    ref_queries: np.ndarray,
+    images: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+) -> float:
+    """
+    Mean recall@k of the L2 top-k of (images, queries) against the top-k of
+    the reference embeddings (ref_images, ref_queries) of the same sample.
+
+    Used to check that a reduced-precision backend ranks photos like fp32.
+    """
+    k = min(k, len(ref_images))
+
+    def top_k(x, q):
+        dist = (q ** 2).sum(1)[:, None] - 2 * q @ x.T + (x ** 2).sum(1)[None, :]
+        return np.argsort(dist, axis=1)[:, :k]
+
+    ref_top, top = top_k(ref_images, ref_queries), top_k(images, queries)
+    hits = [len(set(r) & set(c)) for r, c in zip(ref_top, top)]
+    return float(np.mean(hits) / k)
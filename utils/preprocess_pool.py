@@ -0,0 +1,63 @@
+# utils/preprocess_pool.py
+from concurrent.futures import Future, ProcessPoolExecutor
+from utils.config import *
+from utils.image_utils import ingest_image_bytes, save_previews_from_image
+
+# Per-worker state set up once by _init_worker
+_PREPROCESS = None
+_DRAFT_SIZE = None
+
+
+class ImagePreprocessPool:
+    """
+    Process pool that decodes and preprocesses images off the main process.
+
+    Workers return ready-made CLIP input tensors in shared memory, so model
+    inference in the main process never waits on JPEG decoding or resizing.
+    """
+
+    def __init__(self, preprocess, num_workers: int = PREPROCESS_WORKERS,
+                 draft_size: int = 224):
+        # Importing torch.multiprocessing registers the shared-memory tensor
+        # reductions used to pass results back from the workers.
+        import torch.multiprocessing as mp
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=mp.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(preprocess, draft_size)
+        )
+
+    def submit(self, image_bytes: bytes, preview_dir: str = None,
+               photo_id: str = None) -> Future:
+        """
+        Schedule an image for preprocessing. If preview_dir is given, the
+        worker also writes the previews of photo_id from the decoded image.
+
+        The future resolves to the dict of ingest_image_bytes without 'image'.
+        """
+        return self.executor.submit(_ingest_worker, image_bytes, preview_dir, photo_id)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _init_worker(preprocess, draft_size):
+    global _PREPROCESS, _DRAFT_SIZE
+    _PREPROCESS = preprocess
+    _DRAFT_SIZE = draft_size
+
+
+def _ingest_worker(image_bytes, preview_dir, photo_id):
+    image = ingest_image_bytes(image_bytes, _PREPROCESS, _DRAFT_SIZE)
+    if preview_dir:
+        try:
+            save_previews_from_image(image['image'], preview_dir, photo_id,
+                                     PREVIEW_SIZES, PREVIEW_FORMAT, PREVIEW_QUALITY)
+        except Exception as e:
+            LOGGER.warning('Failed to generate previews for %s: %s', photo_id, e)
+    # Drop the decoded image and move the tensor to shared memory so only a
+    # handle is pickled back to the main process.
+    image.pop('image')
+    image['tensor'].share_memory_()
+    return image
@@ -0,0 +1,110 @@
+# utils/profiler.py
+import os
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from typing import Optional
+from utils.config import *
+
+
+class RuntimeProfiler:
+    """
+    Profiler of a running node, switched on for a time window by a 'profile'
+    control message instead of restarting the node under a profiler.
+
+    Modes:
+    - 'sample':   samples the stacks of all threads every PROFILE_SAMPLE_INTERVAL
+                  seconds and writes collapsed stacks (flamegraph.pl / speedscope
+                  input) to <output_dir>/profile-<role>-<time>.collapsed.
+    - 'cprofile': runs cProfile over the message handlers passed through call
+                  and writes pstats to <output_dir>/profile-<role>-<time>.pstats.
+    """
+
+    def __init__(self, role: str):
+        self.role = role
+        self.mode = None
+        self.deadline = 0.0
+        self.output_path: Optional[str] = None
+        self.profile: Optional[cProfile.Profile] = None
+        self.lock = threading.Lock()
+        # Held while a handler runs under cProfile, which is not thread-safe
+        self.call_lock = threading.Lock()
+
+    def start(self, duration: float, mode: str = 'sample', output_dir: str = '.') -> Optional[str]:
+        """
+        Start profiling for duration seconds and return the output path, or
+        None if a profile is already running.
+        """
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f'Unsupported profile mode: {mode}')
+        with self.lock:
+            if self.mode is not None:
+                return None
+            duration = min(duration, PROFILE_MAX_DURATION)
+            extension = 'collapsed' if mode == 'sample' else 'pstats'
+            os.makedirs(output_dir, exist_ok=True)
+            self.output_path = os.path.join(
+                output_dir, f'profile-{self.role}-{time.strftime("%Y%m%d-%H%M%S")}.{extension}')
+            self.mode = mode
+            self.deadline = time.time() + duration
+            if mode == 'cprofile':
+                self.profile = cProfile.Profile()
+            target = self._sample if mode == 'sample' else self._wait
+            threading.Thread(target=target, daemon=True).start()
+        LOGGER.info('Profiling %s (%s) for %.1f s into %s',
+                    self.role, mode, duration, self.output_path)
+        return self.output_path
+
+    def stop(self):
+        """End the running profile early; its output is still written."""
+        with self.lock:
+            self.deadline = 0.0
+
+    def call(self, func, *args):
+        """
+        Call func, under cProfile while a 'cprofile' window is open.
+        """
+        with self.lock:
+            profile = self.profile if self.mode == 'cprofile' else None
+        if profile is None:
+            return func(*args)
+        with self.call_lock:
+            return profile.runcall(func, *args)
+
+    def _wait(self):
+        while time.time() < self.deadline:
+            time.sleep(PROFILE_SAMPLE_INTERVAL * 10)
+        with self.call_lock, self.lock:
+            self.profile.dump_stats(self.output_path)
+            self._finish()
+
+    def _sample(self):
+        stacks = Counter()
+        own_id = threading.get_ident()
+        names = {}
+        while time.time() < self.deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+        with open(self.output_path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with self.lock:
+            self._finish()
+
+    def _finish(self):
+        LOGGER.info('Profile of %s written to %s', self.role, self.output_path)
+        self.mode = None
+        self.profile = None
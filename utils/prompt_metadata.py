@@ -4,32 +4,39 @@ from __future__ import annotations
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any, Tuple
-from utils.config import LOGGER
-from utils.geocode import geocode_bbox
+from utils.config import LOGGER, GEO_SEARCH_RADIUS_KM, AUTO_TAG_VOCABULARY
+from utils.geocode import geocode_location
+from utils.geohash import bbox_around
+from utils.tracing import Trace, span
 import re
-import dateparser
-import spacy
 
 
-# Global lazy-loaded spaCy model to avoid reloading every time
+# Global lazy-loaded spaCy model to avoid reloading every time. spaCy and
+# dateparser themselves are also imported on first use.
 _NLP = None
 
 
-def extract_prompt_meta(prompt: str) -> dict:
-    extractor = PromptMetadataExtractor()
-    meta = extractor.extract(prompt)
+def extract_prompt_meta(prompt: str, trace: Optional[Trace] = None) -> dict:
+    with span(trace, 'prompt_parse'):
+        extractor = PromptMetadataExtractor()
+        meta = extractor.extract(prompt)
     LOGGER.debug("Parsed metadata:", meta.to_dict())
 
     min_lat, max_lat, min_lon, max_lon = -90, 90, -180, 180
+    center_lat, center_lon, radius_km = None, None, None
 
     # If a location was extracted (e.g., ["Yosemite"]), geocode the first place
+    # and search within GEO_SEARCH_RADIUS_KM of it
     if meta.locations:
-        bbox = geocode_bbox(meta.locations[0], radius_km=50.0)
-        if bbox is not None:
-            min_lat, max_lat, min_lon, max_lon = bbox
+        with span(trace, 'geocode'):
+            center_lat, center_lon = geocode_location(meta.locations[0])
+        if center_lat is not None and center_lon is not None:
+            radius_km = GEO_SEARCH_RADIUS_KM
+            min_lat, max_lat, min_lon, max_lon = bbox_around(center_lat, center_lon, radius_km)
             LOGGER.info(
                 f"Geocoded location '{meta.locations[0]}' "
-                f"-> bbox: lat[{min_lat: .4f}, {max_lat: .4f}], "
+                f"-> ({center_lat: .4f}, {center_lon: .4f}) within {radius_km} km, "
+                f"bbox: lat[{min_lat: .4f}, {max_lat: .4f}], "
                 f"lon[{min_lon: .4f}, {max_lon: .4f}]"
             )
         else:
@@ -42,7 +49,11 @@ def extract_prompt_meta(prompt: str) -> dict:
         'max_lat': max_lat,
         'min_lon': min_lon,
         'max_lon': max_lon,
-        'any_tags': meta.tags or None
+        'center_lat': center_lat,
+        'center_lon': center_lon,
+        'radius_km': radius_km,
+        # Only tags that photos can carry (see ZeroShotTagger) can filter them
+        'any_tags': [tag for tag in meta.tags if tag in AUTO_TAG_VOCABULARY] or None
     }
 
 
@@ -50,6 +61,7 @@ def _get_nlp():
     global _NLP
     if _NLP is None:
         # You need to run beforehand: python -m spacy download en_core_web_sm
+        import spacy
         _NLP = spacy.load("en_core_web_sm")
     return _NLP
 
@@ -138,6 +150,7 @@ class PromptMetadataExtractor:
             # Fallback: try parsing the entire prompt
             date_text = prompt.strip()
 
+        import dateparser
         dt = dateparser.parse(date_text)
         if not dt:
             return None, None
@@ -0,0 +1,97 @@
+# utils/tracing.py
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+from utils.config import TRACE_BUCKETS
+
+
+class Trace:
+    """
+    Per-request stage durations in seconds, keyed by stage name.
+
+    A trace is identified by the request_id of the search, which followers
+    echo back together with their own spans so that the leader can merge
+    them into the trace of the request.
+    """
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.spans: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        time_check = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - time_check)
+
+    def add(self, stage: str, seconds: float):
+        """Add to a stage; stages entered several times are summed."""
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def merge(self, spans: Dict[str, float], prefix: str = ''):
+        """
+        Merge spans of a parallel participant (e.g. one of the followers of a
+        search), keeping the slowest participant of each stage.
+        """
+        for stage, seconds in spans.items():
+            stage = prefix + stage
+            self.spans[stage] = max(self.spans.get(stage, 0.0), seconds)
+
+
+def span(trace: Optional[Trace], stage: str):
+    """trace.span(stage), or a no-op context if there is no trace."""
+    return trace.span(stage) if trace is not None else nullcontext()
+
+
+class StageMetrics:
+    """
+    Latency histograms of request stages, exported in the Prometheus text
+    format as metafusion_stage_seconds{role, stage}.
+    """
+
+    def __init__(self, role: str, buckets=TRACE_BUCKETS):
+        self.role = role
+        self.buckets = sorted(buckets)
+        # stage -> [count per bucket..., count above the last bucket], sum
+        self.counts: Dict[str, list] = {}
+        self.sums: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            counts = self.counts.setdefault(stage, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+
+    def record(self, trace: Trace):
+        for stage, seconds in trace.spans.items():
+            self.observe(stage, seconds)
+
+    def to_prometheus(self) -> str:
+        lines = [
+            '# HELP metafusion_stage_seconds Latency of request stages.',
+            '# TYPE metafusion_stage_seconds histogram',
+        ]
+        with self.lock:
+            for stage in sorted(self.counts):
+                labels = f'role="{self.role}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ['+Inf'], self.counts[stage]):
+                    cumulative += count
+                    lines.append(f'metafusion_stage_seconds_bucket{{{labels},le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'metafusion_stage_seconds_sum{{{labels}}} {self.sums[stage]}')
+                lines.append(f'metafusion_stage_seconds_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str):
+        """Write the metrics to path, replacing it atomically."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)